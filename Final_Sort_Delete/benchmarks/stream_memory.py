@@ -0,0 +1,148 @@
+"""Memory benchmark for the streaming pipeline over a synthetic mailbox
+
+Runs StreamingPipeline against a fake Gmail backend (no network) and a fake
+classifier, sampling RSS and, optionally, tracemalloc as messages complete.
+Memory should stay flat regardless of mailbox size.
+
+    python benchmarks/stream_memory.py --messages 1000000 --max-in-flight 500
+    python benchmarks/stream_memory.py --messages 100000 --tracemalloc
+"""
+import os
+import sys
+import time
+import base64
+import random
+import asyncio
+import argparse
+import resource
+import tracemalloc
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+
+from src.gmail_fetcher import GmailFetcher
+from src.pipeline import StreamingPipeline
+from src.records import EmailRecord
+
+BODY = ("Hello,\nthis is a synthetic message.\nOrder #1234 shipped; total $56.78.\n" * 10).encode()
+ENCODED_BODY = base64.urlsafe_b64encode(BODY).decode()
+
+def current_rss_mb():
+    """Current resident set size in MB (Linux), falling back to peak RSS"""
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+class SyntheticFetcher(GmailFetcher):
+    """GmailFetcher that serves a generated mailbox instead of calling the API"""
+
+    def __init__(self, total_messages):
+        super().__init__()
+        self.total_messages = total_messages
+
+    async def list_message_ids(self, page_token=None, page_size=500):
+        start = int(page_token or 0)
+        end = min(start + page_size, self.total_messages)
+        next_token = str(end) if end < self.total_messages else None
+        return [f"m{i:08d}" for i in range(start, end)], next_token
+
+    def _synthetic_payload(self, message_id):
+        return {
+            'id': message_id,
+            'payload': {
+                'mimeType': 'multipart/mixed',
+                'headers': [
+                    {'name': 'Subject', 'value': f"Synthetic message {message_id}"},
+                    {'name': 'From', 'value': f"sender{random.randint(0, 5000)}@example.com"}
+                ],
+                'parts': [{
+                    'mimeType': 'multipart/alternative',
+                    'parts': [{'mimeType': 'text/plain', 'body': {'data': ENCODED_BODY}}]
+                }]
+            }
+        }
+
+    async def fetch_message_records(self, message_ids, chunk_size=20):
+        records = []
+        for message_id in message_ids:
+            records.append(EmailRecord.from_dict(self._parse_message(self._synthetic_payload(message_id))))
+        await asyncio.sleep(0)
+        return records
+
+class SyntheticProcessor:
+    """Stands in for OpenAIProcessor: decides instantly and keeps only counters"""
+
+    def __init__(self, pipeline_ref, samples, sample_every, use_tracemalloc):
+        self.pipeline_ref = pipeline_ref
+        self.samples = samples
+        self.sample_every = sample_every
+        self.use_tracemalloc = use_tracemalloc
+        self.processed = 0
+        self.deleted = 0
+
+    async def process_messages(self, messages, pause=0):
+        for message in messages:
+            if hash(message['sender']) % 3 == 0:
+                self.deleted += 1
+        before = self.processed
+        self.processed += len(messages)
+        if self.processed // self.sample_every != before // self.sample_every:
+            traced = tracemalloc.get_traced_memory()[0] / (1024 * 1024) if self.use_tracemalloc else 0.0
+            self.samples.append((self.processed, current_rss_mb(), traced,
+                                 self.pipeline_ref[0].in_flight))
+        await asyncio.sleep(0)
+
+async def run_benchmark(args):
+    samples = []
+    sample_every = max(1, args.messages // args.samples)
+    pipeline_ref = []
+    fetcher = SyntheticFetcher(args.messages)
+    processor = SyntheticProcessor(pipeline_ref, samples, sample_every, args.tracemalloc)
+    pipeline = StreamingPipeline(fetcher, processor, max_in_flight=args.max_in_flight)
+    pipeline_ref.append(pipeline)
+
+    start = time.time()
+    completed = await pipeline.run()
+    elapsed = time.time() - start
+    return completed, elapsed, samples, pipeline.peak_in_flight
+
+def main():
+    parser = argparse.ArgumentParser(description="Streaming pipeline memory benchmark")
+    parser.add_argument('--messages', type=int, default=1_000_000)
+    parser.add_argument('--max-in-flight', type=int, default=500)
+    parser.add_argument('--samples', type=int, default=20)
+    parser.add_argument('--tracemalloc', action='store_true',
+                        help="Also sample Python heap usage (much slower)")
+    args = parser.parse_args()
+
+    if args.tracemalloc:
+        tracemalloc.start()
+
+    baseline_rss = current_rss_mb()
+    completed, elapsed, samples, peak_in_flight = asyncio.run(run_benchmark(args))
+
+    print(f"\nMessages: {completed} in {elapsed:.1f}s ({completed / elapsed:.0f}/s), "
+          f"max in flight {args.max_in_flight}, peak observed {peak_in_flight}")
+    print(f"Baseline RSS: {baseline_rss:.1f} MB")
+    print(f"{'processed':>12} {'rss_mb':>10} {'traced_mb':>10} {'in_flight':>10}")
+    for processed, rss, traced, in_flight in samples:
+        print(f"{processed:>12} {rss:>10.1f} {traced:>10.2f} {in_flight:>10}")
+
+    if len(samples) >= 4:
+        # Compare the second quarter against the last sample; warm-up is excluded
+        early = samples[len(samples) // 4]
+        late = samples[-1]
+        growth = late[1] - early[1]
+        print(f"\nRSS growth from {early[0]} to {late[0]} messages: {growth:+.1f} MB")
+        if args.tracemalloc:
+            print(f"Traced heap growth: {late[2] - early[2]:+.2f} MB")
+
+    if args.tracemalloc:
+        print(f"Traced heap peak: {tracemalloc.get_traced_memory()[1] / (1024 * 1024):.2f} MB")
+
+if __name__ == "__main__":
+    main()
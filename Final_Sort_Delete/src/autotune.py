@@ -0,0 +1,283 @@
+import os
+import json
+import time
+from datetime import datetime
+from .utils.logger import setup_logger
+
+logger = setup_logger()
+
+# name: (default, minimum, maximum)
+PARAMETERS = {
+    'page_size': (500, 100, 500),       # messages.list maxResults (API maximum is 500)
+    'fetch_chunk': (50, 5, 100),        # messages.get calls per batch HTTP request (API maximum is 100)
+    'sub_batch': (50, 10, 100),         # emails per LLM request
+    'trash_batch': (50, 10, 1000),      # IDs per batchModify trash call (API maximum is 1000)
+    'flush_threshold': (25, 5, 500),    # DELETE decisions queued before trashing
+}
+
+# Stage whose requests each parameter sizes; a limit hit by one stage never shrinks the other's
+STAGES = {
+    'page_size': 'gmail',
+    'fetch_chunk': 'gmail',
+    'sub_batch': 'openai',
+    'trash_batch': 'gmail',
+    'flush_threshold': 'gmail',
+}
+
+# Parameter shrunk when a stage hits its limit while none of its own parameters is on trial
+BACKOFF = {'gmail': 'fetch_chunk', 'openai': 'sub_batch'}
+
+# Order in which the hill climb tries parameters
+TUNING_ORDER = ['fetch_chunk', 'sub_batch', 'trash_batch', 'flush_threshold', 'page_size']
+
+def is_rate_limit(error):
+    """True for Gmail 429/rateLimitExceeded and OpenAI RateLimitError responses"""
+    text = str(error)
+    return ('RateLimit' in type(error).__name__ or '429' in text
+            or 'rateLimitExceeded' in text or 'userRateLimitExceeded' in text)
+
+class Autotuner:
+    """Hill-climbs batch sizes toward the highest end-to-end emails/sec
+
+    Throughput is measured over fixed windows. Each window tries one parameter
+    one step up or down; a step is kept when throughput improves, or when
+    throughput holds and the time its stage spends per email drops. Gmail's
+    stage time includes the wait in the quota scheduler, so a larger batch that
+    only runs the quota into debt is not mistaken for a gain. Otherwise the
+    step is undone and the other direction (then the next parameter) is tried.
+
+    Errors and rate limits are counted per stage. A window where a stage is
+    rate limited or has too many errors undoes the trial and shrinks one of
+    that stage's parameters, so an OpenAI 429 never shrinks a Gmail size. With
+    enabled=False it only hands out the stored values.
+    """
+
+    def __init__(self, account=None, path='cache/autotune.json', enabled=True,
+                 window_seconds=30, step=1.25, min_gain=0.03, max_error_rate=0.02, quota=None):
+        self.account = account or 'default'
+        self.path = path
+        self.enabled = enabled
+        self.window_seconds = window_seconds
+        self.step = step
+        self.min_gain = min_gain
+        self.max_error_rate = max_error_rate
+        self.quota = quota
+
+        self.values = {name: default for name, (default, _, _) in PARAMETERS.items()}
+        self.best_rate = None
+        self.best_costs = {}
+        self._directions = {name: 1 for name in PARAMETERS}
+        self._index = 0
+        self._flipped = False
+        self._trial = None  # (name, previous value)
+
+        self._window_start = time.time()
+        self._window_completed = None
+        self._quota_waited = 0.0
+        self._reset_counts()
+        self.windows = 0
+
+        if path:
+            self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                saved = json.load(f).get(self.account, {})
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not read tuned sizes from {self.path}: {str(e)}")
+            return
+        for name, value in saved.get('values', {}).items():
+            if name in PARAMETERS:
+                self.values[name] = self._clamp(name, value)
+        if saved:
+            logger.info(f"Starting from tuned sizes for {self.account}: {self.values}")
+
+    def save(self):
+        """Store the best values found so the next run for this account starts there"""
+        if not self.path or not self.enabled:
+            return
+        values = dict(self.values)
+        if self._trial:
+            name, previous = self._trial
+            values[name] = previous
+
+        data = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                data = {}
+        data[self.account] = {
+            'values': values,
+            'emails_per_second': self.best_rate,
+            'updated_at': datetime.now().isoformat(timespec='seconds')
+        }
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2)
+
+    def value(self, name):
+        return self.values[name]
+
+    def _clamp(self, name, value):
+        _, low, high = PARAMETERS[name]
+        return max(low, min(high, int(value)))
+
+    def _reset_counts(self):
+        self._requests = dict.fromkeys(BACKOFF, 0)
+        self._errors = dict.fromkeys(BACKOFF, 0)
+        self._rate_limited = dict.fromkeys(BACKOFF, 0)
+        self._latency = dict.fromkeys(BACKOFF, 0.0)
+
+    def record_requests(self, count=1, stage='gmail'):
+        self._requests[stage] += count
+
+    def record_error(self, error=None, count=1, stage='gmail'):
+        self._errors[stage] += count
+        if error is not None and is_rate_limit(error):
+            self._rate_limited[stage] += count
+
+    def record_latency(self, seconds, stage='gmail'):
+        """Add the time one request of a stage took, from send to response"""
+        self._latency[stage] += seconds
+
+    def _take_quota_wait(self):
+        """Seconds requests waited on the quota scheduler since the last window"""
+        if self.quota is None:
+            return 0.0
+        waited = self.quota.waited - self._quota_waited
+        self._quota_waited = self.quota.waited
+        return waited
+
+    def tick(self, completed):
+        """Feed the running count of finished emails; closes a window when it is due"""
+        if self._window_completed is None:
+            self._window_completed = completed
+            self._window_start = time.time()
+            self._take_quota_wait()
+            return
+
+        elapsed = time.time() - self._window_start
+        if not self.enabled or elapsed < self.window_seconds:
+            return
+
+        emails = completed - self._window_completed
+        rate = emails / elapsed
+        self._latency['gmail'] += self._take_quota_wait()
+        # Seconds each stage spent per finished email
+        costs = {stage: seconds / emails for stage, seconds in self._latency.items() if emails and seconds}
+        limits = {}
+        for stage in BACKOFF:
+            error_rate = self._errors[stage] / self._requests[stage] if self._requests[stage] else 0.0
+            if self._rate_limited[stage] or error_rate > self.max_error_rate:
+                limits[stage] = f"{self._rate_limited[stage]} rate limited, {error_rate:.1%} errors"
+        self._window_completed = completed
+        self._window_start = time.time()
+        self._reset_counts()
+        self.windows += 1
+
+        self._evaluate(rate, costs, limits)
+
+    def _back_off(self, limits):
+        """Undo the trial and shrink one parameter of each stage that hit a limit"""
+        trial = self._trial
+        if trial:
+            self.values[trial[0]] = trial[1]
+            self._trial = None
+        for stage, reason in sorted(limits.items()):
+            name = trial[0] if trial and STAGES[trial[0]] == stage else BACKOFF[stage]
+            shrunk = self._clamp(name, self.values[name] / self.step)
+            logger.info(f"Autotune: {stage} {reason}; {name} {self.values[name]} -> {shrunk}")
+            self.values[name] = shrunk
+            self._directions[name] = -1
+        self.best_rate = None  # measure a new baseline at the smaller size
+        self.best_costs = {}
+        self._next_parameter()
+
+    def _improved(self, name, rate, costs):
+        if rate > self.best_rate * (1 + self.min_gain):
+            return True
+        # A stage that is not the bottleneck barely moves throughput; judge it by its own time per email
+        stage = STAGES[name]
+        return (rate >= self.best_rate * (1 - self.min_gain)
+                and stage in costs and stage in self.best_costs
+                and costs[stage] < self.best_costs[stage] * (1 - self.min_gain))
+
+    def _evaluate(self, rate, costs, limits):
+        if limits:
+            self._back_off(limits)
+            return
+
+        if self._trial is None:
+            if self.best_rate is None or rate >= self.best_rate:
+                self.best_rate = rate
+                self.best_costs = costs
+            self._start_trial()
+            return
+
+        name, previous = self._trial
+        self._trial = None
+        if self._improved(name, rate, costs):
+            stage = STAGES[name]
+            logger.info(f"Autotune: {name} {previous} -> {self.values[name]} kept "
+                        f"({self.best_rate:.1f} -> {rate:.1f} emails/s, {stage} "
+                        f"{self.best_costs.get(stage, 0):.3f} -> {costs.get(stage, 0):.3f} s/email)")
+            self.best_rate = rate
+            self.best_costs = costs
+            self._flipped = True  # this direction works; don't try the other one
+            self._start_trial()
+            return
+
+        logger.debug(f"Autotune: {name} {self.values[name]} reverted to {previous} ({rate:.1f} emails/s)")
+        self.values[name] = previous
+        if self._flipped:
+            # Done with this parameter; the next window re-measures the baseline,
+            # since mailbox content and API latency drift during a run
+            self._next_parameter()
+            self.best_rate = None
+            self.best_costs = {}
+            return
+        self._directions[name] *= -1
+        self._flipped = True
+        self._start_trial()
+
+    def _next_parameter(self):
+        self._index = (self._index + 1) % len(TUNING_ORDER)
+        self._flipped = False
+
+    def _start_trial(self):
+        # Skip parameters already at the bound they are heading for
+        for _ in range(2 * len(TUNING_ORDER)):
+            name = TUNING_ORDER[self._index]
+            current = self.values[name]
+            factor = self.step if self._directions[name] > 0 else 1 / self.step
+            proposed = self._clamp(name, round(current * factor))
+            if proposed == current:
+                proposed = self._clamp(name, current + self._directions[name])
+            if proposed != current:
+                self._trial = (name, current)
+                self.values[name] = proposed
+                return
+            if self._flipped:
+                self._next_parameter()
+            else:
+                self._directions[name] *= -1
+                self._flipped = True
+
+    def stats(self):
+        return {
+            'values': dict(self.values),
+            'emails_per_second': self.best_rate,
+            'seconds_per_email': dict(self.best_costs),
+            'quota_wait': self.quota.waited if self.quota else 0.0,
+            'windows': self.windows
+        }
+
+__all__ = ['Autotuner', 'PARAMETERS', 'STAGES', 'is_rate_limit']
@@ -0,0 +1,229 @@
+import os
+import math
+import time
+import sqlite3
+import asyncio
+import threading
+from datetime import date
+from .utils.logger import setup_logger, HOT
+
+logger = setup_logger()
+
+# USD per million tokens: (input, cached input, output)
+MODEL_PRICES = {
+    'gpt-4o-mini': (0.15, 0.075, 0.60),
+    'gpt-4o': (2.50, 1.25, 10.00),
+    'gpt-4.1-mini': (0.40, 0.10, 1.60),
+    'gpt-4.1-nano': (0.10, 0.025, 0.40),
+    'gpt-4.1': (2.00, 0.50, 8.00),
+}
+
+def model_prices(model):
+    """(input, cached input, output) USD per million tokens; ValueError for an unknown model"""
+    prices = MODEL_PRICES.get(model)
+    if not prices:
+        # Longest known prefix, so dated snapshots like gpt-4o-mini-2024-07-18 are priced too
+        matches = [name for name in MODEL_PRICES if model.startswith(name)]
+        if not matches:
+            raise ValueError(f"No price known for model {model}; add it to MODEL_PRICES")
+        prices = MODEL_PRICES[max(matches, key=len)]
+    return prices
+
+def request_cost(model, prompt_tokens, cached_tokens, completion_tokens):
+    """Cost in USD of one request from its usage numbers"""
+    input_price, cached_price, output_price = model_prices(model)
+    uncached = max(prompt_tokens - cached_tokens, 0)
+    return (uncached * input_price + cached_tokens * cached_price + completion_tokens * output_price) / 1_000_000
+
+# Rough size of a token, for requests that end without reporting usage
+CHARS_PER_TOKEN = 4
+
+class SpendLedger:
+    """OpenAI spend per day, shared by every run and worker on this machine
+
+    Each request's cost is added with one atomic upsert, so concurrent
+    processes add to each other's totals and an interrupted write cannot
+    reset the day.
+    """
+
+    def __init__(self, db_path='cache/spend.db'):
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Used from worker threads, one statement at a time
+        self.conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self._lock = threading.Lock()
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS daily_spend (
+                day TEXT PRIMARY KEY,
+                spent REAL NOT NULL
+            )
+        """)
+        self.conn.commit()
+
+    def add(self, day, amount):
+        """Add amount to a day's spend and return the day's new total"""
+        with self._lock, self.conn:
+            self.conn.execute("""
+                INSERT INTO daily_spend (day, spent) VALUES (?, ?)
+                ON CONFLICT (day) DO UPDATE SET spent = spent + excluded.spent
+            """, (day, amount))
+            return self.conn.execute("SELECT spent FROM daily_spend WHERE day = ?", (day,)).fetchone()[0]
+
+    def total(self, day):
+        with self._lock:
+            row = self.conn.execute("SELECT spent FROM daily_spend WHERE day = ?", (day,)).fetchone()
+        return row[0] if row else 0.0
+
+    def close(self):
+        self.conn.close()
+
+class BudgetGovernor:
+    """Caps OpenAI spend per run and per day, and paces it over a window
+
+    Spend is computed from response.usage after every request. Before a
+    request, acquire() waits while the run is ahead of an even spend rate
+    (max_run_usd spread over pace_seconds), and returns False once a limit is
+    reached so the caller can stop at a clean point. Daily spend is kept in a
+    SpendLedger shared by every run on this machine; costs recorded since the
+    last request are written to it from acquire(), off the event loop.
+    """
+
+    def __init__(self, max_run_usd=None, max_day_usd=None, pace_seconds=None,
+                 ledger_path='cache/spend.db'):
+        self.max_run_usd = max_run_usd
+        self.max_day_usd = max_day_usd
+        self.pace_seconds = pace_seconds
+        self.ledger_path = ledger_path
+
+        self.run_spent = 0.0
+        self.estimated = 0.0  # part of run_spent charged from estimates
+        self.requests = 0
+        self.emails = 0
+        self.start_time = time.time()
+        self.exhausted_reason = None
+        self.total_emails = None  # set by the caller when the mailbox size is known
+
+        self.today = date.today().isoformat()
+        self._unsaved = 0.0
+        self._save_lock = None
+        self.ledger = SpendLedger(ledger_path) if ledger_path else None
+        self._day_total = self.ledger.total(self.today) if self.ledger else 0.0
+
+    async def save(self):
+        """Write spend recorded since the last save to the ledger; call once more at the end of a run"""
+        if self._save_lock is None:
+            # Created lazily so it binds to the running event loop
+            self._save_lock = asyncio.Lock()
+        async with self._save_lock:
+            day = date.today().isoformat()
+            if day != self.today:
+                # Past midnight: unsaved spend goes to the new day, whose limit starts afresh
+                logger.info(f"New spend day {day}")
+                self.today = day
+                self._day_total = await asyncio.to_thread(self.ledger.total, day) if self.ledger else 0.0
+                if not self.ledger:
+                    # Without a ledger unsaved spend is the whole day's; yesterday's no longer counts
+                    self._unsaved = 0.0
+            amount = self._unsaved
+            if not self.ledger or not amount:
+                return
+            try:
+                total = await asyncio.to_thread(self.ledger.add, day, amount)
+            except sqlite3.Error as e:
+                logger.warning(f"Could not update spend ledger {self.ledger_path}: {str(e)}")
+                return
+            # Costs recorded while the write ran stay unsaved for the next call
+            self._unsaved -= amount
+            self._day_total = total
+
+    @property
+    def day_spent(self):
+        return self._day_total + self._unsaved
+
+    def record(self, model, prompt_tokens, cached_tokens, completion_tokens):
+        """Add one request's usage; returns its cost"""
+        cost = request_cost(model, prompt_tokens, cached_tokens, completion_tokens)
+        self.run_spent += cost
+        self._unsaved += cost
+        self.requests += 1
+        self._check_limits()
+        return cost
+
+    def record_estimate(self, model, prompt_chars, completion_chars):
+        """Charge a request that ended without usage (cancelled or failed) from its text length
+
+        Prompt tokens are charged at the uncached rate, so the estimate errs high.
+        """
+        cost = self.record(model, math.ceil(prompt_chars / CHARS_PER_TOKEN), 0,
+                           math.ceil(completion_chars / CHARS_PER_TOKEN))
+        self.estimated += cost
+        return cost
+
+    def count_emails(self, count):
+        """Count emails that got their final decision, for cost per email"""
+        self.emails += count
+
+    def _check_limits(self):
+        if self.exhausted_reason:
+            return
+        if self.max_run_usd is not None and self.run_spent >= self.max_run_usd:
+            self.exhausted_reason = f"run budget of ${self.max_run_usd:.2f} reached"
+        elif self.max_day_usd is not None and self.day_spent >= self.max_day_usd:
+            self.exhausted_reason = f"daily budget of ${self.max_day_usd:.2f} reached"
+        if self.exhausted_reason:
+            logger.warning(f"Budget exhausted: {self.exhausted_reason}, stopping at the next checkpoint")
+
+    @property
+    def exhausted(self):
+        return self.exhausted_reason is not None
+
+    def average_request_cost(self):
+        return self.run_spent / self.requests if self.requests else 0.0
+
+    async def acquire(self):
+        """Wait until a request fits the spend pace; False once the budget is used up"""
+        # Picks up other runs' spend for today along with writing ours
+        await self.save()
+        self._check_limits()
+        if self.exhausted:
+            return False
+        # Leave room for the request about to be made, so a limit is not overshot
+        next_cost = self.average_request_cost()
+        if self.max_run_usd is not None and self.run_spent + next_cost > self.max_run_usd:
+            self.exhausted_reason = f"run budget of ${self.max_run_usd:.2f} would be exceeded by the next request"
+        elif self.max_day_usd is not None and self.day_spent + next_cost > self.max_day_usd:
+            self.exhausted_reason = f"daily budget of ${self.max_day_usd:.2f} would be exceeded by the next request"
+        if self.exhausted:
+            logger.warning(f"Budget exhausted: {self.exhausted_reason}, stopping at the next checkpoint")
+            return False
+
+        if self.pace_seconds and self.max_run_usd:
+            rate = self.max_run_usd / self.pace_seconds
+            # One average request of headroom lets spend run slightly ahead, never in bursts
+            allowed = rate * (time.time() - self.start_time) + self.average_request_cost()
+            if self.run_spent > allowed:
+                wait = (self.run_spent - allowed) / rate
+                logger.debug(f"Pacing spend: waiting {wait:.1f}s", extra=HOT)
+                await asyncio.sleep(wait)
+        return True
+
+    def projected_total(self):
+        """Projected cost to finish the mailbox at the current cost per email, or None"""
+        if not self.emails or self.total_emails is None:
+            return None
+        return self.run_spent + self.run_spent / self.emails * max(self.total_emails - self.emails, 0)
+
+    def stats(self):
+        return {
+            'run_spent': self.run_spent,
+            'estimated': self.estimated,
+            'day_spent': self.day_spent,
+            'requests': self.requests,
+            'cost_per_email': self.run_spent / self.emails if self.emails else 0.0,
+            'projected_total': self.projected_total(),
+            'exhausted_reason': self.exhausted_reason,
+        }
+
+__all__ = ['BudgetGovernor', 'SpendLedger', 'MODEL_PRICES', 'model_prices', 'request_cost']
@@ -0,0 +1,111 @@
+import os
+import random
+from collections import Counter
+from email.utils import parseaddr
+from .budget import model_prices
+from .utils.logger import setup_logger
+
+logger = setup_logger()
+
+def load_known_senders(path):
+    """Read addresses (or @domains) of known contacts, one per line; '#' starts a comment"""
+    if not path or not os.path.exists(path):
+        return set()
+    with open(path, 'r', encoding='utf-8') as f:
+        entries = {line.split('#', 1)[0].strip().lower() for line in f}
+    entries.discard('')
+    logger.info(f"Loaded {len(entries)} known senders from {path}")
+    return entries
+
+class ModelCascade:
+    """Routes emails through a fast first-tier model and a stronger second tier
+
+    The first tier decides every email and reports a confidence. Its decision
+    stands unless the confidence is below min_confidence or the email is high
+    stakes (attachments, or a sender on the known-contacts list); those are
+    escalated to the second tier, whose decision is final. A small share of
+    confident decisions is escalated anyway (audit_rate) so agreement between
+    the tiers is measured on ordinary emails too.
+    """
+
+    def __init__(self, tier1_model='gpt-4o-mini', tier2_model='gpt-4o', min_confidence=0.8,
+                 known_senders=None, audit_rate=0.02):
+        if tier1_model == tier2_model:
+            raise ValueError(f"Cascade tiers must use different models, both are {tier1_model}")
+        # Fail at startup rather than on the first escalated request's cost
+        for model in (tier1_model, tier2_model):
+            model_prices(model)
+
+        self.tier1_model = tier1_model
+        self.tier2_model = tier2_model
+        self.min_confidence = min_confidence
+        self.known_senders = known_senders or set()
+        self.audit_rate = audit_rate
+
+        self.requests = Counter()
+        self.latency = Counter()
+        self.decisions = Counter()
+        self.escalations = Counter()
+        self.compared = Counter()
+        self.agreed = Counter()
+
+    def tier_of(self, model):
+        return 2 if model == self.tier2_model else 1
+
+    def is_known_sender(self, sender):
+        address = parseaddr(sender or '')[1].lower()
+        if not address:
+            return False
+        return address in self.known_senders or f"@{address.rpartition('@')[2]}" in self.known_senders
+
+    def escalation_reason(self, result, email):
+        """Why a first-tier decision goes to the second tier, or None if it stands"""
+        if email.get('has_attachments'):
+            return 'attachments'
+        if self.is_known_sender(email.get('sender')):
+            return 'known sender'
+        try:
+            confidence = float(result.get('confidence'))
+        except (TypeError, ValueError):
+            return 'no confidence'
+        if confidence < self.min_confidence:
+            return 'low confidence'
+        if random.random() < self.audit_rate:
+            return 'audit'
+        return None
+
+    def record_escalation(self, reason):
+        self.escalations[reason] += 1
+
+    def record_request(self, model, latency):
+        tier = self.tier_of(model)
+        self.requests[tier] += 1
+        self.latency[tier] += latency
+
+    def record_decision(self, model, first_tier_result=None, result=None, reason=None):
+        """Count a final decision; pass the first-tier result and reason for escalated ones"""
+        self.decisions[self.tier_of(model)] += 1
+        if first_tier_result is not None and result is not None:
+            self.compared[reason] += 1
+            if first_tier_result.get('decision') == result.get('decision'):
+                self.agreed[reason] += 1
+
+    def stats(self):
+        tiers = {}
+        for tier, model in ((1, self.tier1_model), (2, self.tier2_model)):
+            tiers[tier] = {
+                'model': model,
+                'requests': self.requests[tier],
+                'decisions': self.decisions[tier],
+                'avg_latency': self.latency[tier] / self.requests[tier] if self.requests[tier] else 0.0
+            }
+        compared = sum(self.compared.values())
+        return {
+            'tiers': tiers,
+            'escalations': dict(self.escalations),
+            'escalation_rate': sum(self.escalations.values()) / max(sum(self.decisions.values()), 1),
+            'agreement': sum(self.agreed.values()) / compared if compared else 0.0,
+            'agreement_by_reason': {reason: self.agreed[reason] / total for reason, total in self.compared.items()}
+        }
+
+__all__ = ['ModelCascade', 'load_known_senders']
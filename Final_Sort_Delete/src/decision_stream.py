@@ -0,0 +1,96 @@
+import json
+from .utils.logger import setup_logger
+
+logger = setup_logger()
+
+class DecisionStreamParser:
+    """Pull complete decision objects out of a JSON response as it streams in
+
+    Accepts {"decisions": [{...}, {...}]}, a bare [{...}, {...}] array or one
+    object per line. Each decision is returned by feed() as soon as its closing
+    brace arrives, so a truncated or malformed tail only loses the decisions
+    that were never closed. Only elements of the decisions array itself (or
+    root objects) count; objects nested inside them, or in another array of
+    the wrapper, are never decisions even when they have a "decision" key.
+    """
+
+    def __init__(self):
+        self._stack = []
+        self._in_string = False
+        self._escaped = False
+        self._buffer = None       # text of the decision being read, None when outside one
+        self._buffer_depth = 0
+        self._root_buffer = None  # a root object: a decision of its own, or the wrapper
+        self._key = None          # text of the last string read directly inside a root object
+        self._key_buffer = None
+        self._array_depth = None  # stack depth inside the decisions array
+        self.decisions_seen = 0
+        self.malformed = 0
+
+    def feed(self, text):
+        """Consume a chunk of text and return the decisions it completed"""
+        completed = []
+        for char in text:
+            if self._buffer is not None:
+                self._buffer.append(char)
+            if self._root_buffer is not None:
+                self._root_buffer.append(char)
+
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._key_buffer is not None:
+                        self._key = ''.join(self._key_buffer)
+                        self._key_buffer = None
+                    continue
+                if self._key_buffer is not None:
+                    self._key_buffer.append(char)
+                continue
+
+            if char == '"':
+                self._in_string = True
+                if self._stack == ['{']:
+                    # Keys of the root object, to find the "decisions" array
+                    self._key_buffer = []
+            elif char in '{[':
+                if char == '[' and self._array_depth is None and (
+                        not self._stack or (self._stack == ['{'] and self._key == 'decisions')):
+                    self._array_depth = len(self._stack) + 1
+                elif char == '{' and self._buffer is None:
+                    if not self._stack:
+                        self._root_buffer = ['{']
+                    elif len(self._stack) == self._array_depth:
+                        # An element of the decisions array; the root is only a wrapper
+                        self._root_buffer = None
+                        self._buffer = ['{']
+                        self._buffer_depth = len(self._stack)
+                self._stack.append(char)
+            elif char in '}]':
+                if self._stack:
+                    if len(self._stack) == self._array_depth:
+                        self._array_depth = None
+                    self._stack.pop()
+                if self._buffer is not None and len(self._stack) == self._buffer_depth:
+                    self._emit(''.join(self._buffer), completed)
+                    self._buffer = None
+                elif self._root_buffer is not None and not self._stack:
+                    self._emit(''.join(self._root_buffer), completed)
+                    self._root_buffer = None
+        return completed
+
+    def _emit(self, text, completed):
+        try:
+            decision = json.loads(text)
+        except json.JSONDecodeError as e:
+            self.malformed += 1
+            logger.warning(f"Skipping malformed decision in streamed response: {e}")
+            return
+        if isinstance(decision, dict) and 'decision' in decision:
+            self.decisions_seen += 1
+            completed.append(decision)
+
+__all__ = ['DecisionStreamParser']
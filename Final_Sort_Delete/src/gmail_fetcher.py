@@ -1,23 +1,19 @@
 import os
 import pickle
-import json
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
-from .utils.logger import setup_logger
+from .utils.logger import setup_logger, HOT
+from .records import EmailRecord
+from .autotune import Autotuner
+from .quota import QuotaScheduler, QUOTA_UNITS
 import base64
 import asyncio
-from bs4 import BeautifulSoup
 import html
 import re
 import time
 import ssl
 import http.client
-from google.auth.transport import requests
-from google.oauth2.credentials import Credentials
-from google.auth import transport
-from google.auth.transport.requests import AuthorizedSession
+
+# google-auth, googleapiclient and bs4 are imported where they are first used:
+# together they account for most of the start-up time of a short run.
 
 class Colors:
     GREEN = '\033[92m'
@@ -36,23 +32,53 @@ class GmailFetcher:
                        'https://www.googleapis.com/auth/gmail.trash']
         self.creds = None
         self.service = None
-        self.batch_size = 100  # Changed from 500 to 100
+        # Page, chunk and trash batch sizes; replaced by a tuning Autotuner when --autotune is on
+        self.tuner = Autotuner(path=None, enabled=False)
         self._session_pool = []
         self.max_pool_size = 3
         self.session_ttl = 300  # 5 minutes
+        self._label_index = None  # label name -> label ID, loaded once from labels.list
+
+        # Write-ahead trash journal; set by the caller to record every trash call
+        self.journal = None
+        self.run_id = None
+
+        # Concurrent batch-gets share the per-user quota; each request gets its own connection
+        self.quota = QuotaScheduler()
+        self._http_pool = []
+
+        # Look-ahead listing: page token -> task returning (message IDs, next page token)
+        self.id_lookahead = 5
+        self._id_pages = {}
+        self._id_prefetch = None
+
+        # Optional MessageStore; parsed messages are saved to it as they are fetched
+        self.message_store = None
         
-    def authenticate(self, force_refresh=False):
-        """Authenticate with Gmail API"""
+    def authenticate(self, force_refresh=False, rebuild=False):
+        """Authenticate with Gmail API
+
+        The service is built once and reused. rebuild=True keeps the current
+        credentials but builds a fresh service (and HTTP connection), which is
+        what recovering from an SSL error needs; force_refresh=True ignores the
+        saved token and runs the OAuth flow again.
+        """
+        if self.service and not (force_refresh or rebuild):
+            return self.service
+
+        from google.auth.transport.requests import Request
+        from googleapiclient.discovery import build
+
         SCOPES = [
             'https://www.googleapis.com/auth/gmail.modify',  # Required for moving to trash
             'https://www.googleapis.com/auth/gmail.readonly'
         ]
         
-        creds = None
+        creds = None if force_refresh else self.creds
         token_path = 'token.pickle'
         
         # Load existing credentials
-        if os.path.exists(token_path) and not force_refresh:
+        if not creds and os.path.exists(token_path) and not force_refresh:
             with open(token_path, 'rb') as token:
                 creds = pickle.load(token)
         
@@ -67,6 +93,7 @@ class GmailFetcher:
             
             # If still no valid credentials, need new ones
             if not creds:
+                from google_auth_oauthlib.flow import InstalledAppFlow
                 flow = InstalledAppFlow.from_client_secrets_file(
                     'credentials.json', SCOPES)
                 creds = flow.run_local_server(port=0)
@@ -75,54 +102,11 @@ class GmailFetcher:
                 with open(token_path, 'wb') as token:
                     pickle.dump(creds, token)
         
-        self.service = build('gmail', 'v1', credentials=creds)
+        self.creds = creds
+        self.service = build('gmail', 'v1', credentials=creds, cache_discovery=False)
         logger.info("Successfully authenticated with Gmail API")
         return self.service
 
-    def fetch_emails(self, max_results=None):
-        """Fetches emails in batches and creates batch files"""
-        logger.debug("Starting fetch_emails method")
-        try:
-            if not self.service:
-                self.authenticate()
-            
-            batch_size = 500  # Increased from 20
-            page_token = None
-            batch_number = 0
-            os.makedirs('cache/email_batches', exist_ok=True)
-            
-            while True:
-                # Fetch batch of message IDs
-                results = self.service.users().messages().list(
-                    userId='me',
-                    q='in:inbox -in:trash',
-                    maxResults=batch_size,
-                    pageToken=page_token
-                ).execute()
-                
-                messages = results.get('messages', [])
-                if not messages:
-                    break
-                    
-                # Create batch file
-                batch_file = f'cache/email_batches/batch_{batch_number}.json'
-                with open(batch_file, 'w') as f:
-                    json.dump(messages, f)
-                
-                logger.info(f"Created batch file {batch_number} with {len(messages)} messages")
-                batch_number += 1
-                
-                # Get next page token
-                page_token = results.get('nextPageToken')
-                if not page_token:
-                    break
-            
-            return True
-
-        except Exception as e:
-            logger.error(f"Error fetching emails: {str(e)}", exc_info=True)
-            raise
-
     def _parse_message(self, message):
         """Parses a Gmail message into required fields"""
         try:
@@ -184,6 +168,7 @@ class GmailFetcher:
                 return text if text else "No content available"
 
             def extract_text_from_html(html_content):
+                from bs4 import BeautifulSoup
                 soup = BeautifulSoup(html_content, 'html.parser')
                 
                 # Remove unwanted elements
@@ -207,54 +192,31 @@ class GmailFetcher:
                 
                 return text
 
-            # Get message body
+            # Walk the MIME tree once, picking the body part and spotting attachments
+            plain_part, html_part, has_attachments = self._select_parts(message['payload'])
+
+            # Only the selected part is decoded
             body = ''
-            parts = []
-            
-            if 'parts' in message['payload']:
-                parts = message['payload']['parts']
-            else:
-                parts = [message['payload']]
-
-            for part in parts:
-                if part.get('mimeType') == 'text/plain' and 'data' in part.get('body', {}):
-                    body = base64.urlsafe_b64decode(part['body']['data']).decode()
-                    body = clean_text(body)
-                    break
-                elif part.get('mimeType') == 'text/html' and 'data' in part.get('body', {}):
-                    html_content = base64.urlsafe_b64decode(part['body']['data']).decode()
-                    body = extract_text_from_html(html_content)
-                    body = clean_text(body)
-                    break
-                elif 'parts' in part:
-                    for subpart in part['parts']:
-                        if subpart.get('mimeType') == 'text/plain' and 'data' in subpart.get('body', {}):
-                            body = base64.urlsafe_b64decode(subpart['body']['data']).decode()
-                            body = clean_text(body)
-                            break
-                        elif subpart.get('mimeType') == 'text/html' and 'data' in subpart.get('body', {}):
-                            html_content = base64.urlsafe_b64decode(subpart['body']['data']).decode()
-                            body = extract_text_from_html(html_content)
-                            body = clean_text(body)
-                            break
-
-            # Check for attachments
-            has_attachments = False
-            for part in parts:
-                if 'filename' in part and part['filename']:
-                    has_attachments = True
-                    break
+            if plain_part:
+                body = self._decode_part(plain_part)
+            if not body.strip() and html_part:
+                body = extract_text_from_html(self._decode_part(html_part))
+            if body:
+                body = clean_text(body)
 
             return {
                 'message_id': message['id'],
                 'subject': subject,
                 'sender': sender,
                 'body': body,
-                'has_attachments': has_attachments
+                'has_attachments': has_attachments,
+                'labels': message.get('labelIds', []),
+                'size': message.get('sizeEstimate', 0),
+                'history_id': message.get('historyId')
             }
 
         except Exception as e:
-            logger.error(f"Error parsing message: {str(e)}")
+            logger.error(f"Error parsing message: {str(e)}", extra=HOT)
             return {
                 'message_id': message.get('id', 'unknown'),
                 'subject': 'Error: Could not parse message',
@@ -263,7 +225,100 @@ class GmailFetcher:
                 'has_attachments': False
             }
 
-    async def delete_email(self, email_id):
+    def _walk_parts(self, payload):
+        """Yield (part, alternative) for every part of a MIME tree depth first, without recursion
+
+        alternative is the nearest enclosing multipart/alternative part, or None.
+        """
+        stack = [(payload, None)]
+        while stack:
+            part, alternative = stack.pop()
+            yield part, alternative
+            children = part.get('parts')
+            if children:
+                if part.get('mimeType', '').lower() == 'multipart/alternative':
+                    alternative = part
+                stack.extend((child, alternative) for child in reversed(children))
+
+    def _is_attachment(self, part):
+        # Large inline bodies also come with an attachmentId, so only the disposition and filename count
+        if part.get('filename'):
+            return True
+        for header in part.get('headers', []):
+            if header['name'].lower() == 'content-disposition' and header['value'].lower().startswith('attachment'):
+                return True
+        return False
+
+    def _select_parts(self, payload):
+        """Return (text/plain part, text/html part, has_attachments) from one pass over the tree
+
+        The body is the first text part of the message. Only the alternatives
+        of one multipart/alternative group are interchangeable: there text/plain
+        is preferred and the group's text/html is the fallback. Text parts
+        elsewhere are separate content, so a later text/plain never replaces an
+        earlier text/html body.
+        """
+        plain_part = None
+        html_part = None
+        body_group = None
+        has_attachments = False
+
+        for part, alternative in self._walk_parts(payload):
+            if self._is_attachment(part):
+                has_attachments = True
+                continue
+            if 'data' not in part.get('body', {}):
+                continue
+            mime_type = part.get('mimeType', '').lower()
+            if mime_type not in ('text/plain', 'text/html'):
+                continue
+            if plain_part is None and html_part is None:
+                body_group = alternative
+            elif alternative is None or alternative is not body_group:
+                continue
+            if mime_type == 'text/plain' and plain_part is None:
+                plain_part = part
+            elif mime_type == 'text/html' and html_part is None:
+                html_part = part
+
+        return plain_part, html_part, has_attachments
+
+    def _decode_part(self, part):
+        """Decode a part's body using its declared charset"""
+        charset = 'utf-8'
+        for header in part.get('headers', []):
+            if header['name'].lower() == 'content-type':
+                match = re.search(r'charset="?([\w.:-]+)"?', header['value'], re.I)
+                if match:
+                    charset = match.group(1)
+                break
+
+        data = base64.urlsafe_b64decode(part['body']['data'])
+        try:
+            return data.decode(charset, errors='replace')
+        except LookupError:
+            logger.warning(f"Unknown charset {charset}, falling back to utf-8", extra=HOT)
+            return data.decode('utf-8', errors='replace')
+
+    def _journal_intent(self, email_ids, reasons=None, labels=None):
+        """Record emails in the trash journal before the trash call is issued"""
+        if self.journal:
+            self.journal.record_intent(self.run_id, email_ids, reasons, labels=labels)
+
+    def _journal_result(self, email_ids, status):
+        if self.journal:
+            self.journal.mark(self.run_id, email_ids, status)
+
+    async def _record_trashed(self, email_ids):
+        """Journal emails as trashed and drop them from the message store, so reclassify skips them"""
+        self._journal_result(email_ids, 'trashed')
+        if self.message_store and email_ids:
+            try:
+                await asyncio.to_thread(self.message_store.delete_many, email_ids)
+            except Exception as e:
+                logger.warning(f"Could not drop {len(email_ids)} trashed messages from the local store: {str(e)}")
+
+    async def delete_email(self, email_id, reason=None):
         """Move an email to trash using Gmail API"""
         if not self.service:
             self.authenticate()
@@ -274,32 +329,37 @@ class GmailFetcher:
         for attempt in range(max_retries):
             try:
                 # Check if already in trash
-                message = await asyncio.to_thread(
+                message = await self._execute(
                     self.service.users().messages().get(
                         userId='me',
                         id=email_id,
                         format='minimal'
-                    ).execute
+                    ),
+                    'messages.get'
                 )
                 
                 if 'TRASH' in message.get('labelIds', []):
-                    logger.info(f"Email {email_id} already in trash")
+                    logger.info(f"Email {email_id} already in trash", extra=HOT)
                     return True
                 
                 # Attempt to trash the message
+                self._journal_intent([email_id], {email_id: reason}, {email_id: message.get('labelIds', [])})
                 await asyncio.sleep(1)  # Small delay before delete
-                await asyncio.to_thread(
+                await self._execute(
                     self.service.users().messages().trash(
                         userId='me',
                         id=email_id
-                    ).execute
+                    ),
+                    'messages.trash'
                 )
-                logger.info(f"Successfully moved email {email_id} to trash")
+                await self._record_trashed([email_id])
+                logger.info(f"Successfully moved email {email_id} to trash", extra=HOT)
                 return True
                 
             except (ssl.SSLError, http.client.IncompleteRead) as e:
                 if attempt == max_retries - 1:
                     logger.error(f"SSL error deleting {email_id} after {max_retries} attempts: {str(e)}")
+                    self._journal_result([email_id], 'failed')
                     return False
                 
                 delay = min(300, base_delay * (2 ** attempt))
@@ -307,215 +367,603 @@ class GmailFetcher:
                 await asyncio.sleep(delay)
                 
                 # Clear SSL state and re-authenticate on SSL errors
-                self.clear_ssl_state()
+                await self.clear_ssl_state()
                 continue
                 
         return False
 
-    async def batch_delete_emails(self, email_ids):
-        """Batch delete multiple emails at once"""
+    async def batch_delete_emails(self, email_ids, reasons=None, labels=None):
+        """Batch delete multiple emails at once
+
+        Each trash call in a batch succeeds or fails on its own; only the ones
+        that succeeded are journaled as trashed. Returns False if any failed.
+        """
         try:
             if not self.service:
                 self.authenticate()
             
-            # Split into smaller batches to avoid API limits
-            batch_size = 50
+            all_trashed = True
+            # Split into smaller batches; one batch HTTP request takes at most 100 calls
+            batch_size = min(self.tuner.value('trash_batch'), 100)
             for i in range(0, len(email_ids), batch_size):
                 batch = email_ids[i:i + batch_size]
                 
-                # Create batch request
-                batch_request = self.service.new_batch_http_request()
-                for email_id in batch:
-                    batch_request.add(
-                        self.service.users().messages().trash(
-                            userId='me',
-                            id=email_id
-                        )
-                        )
-                
                 # Execute batch request with retry
+                self._journal_intent(batch, reasons, await self._labels_before_trash(batch, labels))
                 for attempt in range(3):
+                    failed = {}
+
+                    def callback(request_id, response, exception, failed=failed):
+                        if exception is not None:
+                            failed[request_id] = exception
+
+                    # Create batch request; a retry after a dropped connection sends it again whole
+                    batch_request = self.service.new_batch_http_request(callback=callback)
+                    for email_id in batch:
+                        batch_request.add(
+                            self.service.users().messages().trash(
+                                userId='me',
+                                id=email_id
+                            ),
+                            request_id=email_id
+                        )
                     try:
-                        await asyncio.to_thread(batch_request.execute)
+                        await self._execute(batch_request, 'messages.trash',
+                                            units=QUOTA_UNITS['messages.trash'] * len(batch))
+                        await self._record_trashed([email_id for email_id in batch if email_id not in failed])
+                        if failed:
+                            all_trashed = False
+                            self._journal_result(list(failed), 'failed')
+                            logger.error(f"Failed to trash {len(failed)} of {len(batch)} emails in batch: "
+                                         f"{str(next(iter(failed.values())))}")
                         break
                     except (ssl.SSLError, http.client.IncompleteRead) as e:
                         if attempt == 2:
                             logger.error(f"SSL error deleting batch after 3 attempts: {str(e)}")
+                            self._journal_result(batch, 'failed')
                             return False
                         logger.warning(f"SSL error deleting batch, attempt {attempt + 1}: {str(e)}")
                         await asyncio.sleep(2)
                         continue
                     except Exception as e:
                         logger.error(f"Error deleting batch: {str(e)}")
+                        self._journal_result(batch, 'failed')
                         return False
             
-            return True
+            return all_trashed
             
         except Exception as e:
             logger.error(f"Error in batch delete: {str(e)}")
             return False
 
-    def test_delete_functionality(self):
-        """Test the delete functionality with a single email"""
+    async def _labels_before_trash(self, email_ids, labels=None):
+        """labelIds to journal for each email: the caller's, else read from Gmail
+
+        Undo puts these back, so an email not known to be in the inbox is not
+        moved there. Emails whose labels cannot be read are journaled without,
+        and undo treats them as inbox mail.
+        """
+        labels = dict(labels or {})
+        missing = [email_id for email_id in email_ids if email_id not in labels]
+        if missing:
+            states = await self.message_states(missing)
+            labels.update({email_id: state['labels'] for email_id, state in states.items() if state})
+        return labels
+
+    async def batch_trash_emails(self, email_ids, reasons=None, labels=None):
+        """Move up to 1000 emails to trash with a single batchModify call
+
+        labels maps IDs to their labelIds from the parsed records; emails left
+        out are looked up before trashing, so undo can restore their labels.
+        """
+        if not email_ids:
+            return True
+
+        self._journal_intent(email_ids, reasons, await self._labels_before_trash(email_ids, labels))
+        success = await self._batch_modify(
+            email_ids,
+            add_labels=['TRASH'],
+            remove_labels=['INBOX'],
+            action='trashing'
+        )
+        if success:
+            await self._record_trashed(email_ids)
+        else:
+            self._journal_result(email_ids, 'failed')
+        return success
+
+    async def batch_restore_emails(self, email_ids, to_inbox=True):
+        """Take up to 1000 emails out of trash, back into the inbox unless to_inbox is False
+
+        Emails returned to the inbox are fetched again into the message store,
+        which dropped them when they were trashed.
+        """
+        success = await self._batch_modify(
+            email_ids,
+            add_labels=['INBOX'] if to_inbox else None,
+            remove_labels=['TRASH'],
+            action='restoring'
+        )
+        if success and to_inbox and self.message_store:
+            await self.fetch_message_records(email_ids)
+        return success
+
+    async def _batch_modify(self, email_ids, add_labels=None, remove_labels=None, action='modifying'):
+        """Run one batchModify call (max 1000 IDs) with SSL retries"""
+        if not self.service:
+            self.authenticate()
+
+        if not email_ids:
+            return True
+
+        if len(email_ids) > 1000:
+            raise ValueError("batchModify accepts at most 1000 message IDs per call")
+
+        body = {'ids': list(email_ids)}
+        if add_labels:
+            body['addLabelIds'] = add_labels
+        if remove_labels:
+            body['removeLabelIds'] = remove_labels
+
+        for attempt in range(3):
+            try:
+                await self._execute(
+                    self.service.users().messages().batchModify(
+                        userId='me',
+                        body=body
+                    ),
+                    'messages.batchModify'
+                )
+                return True
+            except (ssl.SSLError, http.client.IncompleteRead) as e:
+                if attempt == 2:
+                    logger.error(f"SSL error {action} batch after 3 attempts: {str(e)}")
+                    return False
+                logger.warning(f"SSL error {action} batch, attempt {attempt + 1}: {str(e)}")
+                await asyncio.sleep(2 * (attempt + 1))
+            except Exception as e:
+                logger.error(f"Error {action} batch: {str(e)}")
+                return False
+
+        return False
+
+    async def load_label_index(self, refresh=False):
+        """Cache label name -> ID from a single labels.list call"""
+        if self._label_index is not None and not refresh:
+            return self._label_index
+
+        if not self.service:
+            self.authenticate()
+
+        results = await self._execute(self.service.users().labels().list(userId='me'), 'labels.list')
+        self._label_index = {label['name']: label['id'] for label in results.get('labels', [])}
+        logger.info(f"Loaded {len(self._label_index)} Gmail labels")
+        return self._label_index
+
+    async def get_label_ids(self, label_names):
+        """Resolve label names to IDs, creating any missing labels on first use"""
+        index = await self.load_label_index()
+        label_ids = []
+        for name in sorted(label_names):
+            if name not in index:
+                try:
+                    label = await self._execute(
+                        self.service.users().labels().create(
+                            userId='me',
+                            body={
+                                'name': name,
+                                'labelListVisibility': 'labelShow',
+                                'messageListVisibility': 'show'
+                            }
+                        ),
+                        'labels.create'
+                    )
+                    index[name] = label['id']
+                    logger.info(f"Created Gmail label {name}")
+                except Exception as e:
+                    # Another run may have created it since the index was loaded
+                    logger.warning(f"Could not create label {name}, reloading labels: {str(e)}")
+                    index = await self.load_label_index(refresh=True)
+                    if name not in index:
+                        raise
+            label_ids.append(index[name])
+        return label_ids
+
+    async def batch_apply_labels(self, email_ids, label_names):
+        """Add the given labels to many emails, 1000 IDs per batchModify call"""
+        if not email_ids or not label_names:
+            return True
+
+        label_ids = await self.get_label_ids(label_names)
+        for i in range(0, len(email_ids), 1000):
+            if not await self._batch_modify(email_ids[i:i + 1000], add_labels=label_ids, action='labeling'):
+                return False
+
+        logger.info(f"Labeled {len(email_ids)} emails with {', '.join(sorted(label_names))}")
+        return True
+
+    async def fetch_next_batch(self, page_token=None):
+        """Fetch one page of parsed messages
+
+        The page's IDs normally come from the look-ahead listing task, and its
+        detail requests run as concurrent batch-gets within the quota
+        scheduler's limits.
+        """
         try:
-            # Get the first email from inbox
-            results = self.service.users().messages().list(
-                userId='me',
-                maxResults=1
-            ).execute()
-            
-            messages = results.get('messages', [])
-            if not messages:
-                print(f"{Colors.YELLOW}No messages found to test deletion{Colors.RESET}")
-                return
-            
-            test_email = messages[0]
-            msg = self.service.users().messages().get(
-                userId='me', 
-                id=test_email['id']
-            ).execute()
+            if not self.service:
+                self.authenticate()
             
-            # Print email details
-            headers = msg['payload']['headers']
-            subject = next((h['value'] for h in headers if h['name'].lower() == 'subject'), 'No subject')
-            print(f"\n{Colors.CYAN}Testing deletion with:{Colors.RESET}")
-            print(f"Email ID: {test_email['id']}")
-            print(f"Subject: {subject}\n")
+            logger.info(f"Fetching next batch with page token: {page_token}")
+            message_ids, next_token = await self._take_id_page(page_token)
+            if not message_ids:
+                return None
+            logger.info(f"Found {len(message_ids)} messages in response")
+
+            detailed_messages = await self._fetch_details(message_ids, self._parse_message)
             
-            # Attempt deletion
-            if self.delete_email(test_email['id']):
-                print(f"{Colors.GREEN}Delete test successful!{Colors.RESET}")
-            else:
-                print(f"{Colors.RED}Delete test failed!{Colors.RESET}")
+            return {
+                'messages': detailed_messages,
+                'nextPageToken': next_token
+            }
             
         except Exception as e:
-            print(f"{Colors.RED}Error testing delete functionality: {str(e)}{Colors.RESET}")
+            logger.error(f"Error in fetch_next_batch: {str(e)}", exc_info=True)
+            return None
 
-    async def process_emails(self):
-        page_size = 500  # Process 100 emails at a time
-        next_page_token = None
-        
-        while True:
+    def _borrow_http(self):
+        """An authorized HTTP connection for one request; httplib2 objects are not thread-safe"""
+        try:
+            return self._http_pool.pop()
+        except IndexError:
+            import httplib2
+            import google_auth_httplib2
+            return google_auth_httplib2.AuthorizedHttp(self.creds, http=httplib2.Http(timeout=60))
+
+    async def _execute(self, request, method, units=None):
+        """Run one API or batch request on its own connection, within the quota scheduler
+
+        The connection and the in-flight slot are given back when the request
+        itself finishes. A caller that stops waiting (wait_for timing out)
+        leaves the thread running, and neither may be reused before it ends.
+        """
+        await self.quota.acquire(units or QUOTA_UNITS[method])
+        pool = self._http_pool
+        http = self._borrow_http()
+        started = time.monotonic()
+
+        def run():
             try:
-                results = self.service.users().messages().list(
-                    userId='me', 
-                    maxResults=page_size,
-                    pageToken=next_page_token
-                ).execute()
-                
-                emails = results.get('messages', [])
-                if not emails:
-                    break
-                    
-                # Process this batch of emails
-                for email in emails:
-                    await self.process_single_email(email['id'])
-                    await asyncio.sleep(0.1)  # Small delay to prevent rate limiting
-                
-                # Get next page token
-                next_page_token = results.get('nextPageToken')
-                if not next_page_token:
-                    break
-                    
+                return request.execute(http=http)
+            finally:
+                # A pool replaced by clear_ssl_state in the meantime drops the connection
+                pool.append(http)
+
+        def finished(future):
+            self.quota.release()
+            self.tuner.record_latency(time.monotonic() - started)
+            if not future.cancelled():
+                future.exception()  # retrieved here in case the caller gave up on it
+
+        future = asyncio.ensure_future(asyncio.to_thread(run))
+        future.add_done_callback(finished)
+        return await asyncio.shield(future)
+
+    def _id_page(self, page_token):
+        """Task listing one page of IDs, shared by the prefetcher and the page consumer"""
+        task = self._id_pages.get(page_token)
+        if task is None:
+            task = asyncio.ensure_future(self.list_message_ids(page_token))
+            self._id_pages[page_token] = task
+        return task
+
+    async def _take_id_page(self, page_token):
+        """Return (ids, next token) for a page and keep listing pages ahead of it"""
+        try:
+            message_ids, next_token = await self._id_page(page_token)
+        finally:
+            # Consumed, or failed and to be listed again on retry
+            self._id_pages.pop(page_token, None)
+
+        if next_token and (self._id_prefetch is None or self._id_prefetch.done()):
+            self._id_prefetch = asyncio.create_task(self._prefetch_ids(next_token))
+        return message_ids, next_token
+
+    async def _prefetch_ids(self, page_token):
+        """Walk the page-token chain until id_lookahead pages are listed ahead"""
+        try:
+            # Pages already listed resolve instantly, so a restart catches up to the frontier at once
+            while page_token and len(self._id_pages) < self.id_lookahead:
+                _, page_token = await self._id_page(page_token)
+        except Exception as e:
+            logger.warning(f"ID look-ahead stopped: {str(e)}")
+
+    async def _fetch_details(self, message_ids, parse, chunk_size=None):
+        """Batch-get messages with several batches in flight, returning parsed results in order"""
+        chunk_size = min(chunk_size or self.tuner.value('fetch_chunk'), 100)
+        chunks = [message_ids[i:i + chunk_size] for i in range(0, len(message_ids), chunk_size)]
+        results = await asyncio.gather(*(self._fetch_chunk(chunk, parse) for chunk in chunks))
+
+        parsed = [item for chunk_results in results for item in chunk_results]
+        if len(parsed) < len(message_ids):
+            logger.warning(f"Failed to fetch {len(message_ids) - len(parsed)} of {len(message_ids)} messages")
+        if self.message_store and parsed:
+            try:
+                await asyncio.to_thread(self.message_store.put_many, parsed)
             except Exception as e:
-                logger.error(f"Error processing emails batch: {str(e)}")
-                break
+                logger.warning(f"Could not save {len(parsed)} messages to the local store: {str(e)}")
+        return parsed
+
+    async def _fetch_chunk(self, message_ids, parse):
+        """One batch HTTP request of up to 100 messages.get calls"""
+        parsed = {}
+        batch = self.service.new_batch_http_request()
+        self.tuner.record_requests(len(message_ids))
+
+        def callback(request_id, response, exception):
+            if exception:
+                logger.error(f"Batch request error: {str(exception)}", extra=HOT)
+                self.tuner.record_error(exception)
+                return
+            try:
+                # Parsed in the callback so the raw payload is dropped right away
+                parsed[request_id] = parse(response)
+            except Exception as e:
+                logger.error(f"Error parsing message in callback: {str(e)}", extra=HOT)
+
+        for message_id in message_ids:
+            batch.add(
+                self.service.users().messages().get(userId='me', id=message_id),
+                callback=callback,
+                request_id=message_id
+            )
 
-    def fetch_batch(self, page_token=None):
-        """Fetch a batch of emails using pagination"""
         try:
-            if not self.service:
-                self.authenticate()
-            
-            logger.info("Executing Gmail API batch request")
-            results = self.service.users().messages().list(
-                userId='me',
-                q='in:inbox -in:trash',
-                maxResults=500,  # Increased from 100 to 500
-                pageToken=page_token
-            ).execute()
-            
-            messages = results.get('messages', [])
-            if messages:
-                logger.info(f"Found {len(messages)} messages in this batch")
-                # Get full message details for each ID
-                detailed_messages = []
-                for message in messages:
-                    full_message = self.service.users().messages().get(
-                        userId='me',
-                        id=message['id']
-                    ).execute()
-                    detailed_messages.append(self._parse_message(full_message))
-                
-                return {
-                    'messages': detailed_messages,
-                    'nextPageToken': results.get('nextPageToken')
+            await self._execute(batch, 'messages.get', units=QUOTA_UNITS['messages.get'] * len(message_ids))
+        except Exception as e:
+            logger.error(f"Batch of {len(message_ids)} messages failed: {str(e)}")
+            self.tuner.record_error(e, count=len(message_ids) - len(parsed))
+        return [parsed[message_id] for message_id in message_ids if message_id in parsed]
+
+    async def message_states(self, message_ids):
+        """Current labels of messages, from format=minimal batch-gets
+
+        Returns message_id -> {'labels': [...], 'history_id': ...}, or None for
+        messages Gmail no longer has. Messages whose request failed for another
+        reason are left out, so callers treat them as unknown rather than gone.
+        """
+        if not self.service:
+            self.authenticate()
+        states = {}
+
+        async def fetch_chunk(chunk):
+            batch = self.service.new_batch_http_request()
+
+            def callback(request_id, response, exception):
+                if exception:
+                    if getattr(getattr(exception, 'resp', None), 'status', None) == 404:
+                        states[request_id] = None
+                    else:
+                        logger.warning(f"Could not read state of {request_id}: {str(exception)}", extra=HOT)
+                    return
+                states[request_id] = {
+                    'labels': response.get('labelIds', []),
+                    'history_id': response.get('historyId')
                 }
-            
+
+            for message_id in chunk:
+                batch.add(
+                    self.service.users().messages().get(
+                        userId='me', id=message_id, format='minimal', fields='id,labelIds,historyId'
+                    ),
+                    callback=callback,
+                    request_id=message_id
+                )
+            try:
+                await self._execute(batch, 'messages.get', units=QUOTA_UNITS['messages.get'] * len(chunk))
+            except Exception as e:
+                logger.error(f"State check of {len(chunk)} messages failed: {str(e)}")
+
+        await asyncio.gather(*(fetch_chunk(message_ids[i:i + 100]) for i in range(0, len(message_ids), 100)))
+        return states
+
+    async def account_email(self):
+        """Email address of the authenticated account, used to key per-account settings"""
+        if not self.service:
+            self.authenticate()
+        try:
+            profile = await self._execute(self.service.users().getProfile(userId='me'), 'getProfile')
+            return profile.get('emailAddress')
+        except Exception as e:
+            logger.warning(f"Could not read account profile: {str(e)}")
             return None
 
+    async def inbox_total(self):
+        """Number of messages currently in the inbox, or None if it cannot be read"""
+        if not self.service:
+            self.authenticate()
+        try:
+            inbox = await self._execute(self.service.users().labels().get(userId='me', id='INBOX'), 'labels.get')
+            return inbox.get('messagesTotal')
         except Exception as e:
-            logger.error(f"Error fetching batch: {str(e)}")
-            raise
+            logger.warning(f"Could not read inbox size: {str(e)}")
+            return None
 
-    async def fetch_next_batch(self, page_token=None):
+    async def list_message_ids(self, page_token=None, page_size=None):
+        """List one page of inbox message IDs without fetching any details"""
+        if not self.service:
+            self.authenticate()
+        page_size = page_size or self.tuner.value('page_size')
+
+        results = await asyncio.wait_for(
+            self._execute(
+                self.service.users().messages().list(
+                    userId='me',
+                    q='in:inbox -in:trash',
+                    maxResults=page_size,
+                    pageToken=page_token,
+                    fields='messages/id,nextPageToken'
+                ),
+                'messages.list'
+            ),
+            timeout=30
+        )
+        message_ids = [message['id'] for message in results.get('messages', [])]
+        return message_ids, results.get('nextPageToken')
+
+    async def fetch_message_records(self, message_ids, chunk_size=None):
+        """Fetch and parse messages into compact EmailRecords
+
+        Each raw payload is parsed inside its batch callback and dropped right
+        away, so only the compact records outlive the call.
+        """
+        if not self.service:
+            self.authenticate()
+        return await self._fetch_details(
+            message_ids,
+            lambda message: EmailRecord.from_dict(self._parse_message(message)),
+            chunk_size
+        )
+
+    def _has_attachments(self, payload):
+        """Check whether any part of a message payload, at any depth, is an attachment"""
+        return any(self._is_attachment(part) for part, _ in self._walk_parts(payload))
+
+    def _parse_thread(self, thread):
+        """Parses a Gmail thread into one compact summary record"""
+        messages = thread.get('messages', [])
+        if not messages:
+            return None
+
+        # The latest message carries the most current context for the thread
+        latest = self._parse_message(messages[-1])
+
+        participants = []
+        for message in messages:
+            headers = message.get('payload', {}).get('headers', [])
+            sender = next((h['value'] for h in headers if h['name'].lower() == 'from'), '')
+            if sender and sender not in participants:
+                participants.append(sender)
+
+        first_headers = messages[0].get('payload', {}).get('headers', [])
+        subject = next((h['value'] for h in first_headers if h['name'].lower() == 'subject'), '')
+
+        return {
+            'message_id': thread['id'],
+            'thread_id': thread['id'],
+            'message_ids': [message['id'] for message in messages],
+            'message_labels': {message['id']: message.get('labelIds', []) for message in messages},
+            # Every label on any message, so thread records carry the same features as message records
+            'labels': sorted({label for message in messages for label in message.get('labelIds', [])}),
+            'message_count': len(messages),
+            'participants': participants,
+            'subject': subject or latest['subject'],
+            'sender': latest['sender'],
+            'body': latest['body'],
+            'has_attachments': latest['has_attachments'] or any(
+                self._has_attachments(message.get('payload', {})) for message in messages
+            )
+        }
+
+    async def fetch_next_thread_batch(self, page_token=None):
+        """Fetch a page of inbox threads, summarizing each thread as one record"""
         try:
             if not self.service:
                 self.authenticate()
-            
-            logger.info(f"Fetching next batch with page token: {page_token}")
-            
-            # Get list of 500 message IDs
+
+            logger.info(f"Fetching next thread batch with page token: {page_token}")
+
             results = await asyncio.wait_for(
-                asyncio.to_thread(
-                    self.service.users().messages().list(
+                self._execute(
+                    self.service.users().threads().list(
                         userId='me',
                         q='in:inbox -in:trash',
-                        maxResults=500,
+                        maxResults=100,
                         pageToken=page_token
-                    ).execute
+                    ),
+                    'threads.list'
                 ),
                 timeout=30
             )
-            
-            if not results or not results.get('messages'):
+
+            if not results or not results.get('threads'):
                 return None
-            
-            messages = results.get('messages', [])
-            logger.info(f"Found {len(messages)} messages in response")
-            
-            # Process in chunks of 20 to avoid quota limits
-            detailed_messages = []
-            for i in range(0, len(messages), 20):
-                chunk = messages[i:i+20]
+
+            threads = results.get('threads', [])
+            logger.info(f"Found {len(threads)} threads in response")
+
+            # threads.get returns every message in the thread, so keep chunks small
+            detailed_threads = []
+            for i in range(0, len(threads), 10):
+                chunk = threads[i:i+10]
                 batch = self.service.new_batch_http_request()
-                
+
                 def callback(request_id, response, exception):
                     if exception:
-                        logger.error(f"Batch request error: {str(exception)}")
+                        logger.error(f"Thread batch request error: {str(exception)}", extra=HOT)
                     else:
                         try:
-                            detailed_messages.append(self._parse_message(response))
+                            summary = self._parse_thread(response)
+                            if summary:
+                                detailed_threads.append(summary)
                         except Exception as e:
-                            logger.error(f"Error parsing message in callback: {str(e)}")
-                
-                for msg in chunk:
-                    request = self.service.users().messages().get(userId='me', id=msg['id'])
+                            logger.error(f"Error parsing thread in callback: {str(e)}", extra=HOT)
+
+                for thread in chunk:
+                    request = self.service.users().threads().get(userId='me', id=thread['id'])
                     batch.add(request, callback=callback)
-                
-                logger.info(f"Processing chunk {i//20 + 1} of {(len(messages) + 19)//20}")
-                await asyncio.to_thread(batch.execute)
-                await asyncio.sleep(.01)  # Rate limiting delay between chunks
-            
+
+                logger.info(f"Processing thread chunk {i//10 + 1} of {(len(threads) + 9)//10}")
+                await self._execute(batch, 'threads.get', units=QUOTA_UNITS['threads.get'] * len(chunk))
+
             return {
-                'messages': detailed_messages,
+                'messages': detailed_threads,
                 'nextPageToken': results.get('nextPageToken')
             }
-            
+
         except Exception as e:
-            logger.error(f"Error in fetch_next_batch: {str(e)}", exc_info=True)
+            logger.error(f"Error in fetch_next_thread_batch: {str(e)}", exc_info=True)
             return None
 
+    async def trash_thread(self, thread_id, message_ids=None, reason=None, labels=None):
+        """Move every message in a thread to trash with one API call
+
+        threads.trash also trashes sent and archived messages of the thread,
+        so each message's labels are journaled and undo returns only the ones
+        that were in the inbox to it.
+        """
+        if not self.service:
+            self.authenticate()
+
+        # The journal tracks messages, so undo can restore them with batchModify
+        message_ids = message_ids or []
+        self._journal_intent(message_ids, {message_id: reason for message_id in message_ids}, labels)
+
+        for attempt in range(3):
+            try:
+                await self._execute(
+                    self.service.users().threads().trash(
+                        userId='me',
+                        id=thread_id
+                    ),
+                    'threads.trash'
+                )
+                await self._record_trashed(message_ids)
+                logger.info(f"Successfully moved thread {thread_id} to trash", extra=HOT)
+                return True
+            except (ssl.SSLError, http.client.IncompleteRead) as e:
+                if attempt == 2:
+                    logger.error(f"SSL error trashing thread {thread_id} after 3 attempts: {str(e)}")
+                    self._journal_result(message_ids, 'failed')
+                    return False
+                logger.warning(f"SSL error trashing thread {thread_id}, attempt {attempt + 1}: {str(e)}")
+                await asyncio.sleep(2 * (attempt + 1))
+            except Exception as e:
+                logger.error(f"Error trashing thread {thread_id}: {str(e)}")
+                self._journal_result(message_ids, 'failed')
+                return False
+
+        return False
+
     async def execute_with_retry(self, func):
         """Execute API calls with timeout and retry logic"""
         for attempt in range(self.max_retries):
@@ -540,7 +988,7 @@ class GmailFetcher:
                 delay = min(300, self.base_delay * (2 ** attempt))
                 logger.warning(f"SSL error occurred, retrying in {delay}s...")
                 await asyncio.sleep(delay)
-                self.clear_ssl_state()
+                await self.clear_ssl_state()
                 continue
 
     def create_ssl_context(self):
@@ -556,19 +1004,16 @@ class GmailFetcher:
         return context
 
     async def clear_ssl_state(self):
-        """Clear SSL state with simplified error handling"""
+        """Drop the current connection and rebuild the service with the same credentials"""
         try:
-            # Clear existing credentials
-            token_path = 'token.pickle'
-            if os.path.exists(token_path):
-                os.remove(token_path)
-                logger.info("Removed existing token.pickle")
-            
             # Create fresh SSL context
             self._ssl_context = self.create_ssl_context()
+
+            # Pooled connections carry the old SSL state; requests still running keep theirs
+            self._http_pool = []
             
-            # Force new authentication
-            self.authenticate(force_refresh=True)
+            # New service object, new HTTP connection; the token is refreshed only if expired
+            self.authenticate(rebuild=True)
             logger.info("SSL state cleared and authentication reset")
             return True
             
@@ -578,6 +1023,9 @@ class GmailFetcher:
 
     def get_session(self):
         """Get a session with explicit SSL protocol version"""
+        from google.auth.transport import requests
+        from google.auth.transport.requests import AuthorizedSession
+
         session = AuthorizedSession(self.creds)
         session.verify = True
         
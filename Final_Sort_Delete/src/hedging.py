@@ -0,0 +1,54 @@
+from collections import deque
+
+class HedgePolicy:
+    """Decides when a slow classification request gets a duplicate
+
+    Latencies of recent requests are kept in a sliding window. Once a request
+    has been running longer than the chosen percentile of that window, one
+    hedge may be sent, as long as hedges stay below max_rate of all requests.
+    """
+
+    def __init__(self, percentile=95, max_rate=0.1, window=200, min_samples=20):
+        self.percentile = percentile
+        self.max_rate = max_rate
+        self.window = window
+        self.min_samples = min_samples
+        self.latencies = deque(maxlen=window)
+        self.requests = 0
+        self.hedges = 0
+        self.wins = 0
+        self.losses = 0
+
+    def fresh(self):
+        """A policy with the same settings and no history, e.g. for another model"""
+        return HedgePolicy(self.percentile, self.max_rate, self.window, self.min_samples)
+
+    def record(self, latency):
+        self.latencies.append(latency)
+
+    def hedge_delay(self):
+        """Seconds to wait before hedging, or None while there are too few samples"""
+        if len(self.latencies) < self.min_samples:
+            return None
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))
+        return ordered[index]
+
+    def try_hedge(self):
+        """Take one hedge from the budget; False once the rate cap is reached"""
+        if self.hedges + 1 > self.max_rate * max(self.requests, 1):
+            return False
+        self.hedges += 1
+        return True
+
+    def stats(self):
+        return {
+            'requests': self.requests,
+            'hedges': self.hedges,
+            'wins': self.wins,
+            'losses': self.losses,
+            'hedge_rate': self.hedges / self.requests if self.requests else 0.0,
+            'threshold': self.hedge_delay()
+        }
+
+__all__ = ['HedgePolicy']
@@ -0,0 +1,62 @@
+"""Mapping from classifier categories to the Gmail labels applied when sorting"""
+
+LABEL_PREFIX = 'Sorted'
+
+CATEGORY_LABELS = {
+    'receipts': 'Receipts',
+    'finance': 'Finance',
+    'travel': 'Travel',
+    'work': 'Work',
+    'personal': 'Personal',
+    'newsletters': 'Newsletters',
+    'promotions': 'Promotions',
+    'social': 'Social',
+    'notifications': 'Notifications',
+}
+
+CATEGORIES = sorted(CATEGORY_LABELS) + ['other']
+
+# Subject words checked first, since they are more specific than Gmail's tabs
+SUBJECT_KEYWORDS = (
+    ('receipts', ('receipt', 'your order', 'order confirmation', 'invoice', 'purchase')),
+    ('travel', ('flight', 'boarding pass', 'itinerary', 'reservation', 'check-in')),
+    ('finance', ('statement', 'bank', 'transaction', 'payment', 'tax')),
+    ('newsletters', ('newsletter', 'digest', 'weekly', 'issue #')),
+)
+
+# Gmail's own inbox tabs
+GMAIL_CATEGORIES = {
+    'CATEGORY_PROMOTIONS': 'promotions',
+    'CATEGORY_SOCIAL': 'social',
+    'CATEGORY_UPDATES': 'notifications',
+    'CATEGORY_FORUMS': 'newsletters',
+}
+
+def labels_for_categories(categories):
+    """Return the frozenset of label names for one category or a list of them
+
+    Unknown categories and 'other' map to no label.
+    """
+    if not categories:
+        return frozenset()
+    if isinstance(categories, str):
+        categories = [categories]
+    names = set()
+    for category in categories:
+        label = CATEGORY_LABELS.get(str(category).strip().lower())
+        if label:
+            names.add(f"{LABEL_PREFIX}/{label}")
+    return frozenset(names)
+
+def guess_category(email):
+    """Best-effort category for an email decided without the LLM, 'other' if nothing fits"""
+    subject = (email.get('subject') or '').lower()
+    for category, keywords in SUBJECT_KEYWORDS:
+        if any(keyword in subject for keyword in keywords):
+            return category
+    for label in email.get('labels') or ():
+        if label in GMAIL_CATEGORIES:
+            return GMAIL_CATEGORIES[label]
+    return 'other'
+
+__all__ = ['CATEGORY_LABELS', 'CATEGORIES', 'LABEL_PREFIX', 'labels_for_categories', 'guess_category']
@@ -0,0 +1,213 @@
+import os
+import re
+import json
+import math
+import pickle
+import zlib
+from array import array
+from .utils.logger import setup_logger
+
+logger = setup_logger()
+
+TOKEN_RE = re.compile(r"[a-z0-9$%']{2,}")
+
+class LocalClassifier:
+    """CPU-only hashed-feature logistic regression trained on past LLM decisions
+
+    Predicts the probability that an email is a DELETE. Decisions are only made
+    locally when the model has seen enough examples and its confidence clears
+    the threshold; everything else falls back to the LLM.
+    """
+
+    def __init__(self, model_path='cache/classifier/model.pickle',
+                 examples_path='cache/classifier/examples.jsonl',
+                 threshold=0.95, min_examples=500, n_bits=18, learning_rate=0.5):
+        self.model_path = model_path
+        self.examples_path = examples_path
+        self.threshold = threshold
+        self.min_examples = min_examples
+        self.n_bits = n_bits
+        self.n_features = 1 << n_bits
+        self.learning_rate = learning_rate
+        self.weights = array('d', bytes(8 * self.n_features))
+        self.grad_squares = array('d', bytes(8 * self.n_features))
+        self.bias = 0.0
+        self.bias_grad_square = 0.0
+        self.examples_seen = 0
+        self._examples_file = None
+
+    @classmethod
+    def load(cls, model_path='cache/classifier/model.pickle', **kwargs):
+        """Load a saved model, or start a fresh one if none exists"""
+        classifier = cls(model_path=model_path, **kwargs)
+        if os.path.exists(model_path):
+            try:
+                with open(model_path, 'rb') as f:
+                    state = pickle.load(f)
+                if state.get('n_bits') == classifier.n_bits:
+                    classifier.weights = state['weights']
+                    classifier.grad_squares = state['grad_squares']
+                    classifier.bias = state['bias']
+                    # Models saved before the bias had its own AdaGrad state start it from zero
+                    classifier.bias_grad_square = state.get('bias_grad_square', 0.0)
+                    classifier.examples_seen = state['examples_seen']
+                    logger.info(f"Loaded local classifier trained on {classifier.examples_seen} decisions")
+                else:
+                    logger.warning("Saved local classifier uses a different feature size, starting fresh")
+            except Exception as e:
+                logger.error(f"Error loading local classifier: {str(e)}")
+        return classifier
+
+    def save(self):
+        """Persist the model weights"""
+        directory = os.path.dirname(self.model_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        state = {
+            'n_bits': self.n_bits,
+            'weights': self.weights,
+            'grad_squares': self.grad_squares,
+            'bias': self.bias,
+            'bias_grad_square': self.bias_grad_square,
+            'examples_seen': self.examples_seen
+        }
+        tmp_path = self.model_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(state, f)
+        os.replace(tmp_path, self.model_path)
+        if self._examples_file:
+            self._examples_file.flush()
+
+    def _features(self, email):
+        """Hash the email fields into (index, sign) feature pairs"""
+        tokens = []
+        sender = (email.get('sender') or '').lower()
+        address = sender.split('<')[-1].strip(' >')
+        tokens.append('f:' + address)
+        if '@' in address:
+            tokens.append('d:' + address.split('@')[-1])
+        tokens.extend('s:' + token for token in TOKEN_RE.findall((email.get('subject') or '').lower()))
+        tokens.extend('b:' + token for token in TOKEN_RE.findall((email.get('body') or '')[:1000].lower()))
+        # Records from older batch files or example logs may have no labels; UNREAD changes once the
+        # inbox is read and would tie decisions to when an email was fetched
+        tokens.extend('l:' + label for label in email.get('labels') or () if label != 'UNREAD')
+        if email.get('has_attachments'):
+            tokens.append('attachments')
+        if email.get('message_count'):
+            tokens.append('thread')
+
+        features = {}
+        mask = self.n_features - 1
+        for token in tokens:
+            # crc32 is stable across processes, unlike hash()
+            h = zlib.crc32(token.encode('utf-8'))
+            index = h & mask
+            sign = 1.0 if (h >> 31) & 1 else -1.0
+            features[index] = features.get(index, 0.0) + sign
+        return features
+
+    def _score(self, features):
+        z = self.bias + sum(self.weights[i] * v for i, v in features.items())
+        z = max(-30.0, min(30.0, z))
+        return 1.0 / (1.0 + math.exp(-z))
+
+    def predict_proba(self, email):
+        """Return the probability that the email should be deleted"""
+        return self._score(self._features(email))
+
+    def classify(self, email):
+        """Return (decision, confidence) if the model is confident enough, otherwise None"""
+        if self.examples_seen < self.min_examples:
+            return None
+        p_delete = self.predict_proba(email)
+        confidence = max(p_delete, 1.0 - p_delete)
+        if confidence < self.threshold:
+            return None
+        return ('DELETE' if p_delete >= 0.5 else 'KEEP'), confidence
+
+    def learn(self, email, decision, record=True):
+        """Update the model with one LLM decision (AdaGrad step on log loss)"""
+        if decision not in ('KEEP', 'DELETE'):
+            return
+        features = self._features(email)
+        target = 1.0 if decision == 'DELETE' else 0.0
+        error = self._score(features) - target
+
+        for i, v in features.items():
+            gradient = error * v
+            self.grad_squares[i] += gradient * gradient
+            self.weights[i] -= self.learning_rate * gradient / math.sqrt(self.grad_squares[i])
+        if error:
+            self.bias_grad_square += error * error
+            self.bias -= self.learning_rate * error / math.sqrt(self.bias_grad_square)
+        self.examples_seen += 1
+
+        if record:
+            self._record_example(email, decision)
+
+    def _record_example(self, email, decision):
+        """Append the example to the training log used for offline evaluation"""
+        try:
+            if self._examples_file is None:
+                directory = os.path.dirname(self.examples_path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self._examples_file = open(self.examples_path, 'a', encoding='utf-8')
+            example = {
+                'sender': email.get('sender'),
+                'subject': email.get('subject'),
+                'body': (email.get('body') or '')[:1000],
+                'has_attachments': bool(email.get('has_attachments')),
+                'labels': list(email.get('labels') or ()),
+                'message_count': email.get('message_count', 0),
+                'decision': decision
+            }
+            self._examples_file.write(json.dumps(example) + '\n')
+        except Exception as e:
+            logger.error(f"Error recording classifier example: {str(e)}")
+
+    def close(self):
+        if self._examples_file:
+            self._examples_file.close()
+            self._examples_file = None
+
+def evaluate(examples_path='cache/classifier/examples.jsonl', threshold=0.95, min_examples=500):
+    """Replay logged LLM decisions through a fresh model (progressive validation)
+
+    Every example is predicted before it is learned, so the numbers reflect how
+    the model would have performed had it been running from the start.
+    """
+    classifier = LocalClassifier(examples_path=examples_path, threshold=threshold,
+                                 min_examples=min_examples)
+    stats = {'examples': 0, 'local': 0, 'agreed': 0, 'wrong_deletes': 0}
+
+    with open(examples_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                example = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            decision = example.get('decision')
+            if decision not in ('KEEP', 'DELETE'):
+                continue
+
+            prediction = classifier.classify(example)
+            if prediction:
+                stats['local'] += 1
+                if prediction[0] == decision:
+                    stats['agreed'] += 1
+                elif prediction[0] == 'DELETE':
+                    # The costly mistake: the LLM would have kept this one
+                    stats['wrong_deletes'] += 1
+
+            classifier.learn(example, decision, record=False)
+            stats['examples'] += 1
+
+    stats['llm_call_reduction'] = stats['local'] / stats['examples'] if stats['examples'] else 0.0
+    stats['agreement'] = stats['agreed'] / stats['local'] if stats['local'] else 0.0
+    stats['wrongly_deleted_rate'] = (
+        stats.pop('wrong_deletes') / stats['local'] if stats['local'] else 0.0
+    )
+    return stats
+
+__all__ = ['LocalClassifier', 'evaluate']
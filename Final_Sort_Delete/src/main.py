@@ -1,11 +1,30 @@
 import asyncio
+import argparse
 import signal
+import sys
 import os
 import json
+import time
 from datetime import datetime
 from .gmail_fetcher import GmailFetcher
-from .openai_processor import OpenAIProcessor
-from .utils.logger import setup_logger
+from .openai_processor import OpenAIProcessor, Colors
+from .plan_store import PlanStore
+from .local_classifier import LocalClassifier, evaluate
+from .pipeline import StreamingPipeline
+from .labels import labels_for_categories
+from .trash_journal import TrashJournal
+from .scheduler import PriorityScheduler
+from .work_queue import WorkQueue
+from .workers import LIST_QUEUE, FETCH_QUEUE, CLASSIFY_QUEUE, seed_queue, run_fetch_worker
+from .startup_profile import STARTUP_BUDGET_MS, report_startup
+from .hedging import HedgePolicy
+from .profiler import SamplingProfiler, LoopBlockDetector
+from .autotune import Autotuner
+from .budget import BudgetGovernor
+from .quota import QuotaScheduler
+from .cascade import ModelCascade, load_known_senders
+from .message_store import MessageStore
+from .utils.logger import setup_logger, enable_file_logging, set_log_format
 
 # Global flag for graceful shutdown
 running = True
@@ -17,12 +36,142 @@ def signal_handler(signum, frame):
     print("\nShutting down gracefully... Please wait.")
     running = False
 
-async def main():
-    logger.info("=== Starting Email Processing ===")
-    signal.signal(signal.SIGINT, signal_handler)
-    
-    # Clear all cache files
-    cache_dir = 'cache/email_batches'
+def parse_args(argv=None):
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description="Sort and delete Gmail inbox emails with OpenAI")
+    parser.add_argument('--plan-db', default='cache/plans.db',
+                        help="SQLite file used to store plan decisions")
+
+    parser.add_argument('--journal-db', default='cache/trash_journal.db',
+                        help="SQLite file of the write-ahead trash journal used by undo")
+    parser.add_argument('--threads', action='store_true',
+                        help="Classify whole conversations via users.threads instead of single messages")
+    parser.add_argument('--sort', action='store_true',
+                        help="Label kept emails by category (Sorted/Receipts, Sorted/Travel, ...)")
+    parser.add_argument('--priority', action='store_true',
+                        help="Classify the likeliest deletions first (promotions/social, high-volume senders, short bodies)")
+    parser.add_argument('--lookahead-pages', type=int, default=3,
+                        help="Pages fetched ahead and ranked together in priority mode")
+    parser.add_argument('--time-limit', type=float,
+                        help="Stop cleanly after this many minutes")
+    parser.add_argument('--stream', action='store_true',
+                        help="Stream messages through list/fetch/classify stages with bounded memory")
+    parser.add_argument('--max-in-flight', type=int, default=500,
+                        help="Hard cap on messages held across all stages in streaming mode")
+    parser.add_argument('--local-model', action='store_true',
+                        help="Decide confident emails with the local classifier and send only the rest to OpenAI")
+    parser.add_argument('--local-threshold', type=float, default=0.95,
+                        help="Minimum local classifier confidence needed to skip the LLM")
+    parser.add_argument('--local-min-examples', type=int, default=500,
+                        help="LLM decisions the local classifier must learn from before it decides anything")
+    parser.add_argument('--autotune', action='store_true',
+                        help="Tune page, chunk, sub-batch and trash batch sizes for throughput while running")
+    parser.add_argument('--autotune-db', default='cache/autotune.json',
+                        help="File holding the tuned sizes for each account")
+    parser.add_argument('--fetch-concurrency', type=int, default=4,
+                        help="Batch-get requests to Gmail in flight at once")
+    parser.add_argument('--quota-units', type=float, default=250,
+                        help="Gmail quota units per second to stay under (the per-user limit is 250)")
+    parser.add_argument('--id-lookahead', type=int, default=5,
+                        help="Pages of message IDs listed ahead of the detail fetch")
+    parser.add_argument('--message-db', default='cache/messages.db',
+                        help="SQLite file of parsed messages kept for 'reclassify'")
+    parser.add_argument('--no-message-store', action='store_true',
+                        help="Do not save parsed messages to --message-db while fetching")
+    parser.add_argument('--max-run-usd', type=float,
+                        help="Stop making OpenAI requests once this run has spent this many dollars")
+    parser.add_argument('--max-day-usd', type=float,
+                        help="Stop once today's OpenAI spend across all runs reaches this many dollars")
+    parser.add_argument('--budget-window', type=float,
+                        help="Spread --max-run-usd evenly over this many minutes instead of spending in bursts")
+    parser.add_argument('--spend-ledger', default='cache/spend.db',
+                        help="SQLite database recording OpenAI spend per day")
+    parser.add_argument('--hedge', action='store_true',
+                        help="Send a duplicate classification request when one runs unusually slow")
+    parser.add_argument('--hedge-percentile', type=float, default=95,
+                        help="Latency percentile of recent requests after which a request is hedged")
+    parser.add_argument('--hedge-max-rate', type=float, default=0.1,
+                        help="Most hedges allowed, as a share of all classification requests")
+    parser.add_argument('--cascade', action='store_true',
+                        help="Decide with a fast first-tier model and escalate unsure or high-stakes emails to a second")
+    parser.add_argument('--tier1-model', default='gpt-4o-mini',
+                        help="First-tier model, used for every email")
+    parser.add_argument('--tier2-model', default='gpt-4o',
+                        help="Second-tier model, used for escalated emails")
+    parser.add_argument('--escalate-below', type=float, default=0.8,
+                        help="First-tier confidence below which an email is escalated")
+    parser.add_argument('--known-senders', default='known_senders.txt',
+                        help="File of known contact addresses or @domains, one per line; their emails are always escalated")
+    parser.add_argument('--cascade-audit-rate', type=float, default=0.02,
+                        help="Share of confident first-tier decisions escalated anyway to measure agreement")
+    parser.add_argument('--log-format', choices=['text', 'json'],
+                        help="Format of logs/app.log lines (default text, or the LOG_FORMAT environment variable)")
+    parser.add_argument('--profile', action='store_true',
+                        help="Sample stacks while running and write flamegraph input and loop-block reports")
+    parser.add_argument('--profile-dir', default='profiles',
+                        help="Directory for --profile output (one subdirectory per run)")
+    parser.add_argument('--profile-interval-ms', type=float, default=15,
+                        help="Sampling interval of the profiler (sampling holds the GIL, so keep it coarse)")
+    parser.add_argument('--block-threshold-ms', type=float, default=100,
+                        help="Report any callback that holds the event loop longer than this")
+    parser.add_argument('--startup-profile', action='store_true',
+                        help="Profile import time of the CLI with -X importtime and exit")
+    parser.add_argument('--startup-budget-ms', type=int, default=STARTUP_BUDGET_MS,
+                        help=f"Import time budget checked by --startup-profile (default {STARTUP_BUDGET_MS} ms)")
+
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.add_parser('run', help="Classify and trash emails in one pass (default)")
+    subparsers.add_parser('plan', help="Classify emails and record decisions without trashing")
+
+    review_parser = subparsers.add_parser('review', help="Summarize a recorded plan")
+    review_parser.add_argument('--run-id', help="Plan to review (defaults to the latest)")
+
+    apply_parser = subparsers.add_parser('apply', help="Trash the emails a plan marked DELETE")
+    apply_parser.add_argument('--run-id', help="Plan to apply (defaults to the latest)")
+    apply_parser.add_argument('--batch-size', type=int, default=1000,
+                              help="Message IDs per batchModify call (max 1000)")
+    apply_parser.add_argument('--verify', action='store_true',
+                              help="Check each email is still in the inbox before trashing it (for older plans)")
+
+    undo_parser = subparsers.add_parser('undo', help="Restore emails a run moved to trash")
+    undo_parser.add_argument('--run-id', help="Run to undo (defaults to the latest run that trashed anything)")
+    undo_parser.add_argument('--reason-contains', help="Only restore emails whose recorded reason contains this text")
+    undo_parser.add_argument('--since', help="Only restore emails journaled at or after this ISO timestamp")
+    undo_parser.add_argument('--list', action='store_true', help="List recent runs in the journal and exit")
+
+    reclassify_parser = subparsers.add_parser(
+        'reclassify', help="Classify the locally stored messages again and apply only changed decisions")
+    reclassify_parser.add_argument('--against', help="Plan to compare with (defaults to the latest)")
+    reclassify_parser.add_argument('--apply', action='store_true',
+                                   help="Trash new deletions and restore reversed ones right away")
+    reclassify_parser.add_argument('--batch-size', type=int, default=1000,
+                                   help="Message IDs per batchModify call (max 1000)")
+
+    subparsers.add_parser('evaluate-classifier',
+                          help="Replay logged LLM decisions to measure local classifier agreement")
+
+    seed_parser = subparsers.add_parser('queue-seed', help="Reset the shared work queue and start a new run")
+    seed_parser.add_argument('--queue-db', default='cache/work_queue.db', help="SQLite file for the work queue")
+
+    status_parser = subparsers.add_parser('queue-status', help="Show job counts in the shared work queue")
+    status_parser.add_argument('--queue-db', default='cache/work_queue.db', help="SQLite file for the work queue")
+
+    worker_parser = subparsers.add_parser('worker', help="Run one fetch or classify worker against the work queue")
+    worker_parser.add_argument('--role', choices=['fetch', 'classify'], required=True,
+                               help="Which stage this process works on")
+    worker_parser.add_argument('--queue-db', default='cache/work_queue.db', help="SQLite file for the work queue")
+    worker_parser.add_argument('--lease', type=int, default=300,
+                               help="Seconds a claimed job stays leased before another worker may retry it")
+    worker_parser.add_argument('--plan', action='store_true',
+                               help="Record decisions in the plan store instead of trashing")
+
+    args = parser.parse_args(argv)
+    if args.command is None:
+        args.command = 'run'
+    return args
+
+def clear_batch_cache(cache_dir='cache/email_batches'):
+    """Remove batch files left over from a previous run"""
     if os.path.exists(cache_dir):
         logger.info("Clearing email batch cache...")
         for file in os.listdir(cache_dir):
@@ -33,81 +182,832 @@ async def main():
                     logger.debug(f"Deleted cache file: {file}")
             except Exception as e:
                 logger.error(f"Error deleting cache file {file_path}: {e}")
-    
-    try:
-        logger.info("Initializing GmailFetcher...")
-        fetcher = GmailFetcher()
-        
-        logger.info("Clearing SSL state and refreshing authentication...")
-        fetcher.clear_ssl_state()
-        logger.info("Gmail authentication successful")
-        
-        logger.info("Initializing OpenAI processor...")
-        processor = OpenAIProcessor(gmail_fetcher=fetcher, max_concurrent=10)
-        
-        # Create cache directory
-        os.makedirs('cache/email_batches', exist_ok=True)
-        
-        # Process emails in chunks
-        processed_count = 0
-        batch_number = 0
-        start_time = datetime.now().strftime('%Y%m%d_%H%M%S')
-        
-        # Start first batch fetch
-        logger.info(f"Fetching first batch (processed so far: {processed_count})")
-        current_batch = await fetcher.fetch_next_batch()
-        
-        while running and current_batch and current_batch.get('messages'):
-            try:
-                batch_file = f'cache/email_batches/batch_{start_time}_{batch_number}.json'
-                with open(batch_file, 'w') as f:
-                    json.dump(current_batch['messages'], f)
-                
-                next_batch_task = asyncio.create_task(
-                    asyncio.wait_for(
-                        fetcher.fetch_next_batch(current_batch.get('nextPageToken')),
-                        timeout=60
-                    )
+
+def configure_fetcher(fetcher, args):
+    """Apply the fetch concurrency, quota and look-ahead settings"""
+    fetcher.quota = QuotaScheduler(units_per_second=args.quota_units, max_concurrent=max(1, args.fetch_concurrency))
+    fetcher.id_lookahead = max(1, args.id_lookahead)
+    if not args.no_message_store:
+        fetcher.message_store = MessageStore(args.message_db)
+
+def open_message_store(args):
+    """The message store an earlier run saved, if any, so trashing and restoring keep it current"""
+    if args.no_message_store or not os.path.exists(args.message_db):
+        return None
+    return MessageStore(args.message_db)
+
+async def attach_tuner(fetcher, args):
+    """Give the fetcher this account's tuned sizes, tuning further with --autotune"""
+    if not args.autotune and not os.path.exists(args.autotune_db):
+        return fetcher.tuner
+    fetcher.tuner = Autotuner(account=await fetcher.account_email(), path=args.autotune_db,
+                              enabled=args.autotune, quota=fetcher.quota)
+    return fetcher.tuner
+
+async def build_budget(args, fetcher, total_emails=None):
+    """Return a BudgetGovernor when a spend limit is set, otherwise None"""
+    if args.max_run_usd is None and args.max_day_usd is None:
+        return None
+    budget = BudgetGovernor(
+        max_run_usd=args.max_run_usd,
+        max_day_usd=args.max_day_usd,
+        pace_seconds=args.budget_window * 60 if args.budget_window else None,
+        ledger_path=args.spend_ledger
+    )
+    budget.total_emails = total_emails if total_emails is not None else await fetcher.inbox_total()
+    logger.info(f"Budget: run ${args.max_run_usd or 0:.2f}, day ${args.max_day_usd or 0:.2f} "
+                f"(${budget.day_spent:.2f} already spent today)")
+    return budget
+
+async def log_budget(budget):
+    await budget.save()
+    spend = budget.stats()
+    projected = f"${spend['projected_total']:.2f}" if spend['projected_total'] is not None else "unknown"
+    estimated = f" (${spend['estimated']:.4f} estimated for unfinished streams)" if spend['estimated'] else ""
+    logger.info(f"OpenAI spend: ${spend['run_spent']:.4f} this run{estimated}, ${spend['day_spent']:.4f} today, "
+                f"${spend['cost_per_email']:.5f} per email; whole inbox projected at {projected}")
+    if spend['exhausted_reason']:
+        logger.info(f"Stopped early: {spend['exhausted_reason']}. Undecided emails stay in the inbox; a rerun "
+                    f"classifies the inbox again, including the emails this run kept.")
+
+def should_stop(deadline, processor):
+    """True once the time limit is up or the spend budget is exhausted"""
+    return time_is_up(deadline) or processor.budget_exhausted
+
+def build_hedge_policy(args):
+    """Return a HedgePolicy when --hedge is set, otherwise None"""
+    if not args.hedge:
+        return None
+    return HedgePolicy(percentile=args.hedge_percentile, max_rate=args.hedge_max_rate)
+
+def build_cascade(args):
+    """Return a ModelCascade when --cascade is set, otherwise None"""
+    if not args.cascade:
+        return None
+    return ModelCascade(
+        tier1_model=args.tier1_model,
+        tier2_model=args.tier2_model,
+        min_confidence=args.escalate_below,
+        known_senders=load_known_senders(args.known_senders),
+        audit_rate=args.cascade_audit_rate
+    )
+
+def log_cascade(cascade):
+    stats = cascade.stats()
+    for tier, tier_stats in stats['tiers'].items():
+        logger.info(f"Cascade tier {tier} ({tier_stats['model']}): {tier_stats['decisions']} decisions, "
+                    f"{tier_stats['requests']} requests, {tier_stats['avg_latency']:.1f}s average latency")
+    escalations = ', '.join(f"{reason}: {count}" for reason, count in sorted(stats['escalations'].items())) or 'none'
+    by_reason = ', '.join(f"{reason} {rate:.0%}" for reason, rate in sorted(stats['agreement_by_reason'].items()))
+    logger.info(f"Cascade: {stats['escalation_rate']:.1%} escalated ({escalations}); tier 1 agreed with tier 2 "
+                f"on {stats['agreement']:.1%} of escalated emails" + (f" ({by_reason})" if by_reason else ""))
+
+def time_is_up(deadline):
+    """True once a --time-limit deadline has passed"""
+    if deadline and time.time() >= deadline:
+        logger.info("Time limit reached, stopping")
+        return True
+    return False
+
+async def process_mailbox(fetcher, processor, start_time, threads=False, deadline=None):
+    """Fetch pages of emails and hand them to the processor until the inbox is exhausted"""
+    fetch_page = fetcher.fetch_next_thread_batch if threads else fetcher.fetch_next_batch
+
+    # Create cache directory
+    os.makedirs('cache/email_batches', exist_ok=True)
+
+    # Process emails in chunks
+    processed_count = 0
+    batch_number = 0
+
+    # Start first batch fetch
+    logger.info(f"Fetching first batch (processed so far: {processed_count})")
+    current_batch = await fetch_page()
+
+    while running and current_batch and current_batch.get('messages') and not should_stop(deadline, processor):
+        try:
+            batch_file = f'cache/email_batches/batch_{start_time}_{batch_number}.json'
+            with open(batch_file, 'w') as f:
+                json.dump(current_batch['messages'], f)
+
+            next_batch_task = asyncio.create_task(
+                asyncio.wait_for(
+                    fetch_page(current_batch.get('nextPageToken')),
+                    timeout=60
                 )
-                
-                await processor.process_batch(batch_file)
-                processed_count += len(current_batch['messages'])
-                
+            )
+
+            await processor.process_batch(batch_file)
+            processed_count += len(current_batch['messages'])
+
+            try:
+                next_batch = await next_batch_task
+            except asyncio.TimeoutError:
+                logger.error("Timeout fetching next batch, retrying...")
+                await asyncio.sleep(5)
+                next_batch = await fetch_page(current_batch.get('nextPageToken'))
+
+            if not next_batch or not next_batch.get('messages'):
+                logger.info("No more messages to process")
+                break
+
+            batch_number += 1
+            current_batch = next_batch
+            logger.info(f"Moving to batch {batch_number} (processed so far: {processed_count})")
+
+        except Exception as e:
+            logger.error(f"Error in processing loop: {str(e)}")
+            if running:
+                await asyncio.sleep(10)
                 try:
-                    next_batch = await next_batch_task
-                except asyncio.TimeoutError:
-                    logger.error("Timeout fetching next batch, retrying...")
-                    await asyncio.sleep(5)
-                    next_batch = await fetcher.fetch_next_batch(current_batch.get('nextPageToken'))
-                
-                if not next_batch or not next_batch.get('messages'):
-                    logger.info("No more messages to process")
+                    await fetcher.clear_ssl_state()
+                    current_batch = await fetch_page(current_batch.get('nextPageToken'))
+                except Exception as inner_e:
+                    logger.error(f"Failed to recover: {str(inner_e)}")
                     break
-                
-                batch_number += 1
-                current_batch = next_batch
-                logger.info(f"Moving to batch {batch_number} (processed so far: {processed_count})")
-                
+            else:
+                break
+
+    return processed_count
+
+async def run_classification(args):
+    """Classify the inbox, either trashing as we go or recording a plan"""
+    clear_batch_cache()
+
+    logger.info("Initializing GmailFetcher...")
+    fetcher = GmailFetcher()
+
+    logger.info("Authenticating with Gmail...")
+    fetcher.authenticate()
+    configure_fetcher(fetcher, args)
+    tuner = await attach_tuner(fetcher, args)
+
+    start_time = datetime.now().strftime('%Y%m%d_%H%M%S')
+    deadline = time.time() + args.time_limit * 60 if args.time_limit else None
+    plan_store = None
+    journal = None
+    if args.command == 'plan':
+        plan_store = PlanStore(args.plan_db)
+        logger.info(f"Plan mode: recording decisions as plan {start_time} in {args.plan_db}")
+    else:
+        journal = TrashJournal(args.journal_db)
+        fetcher.journal = journal
+        fetcher.run_id = start_time
+        logger.info(f"Journaling trashed emails as run {start_time} in {args.journal_db}")
+
+    local_classifier = None
+    if args.local_model:
+        local_classifier = LocalClassifier.load(
+            threshold=args.local_threshold,
+            min_examples=args.local_min_examples
+        )
+
+    logger.info("Initializing OpenAI processor...")
+    processor = OpenAIProcessor(
+        gmail_fetcher=fetcher,
+        max_concurrent=10,
+        plan_store=plan_store,
+        run_id=start_time,
+        local_classifier=local_classifier,
+        sort_labels=args.sort,
+        hedge_policy=build_hedge_policy(args),
+        cascade=build_cascade(args),
+        budget=await build_budget(args, fetcher)
+    )
+
+    if args.stream:
+        if args.threads:
+            logger.warning("Thread mode is not available when streaming, classifying single messages")
+        pipeline = StreamingPipeline(
+            fetcher,
+            processor,
+            max_in_flight=args.max_in_flight,
+            running_flag=lambda: running and not should_stop(deadline, processor)
+        )
+        processed_count = await pipeline.run()
+    elif args.priority:
+        logger.info(f"Priority mode: ranking {args.lookahead_pages} pages ahead")
+        processed_count = await process_mailbox_prioritized(
+            fetcher,
+            processor,
+            threads=args.threads,
+            deadline=deadline,
+            lookahead_pages=max(1, args.lookahead_pages)
+        )
+    else:
+        if args.threads:
+            logger.info("Thread mode: classifying whole conversations")
+        processed_count = await process_mailbox(
+            fetcher, processor, start_time, threads=args.threads, deadline=deadline
+        )
+
+    if args.sort and not plan_store:
+        await processor.flush_labels()
+        logger.info(f"Labeled {processor.total_labeled} kept emails")
+
+    logger.info(f"=== Processing Complete ===")
+    logger.info(f"Total emails processed: {processed_count}")
+    usage = processor.usage_stats()
+    logger.info(f"OpenAI usage ({usage['prompt_version']}): {usage['requests']} requests, "
+                f"{usage['prompt_tokens']} prompt tokens ({usage['cached_tokens']} cached, "
+                f"{usage['cache_hit_rate']:.1%}), {usage['completion_tokens']} completion tokens; "
+                f"first decision after {usage['avg_first_decision']:.1f}s on average, "
+                f"{usage['requeued_emails']} emails re-requested after incomplete responses")
+    if tuner.enabled:
+        tuned = tuner.stats()
+        logger.info(f"Autotune: {tuned['values']} after {tuned['windows']} windows "
+                    f"(best {tuned['emails_per_second'] or 0:.1f} emails/s, "
+                    f"{tuned['quota_wait']:.1f}s waited on the Gmail quota)")
+        tuner.save()
+    if processor.budget:
+        await log_budget(processor.budget)
+    if processor.cascade:
+        log_cascade(processor.cascade)
+    for model, policy in processor.hedge_policies.items():
+        hedges = policy.stats()
+        logger.info(f"Hedging {model}: {hedges['hedges']} of {hedges['requests']} requests hedged "
+                    f"({hedges['hedge_rate']:.1%}), {hedges['wins']} won, {hedges['losses']} lost")
+    if local_classifier:
+        stats = processor.local_stats()
+        logger.info(f"Local classifier: {stats['local_decisions']} local / {stats['llm_decisions']} LLM decisions "
+                    f"({stats['llm_call_reduction']:.1%} fewer LLM decisions), "
+                    f"audit agreement {stats['audit_agreement']:.1%} over {stats['audited']} samples")
+        local_classifier.save()
+        local_classifier.close()
+    if plan_store:
+        logger.info(f"Plan {start_time} recorded. Review with 'review' and execute with 'apply'.")
+        plan_store.close()
+    if journal:
+        logger.info(f"Trashed emails journaled as run {start_time}; restore them with 'undo --run-id {start_time}'")
+        journal.close()
+    if fetcher.message_store:
+        fetcher.message_store.close()
+
+def run_queue_seed(args):
+    """Reset the work queue and queue the first inbox page under a new run ID"""
+    work_queue = WorkQueue(args.queue_db)
+    run_id = datetime.now().strftime('%Y%m%d_%H%M%S')
+    seed_queue(work_queue, run_id)
+    work_queue.close()
+    print(f"Seeded run {run_id} in {args.queue_db}. Start workers with 'worker --role fetch' and 'worker --role classify'.")
+
+def run_queue_status(args):
+    """Print job counts per queue"""
+    work_queue = WorkQueue(args.queue_db)
+    print(f"\n{Colors.CYAN}=== Work queue (run {work_queue.get_meta('run_id', 'none')}) ==={Colors.RESET}")
+    for queue in (LIST_QUEUE, FETCH_QUEUE, CLASSIFY_QUEUE):
+        counts = work_queue.counts(queue)
+        summary = ', '.join(f"{status}: {count}" for status, count in sorted(counts.items())) or 'empty'
+        print(f"{queue:10} {summary}")
+    work_queue.close()
+
+async def run_worker(args):
+    """Run one worker process against the shared work queue until its stage drains"""
+    work_queue = WorkQueue(args.queue_db)
+    run_id = await asyncio.to_thread(work_queue.get_meta, 'run_id')
+    if not run_id:
+        logger.error(f"No run seeded in {args.queue_db}; run 'queue-seed' first")
+        work_queue.close()
+        return
+
+    fetcher = GmailFetcher()
+    fetcher.authenticate()
+    configure_fetcher(fetcher, args)
+    tuner = await attach_tuner(fetcher, args)
+
+    if args.role == 'fetch':
+        await run_fetch_worker(fetcher, work_queue, running_flag=lambda: running, lease_seconds=args.lease)
+        tuner.save()
+        work_queue.close()
+        return
+
+    plan_store = None
+    journal = None
+    if args.plan:
+        plan_store = PlanStore(args.plan_db)
+        logger.info(f"Plan mode: recording decisions as plan {run_id} in {args.plan_db}")
+    else:
+        journal = TrashJournal(args.journal_db)
+        fetcher.journal = journal
+        fetcher.run_id = run_id
+        logger.info(f"Journaling trashed emails as run {run_id} in {args.journal_db}")
+
+    processor = OpenAIProcessor(
+        gmail_fetcher=fetcher,
+        max_concurrent=3,
+        plan_store=plan_store,
+        run_id=run_id,
+        sort_labels=args.sort,
+        hedge_policy=build_hedge_policy(args),
+        cascade=build_cascade(args),
+        budget=await build_budget(args, fetcher)
+    )
+    await processor.watch_and_process(work_queue, running_flag=lambda: running, lease_seconds=args.lease)
+
+    if args.sort and not plan_store:
+        await processor.flush_labels()
+    if processor.budget:
+        await log_budget(processor.budget)
+    if processor.cascade:
+        log_cascade(processor.cascade)
+    tuner.save()
+    if plan_store:
+        plan_store.close()
+    if journal:
+        journal.close()
+    if fetcher.message_store:
+        fetcher.message_store.close()
+    work_queue.close()
+
+def run_evaluate_classifier(args):
+    """Print offline agreement and LLM-call reduction for the local classifier"""
+    examples_path = 'cache/classifier/examples.jsonl'
+    if not os.path.exists(examples_path):
+        print(f"{Colors.YELLOW}No logged decisions found at {examples_path}{Colors.RESET}")
+        return
+
+    stats = evaluate(examples_path, threshold=args.local_threshold, min_examples=args.local_min_examples)
+    print(f"\n{Colors.CYAN}=== Local Classifier Evaluation ==={Colors.RESET}")
+    print(f"Logged LLM decisions:   {stats['examples']}")
+    print(f"Decided locally:        {stats['local']} ({stats['llm_call_reduction']:.1%} fewer LLM decisions)")
+    print(f"Agreement with LLM:     {stats['agreement']:.1%}")
+    print(f"{Colors.RED}Deleted but LLM kept:   {stats['wrongly_deleted_rate']:.1%}{Colors.RESET}")
+
+async def process_mailbox_prioritized(fetcher, processor, threads=False, deadline=None,
+                                      lookahead_pages=3, chunk_size=100):
+    """Rank several fetched pages at once and classify the highest-value emails first
+
+    Pages keep being fetched in the background while the scheduler holds fewer
+    than lookahead_pages pages of work, so a time-boxed or budget-capped run
+    spends what it has on the emails most likely to be deleted.
+    """
+    fetch_page = fetcher.fetch_next_thread_batch if threads else fetcher.fetch_next_batch
+    scheduler = PriorityScheduler()
+    processed_count = 0
+    page_size = fetcher.tuner.value('page_size')
+    page_token = None
+    exhausted = False
+    fetch_task = None
+
+    while running and not should_stop(deadline, processor):
+        # Keep the look-ahead window full
+        if fetch_task is None and not exhausted and len(scheduler) < lookahead_pages * page_size:
+            fetch_task = asyncio.create_task(asyncio.wait_for(fetch_page(page_token), timeout=60))
+
+        # Wait for a page when there is nothing to rank yet, otherwise only collect a finished one
+        if fetch_task and (fetch_task.done() or not len(scheduler)):
+            try:
+                page = await fetch_task
+            except asyncio.TimeoutError:
+                logger.error("Timeout fetching next page, retrying...")
+                page = None
             except Exception as e:
-                logger.error(f"Error in processing loop: {str(e)}")
-                if running:
-                    await asyncio.sleep(10)
-                    try:
-                        await fetcher.clear_ssl_state()
-                        current_batch = await fetcher.fetch_next_batch(current_batch.get('nextPageToken'))
-                    except Exception as inner_e:
-                        logger.error(f"Failed to recover: {str(inner_e)}")
-                        break
-                else:
+                logger.error(f"Error fetching next page: {str(e)}")
+                page = None
+            fetch_task = None
+
+            if page and page.get('messages'):
+                scheduler.push_many(page['messages'])
+                page_token = page.get('nextPageToken')
+                exhausted = not page_token
+                logger.info(f"Queued {len(page['messages'])} emails ({len(scheduler)} waiting)")
+            elif page is not None or not len(scheduler):
+                # An empty page ends the mailbox; a failed one is retried unless there is nothing to do
+                exhausted = True
+            continue
+
+        if not len(scheduler):
+            break
+
+        batch = scheduler.pop(chunk_size)
+        await processor.process_messages(batch, pause=0)
+        processed_count += len(batch)
+
+    if fetch_task:
+        fetch_task.cancel()
+    return processed_count
+
+def resolve_run_id(plan_store, run_id):
+    """Return the requested plan run, falling back to the latest one"""
+    run_id = run_id or plan_store.latest_run_id()
+    if not run_id:
+        print(f"{Colors.YELLOW}No recorded plans found{Colors.RESET}")
+    return run_id
+
+def run_review(args):
+    """Print a summary of a recorded plan before anything is trashed"""
+    plan_store = PlanStore(args.plan_db)
+    try:
+        run_id = resolve_run_id(plan_store, args.run_id)
+        if not run_id:
+            return
+
+        summary = plan_store.summary(run_id)
+        print(f"\n{Colors.CYAN}=== Plan {run_id} ==={Colors.RESET}")
+        for decision, counts in sorted(summary.items()):
+            color = Colors.RED if decision == 'DELETE' else Colors.GREEN
+            print(f"{color}{decision:<8}{Colors.RESET} {counts['total']} "
+                  f"({counts['applied']} applied)")
+
+        print(f"\n{Colors.CYAN}Top senders marked DELETE:{Colors.RESET}")
+        for sender, total in plan_store.top_senders(run_id):
+            print(f"{total:>6}  {sender}")
+    finally:
+        plan_store.close()
+
+async def run_apply(args):
+    """Trash everything a plan marked DELETE, resuming where a previous apply stopped"""
+    plan_store = PlanStore(args.plan_db)
+    journal = TrashJournal(args.journal_db)
+    message_store = open_message_store(args)
+    try:
+        run_id = resolve_run_id(plan_store, args.run_id)
+        if not run_id:
+            return
+
+        batch_size = max(1, min(args.batch_size, 1000))
+        summary = plan_store.summary(run_id).get('DELETE', {'total': 0, 'applied': 0})
+        total = summary['total']
+        applied = summary['applied']
+        logger.info(f"Applying plan {run_id}: {total - applied} of {total} deletions pending")
+
+        fetcher = GmailFetcher()
+        fetcher.authenticate()
+        # Journal under the plan's run ID so 'undo --run-id' matches 'apply --run-id'
+        fetcher.journal = journal
+        fetcher.run_id = run_id
+        fetcher.message_store = message_store
+
+        if not await trash_plan_deletes(fetcher, plan_store, run_id, batch_size, applied, total,
+                                        verify=args.verify, message_store=message_store):
+            return
+
+        if args.sort and running:
+            await apply_plan_labels(fetcher, plan_store, run_id)
+    finally:
+        plan_store.close()
+        journal.close()
+        if message_store:
+            message_store.close()
+
+async def split_by_state(fetcher, email_ids, wanted, message_store=None):
+    """Check emails' current labels and split them into (actionable, settled)
+
+    Actionable emails pass the wanted(labels) test. Settled ones are gone from
+    Gmail or fail it, so there is nothing to do for them; they are dropped from
+    the message store when they are gone or no longer in the inbox. Returns
+    None when some states could not be read, so the caller stops and can be rerun.
+    """
+    states = await fetcher.message_states(email_ids)
+    unknown = [email_id for email_id in email_ids if email_id not in states]
+    actionable = [email_id for email_id in email_ids if states.get(email_id) and wanted(states[email_id]['labels'])]
+    settled = [email_id for email_id in email_ids if email_id in states and email_id not in actionable]
+
+    if message_store:
+        message_store.delete_many([
+            email_id for email_id in settled
+            if states[email_id] is None or 'INBOX' not in states[email_id]['labels']
+        ])
+        message_store.update_labels({email_id: states[email_id] for email_id in actionable})
+    if settled:
+        logger.info(f"Skipping {len(settled)} emails whose state changed since they were classified")
+    if unknown:
+        logger.error(f"Could not check the current state of {len(unknown)} emails")
+        return None
+    return actionable, settled
+
+async def trash_plan_deletes(fetcher, plan_store, run_id, batch_size, applied, total,
+                             verify=False, message_store=None):
+    """Trash a plan's pending deletions in batches; False if a batch failed
+
+    With verify, emails no longer in the inbox (trashed, archived or purged
+    since the plan was made) are marked applied without another trash call.
+    """
+    while running:
+        email_ids = plan_store.pending_deletes(run_id, limit=batch_size)
+        if not email_ids:
+            break
+
+        if verify:
+            split = await split_by_state(
+                fetcher, email_ids, lambda labels: 'INBOX' in labels and 'TRASH' not in labels, message_store
+            )
+            if split is None:
+                print(f"{Colors.RED}Apply stopped - rerun to resume plan {run_id}{Colors.RESET}")
+                return False
+            email_ids, settled = split
+            plan_store.mark_applied(run_id, settled)
+            total -= len(settled)
+            if not email_ids:
+                continue
+
+        reasons = plan_store.reasons_for(run_id, email_ids)
+        if not await fetcher.batch_trash_emails(email_ids, reasons):
+            logger.error(f"Failed to trash batch of {len(email_ids)} emails, stopping apply")
+            print(f"{Colors.RED}Apply stopped - rerun to resume plan {run_id}{Colors.RESET}")
+            return False
+
+        plan_store.mark_applied(run_id, email_ids)
+        applied += len(email_ids)
+        print(f"{Colors.GREEN}Trashed {applied}/{total} emails{Colors.RESET}")
+
+    logger.info(f"=== Apply Complete: {applied}/{total} emails trashed ===")
+    return True
+
+async def classify_stored(processor, message_store, deadline=None):
+    """Feed stored records to the processor with several sub-batches in flight
+
+    Nothing is fetched from Gmail, so the only limit is how fast OpenAI answers:
+    max_concurrent sub-batches run at once, and reading ahead from SQLite is
+    bounded to a couple of sub-batches per worker.
+    """
+    pages = asyncio.Queue(maxsize=processor.max_concurrent * 2)
+    processed = 0
+
+    async def read_pages():
+        after_id = None
+        try:
+            while running and not should_stop(deadline, processor):
+                page = await asyncio.to_thread(message_store.page, after_id, processor.tuner.value('sub_batch'))
+                if not page:
                     break
-        
-        logger.info(f"=== Processing Complete ===")
-        logger.info(f"Total emails processed: {processed_count}")
-        
+                after_id = page[-1].message_id
+                await pages.put(page)
+        finally:
+            for _ in range(processor.max_concurrent):
+                await pages.put(None)
+
+    async def classify_pages():
+        nonlocal processed
+        while True:
+            page = await pages.get()
+            if page is None:
+                return
+            if should_stop(deadline, processor):
+                continue
+            try:
+                await processor.process_messages(page, pause=0)
+                processed += len(page)
+            except Exception as e:
+                logger.error(f"Error reclassifying {len(page)} stored messages: {str(e)}")
+
+    await asyncio.gather(read_pages(), *(classify_pages() for _ in range(processor.max_concurrent)))
+    return processed
+
+async def run_reclassify(args):
+    """Classify the message store into a new plan and apply only what differs from the last one"""
+    if not os.path.exists(args.message_db):
+        print(f"{Colors.YELLOW}No stored messages at {args.message_db}; run 'run' or 'plan' first{Colors.RESET}")
+        return
+
+    message_store = MessageStore(args.message_db)
+    plan_store = PlanStore(args.plan_db)
+    journal = None
+    try:
+        baseline = args.against or plan_store.latest_run_id()
+        run_id = datetime.now().strftime('%Y%m%d_%H%M%S')
+        deadline = time.time() + args.time_limit * 60 if args.time_limit else None
+        logger.info(f"Reclassifying {message_store.count()} stored messages as plan {run_id} "
+                    f"(store current to historyId {message_store.latest_history_id()}), "
+                    f"comparing with {baseline or 'no previous plan'}")
+
+        # Gmail is not contacted while classifying; the fetcher only supplies sizes and, with --apply, the API
+        fetcher = GmailFetcher()
+        local_classifier = None
+        if args.local_model:
+            local_classifier = LocalClassifier.load(
+                threshold=args.local_threshold,
+                min_examples=args.local_min_examples
+            )
+        processor = OpenAIProcessor(
+            gmail_fetcher=fetcher,
+            max_concurrent=10,
+            plan_store=plan_store,
+            run_id=run_id,
+            local_classifier=local_classifier,
+            sort_labels=args.sort,
+            hedge_policy=build_hedge_policy(args),
+            cascade=build_cascade(args),
+            budget=await build_budget(args, fetcher, total_emails=message_store.count())
+        )
+
+        start = time.time()
+        processed = await classify_stored(processor, message_store, deadline)
+        elapsed = time.time() - start
+        logger.info(f"Reclassified {processed} messages in {elapsed:.1f}s "
+                    f"({processed / elapsed if elapsed else 0:.1f} emails/s)")
+        if processor.budget:
+            await log_budget(processor.budget)
+        if processor.cascade:
+            log_cascade(processor.cascade)
+        if local_classifier:
+            local_classifier.save()
+            local_classifier.close()
+
+        changes = plan_store.carry_over_applied(run_id, baseline) if baseline else {}
+        print(f"\n{Colors.CYAN}=== Plan {run_id} vs {baseline or 'nothing'} ==={Colors.RESET}")
+        for (previous, current), total in sorted(changes.items(), key=lambda item: -item[1]):
+            color = Colors.RED if current == 'DELETE' else Colors.GREEN
+            print(f"{previous or 'new':<8} -> {color}{current:<8}{Colors.RESET} {total}")
+        if not args.apply:
+            print(f"Trash the new deletions with 'apply --run-id {run_id} --verify', "
+                  f"or pass --apply next time to also restore deletions this plan reverses")
+            return
+
+        journal = TrashJournal(args.journal_db)
+        fetcher.authenticate()
+        fetcher.journal = journal
+        fetcher.run_id = run_id
+        fetcher.message_store = message_store
+        batch_size = max(1, min(args.batch_size, 1000))
+
+        summary = plan_store.summary(run_id).get('DELETE', {'total': 0, 'applied': 0})
+        if not await trash_plan_deletes(fetcher, plan_store, run_id, batch_size, summary['applied'],
+                                        summary['total'], verify=True, message_store=message_store):
+            return
+        if baseline:
+            await restore_reversed_deletes(fetcher, plan_store, journal, message_store, run_id, baseline, batch_size)
+        if args.sort and running:
+            await apply_plan_labels(fetcher, plan_store, run_id)
+    finally:
+        message_store.close()
+        plan_store.close()
+        if journal:
+            journal.close()
+
+async def restore_reversed_deletes(fetcher, plan_store, journal, message_store, run_id, baseline, batch_size):
+    """Take emails the baseline plan trashed but this plan keeps back out of trash"""
+    restored = 0
+    while running:
+        email_ids = plan_store.reversed_deletes(run_id, baseline, limit=batch_size)
+        if not email_ids:
+            break
+
+        # Only emails still in trash can be restored; purged or already restored ones are settled
+        split = await split_by_state(fetcher, email_ids, lambda labels: 'TRASH' in labels, message_store)
+        if split is None:
+            print(f"{Colors.RED}Restore stopped - rerun 'reclassify --against {baseline} --apply' to resume{Colors.RESET}")
+            return
+        email_ids, settled = split
+        plan_store.mark_unapplied(baseline, settled)
+        if not email_ids:
+            continue
+
+        if not await fetcher.batch_restore_emails(email_ids):
+            logger.error(f"Failed to restore batch of {len(email_ids)} emails, stopping")
+            print(f"{Colors.RED}Restore stopped - rerun 'reclassify --against {baseline} --apply' to resume{Colors.RESET}")
+            return
+        # The baseline's trash call is undone, so it no longer counts as applied
+        plan_store.mark_unapplied(baseline, email_ids)
+        journal.mark(baseline, email_ids, 'restored')
+        restored += len(email_ids)
+        print(f"{Colors.GREEN}Restored {restored} emails this plan keeps{Colors.RESET}")
+
+async def run_undo(args):
+    """Restore a run's trashed emails from the journal, resuming where a previous undo stopped"""
+    journal = TrashJournal(args.journal_db)
+    message_store = None
+    try:
+        if args.list:
+            print(f"\n{Colors.CYAN}=== Journaled runs ==={Colors.RESET}")
+            for run in journal.runs():
+                print(f"{run['run_id']:<20} trashed: {run['trashed']:<8} restored: {run['restored']:<8} "
+                      f"unconfirmed: {run['unconfirmed']}")
+            return
+
+        run_id = args.run_id or journal.latest_run_id()
+        if not run_id:
+            print(f"{Colors.YELLOW}Nothing has been journaled yet{Colors.RESET}")
+            return
+
+        total = journal.count_restorable(run_id, args.reason_contains, args.since)
+        logger.info(f"Undoing run {run_id}: {total} emails to restore")
+
+        fetcher = GmailFetcher()
+        fetcher.authenticate()
+        # Emails put back in the inbox are fetched into the store again
+        fetcher.message_store = message_store = open_message_store(args)
+
+        restored = 0
+        while running:
+            entries = journal.restorable(run_id, 1000, args.reason_contains, args.since)
+            if not entries:
+                break
+
+            # Sent and archived thread messages only leave trash; only inbox messages go back to the inbox
+            groups = {True: [], False: []}
+            for message_id, labels in entries:
+                groups[labels is None or 'INBOX' in labels].append(message_id)
+            for to_inbox, email_ids in groups.items():
+                if not email_ids:
+                    continue
+                if not await fetcher.batch_restore_emails(email_ids, to_inbox=to_inbox):
+                    logger.error(f"Failed to restore batch of {len(email_ids)} emails, stopping undo")
+                    print(f"{Colors.RED}Undo stopped - rerun to resume run {run_id}{Colors.RESET}")
+                    return
+
+                journal.mark(run_id, email_ids, 'restored')
+                restored += len(email_ids)
+            print(f"{Colors.GREEN}Restored {restored}/{total} emails{Colors.RESET}")
+
+        logger.info(f"=== Undo Complete: {restored}/{total} emails restored ===")
+    finally:
+        journal.close()
+        if message_store:
+            message_store.close()
+
+async def apply_plan_labels(fetcher, plan_store, run_id):
+    """Label a plan's KEEP emails by category, one batchModify per label set and 1000 IDs"""
+    labeled = 0
+    while running:
+        pending = plan_store.pending_labels(run_id)
+        if not pending:
+            break
+
+        groups = {}
+        for message_id, category in pending:
+            groups.setdefault(labels_for_categories(category), []).append(message_id)
+
+        for label_names, email_ids in groups.items():
+            for i in range(0, len(email_ids), 1000):
+                chunk = email_ids[i:i + 1000]
+                if label_names and not await fetcher.batch_apply_labels(chunk, label_names):
+                    print(f"{Colors.RED}Labeling stopped - rerun to resume plan {run_id}{Colors.RESET}")
+                    return
+                # Uncategorized KEEP rows are marked too so they are not fetched again
+                plan_store.mark_applied(run_id, chunk)
+                labeled += len(chunk) if label_names else 0
+
+        print(f"{Colors.GREEN}Labeled {labeled} kept emails{Colors.RESET}")
+
+    logger.info(f"=== Sorting Complete: {labeled} emails labeled ===")
+
+async def main(args=None):
+    if args is None:
+        args = parse_args()
+
+    if args.log_format:
+        set_log_format(args.log_format)
+    enable_file_logging()
+    logger.info("=== Starting Email Processing ===")
+    signal.signal(signal.SIGINT, signal_handler)
+
+    profiler = None
+    block_detector = None
+    if args.profile:
+        profiler = SamplingProfiler(interval=args.profile_interval_ms / 1000)
+        block_detector = LoopBlockDetector(threshold=args.block_threshold_ms / 1000)
+        profiler.start()
+        block_detector.start()
+        logger.info(f"Profiling every {args.profile_interval_ms:g} ms, "
+                    f"flagging event loop blocks over {args.block_threshold_ms:g} ms")
+
+    try:
+        if args.startup_profile:
+            if not report_startup(args.startup_budget_ms):
+                print(f"{Colors.RED}Startup import time is over budget{Colors.RESET}")
+                # Non-zero exit so CI or a pre-commit hook can fail on an import-time regression
+                sys.exit(1)
+        elif args.command == 'review':
+            run_review(args)
+        elif args.command == 'undo':
+            await run_undo(args)
+        elif args.command == 'evaluate-classifier':
+            run_evaluate_classifier(args)
+        elif args.command == 'apply':
+            await run_apply(args)
+        elif args.command == 'reclassify':
+            await run_reclassify(args)
+        elif args.command == 'queue-seed':
+            run_queue_seed(args)
+        elif args.command == 'queue-status':
+            run_queue_status(args)
+        elif args.command == 'worker':
+            await run_worker(args)
+        else:
+            await run_classification(args)
+
     except Exception as e:
         logger.error(f"Process failed: {str(e)}", exc_info=True)
         raise
 
+    finally:
+        if profiler:
+            write_profile(args, profiler, block_detector)
+
+def write_profile(args, profiler, block_detector):
+    """Stop profiling and write collapsed stacks, stage summary and loop blocks"""
+    profiler.stop()
+    block_detector.stop()
+    directory = os.path.join(args.profile_dir, datetime.now().strftime('%Y%m%d_%H%M%S'))
+    stacks_path = profiler.write(directory)
+    block_detector.write(directory)
+    print(f"\n{Colors.CYAN}=== Profile ==={Colors.RESET}")
+    print(profiler.stage_summary())
+    print(f"{len(block_detector.blocks)} event loop blocks over {args.block_threshold_ms:g} ms")
+    logger.info(f"Profile written to {directory}; render with 'flamegraph.pl {stacks_path} > flame.svg' "
+                f"or open it in speedscope")
+
 if __name__ == "__main__":
     try:
         logger.info("Starting application...")
@@ -0,0 +1,127 @@
+import os
+import json
+import zlib
+import sqlite3
+import threading
+from datetime import datetime
+from .records import EmailRecord
+from .utils.logger import setup_logger
+
+logger = setup_logger()
+
+# Parsed fields kept per message, stored as one compressed JSON list in this order
+RECORD_FIELDS = ('subject', 'sender', 'body', 'has_attachments', 'labels', 'size')
+
+def pack_record(record):
+    return zlib.compress(json.dumps([record.get(field) for field in RECORD_FIELDS],
+                                    separators=(',', ':')).encode('utf-8'))
+
+def unpack_record(message_id, history_id, blob):
+    values = json.loads(zlib.decompress(blob).decode('utf-8'))
+    return EmailRecord(message_id, *values, history_id=history_id)
+
+class MessageStore:
+    """Local SQLite store of parsed messages keyed by message ID
+
+    Holds only what `GmailFetcher._parse_message` produces, compressed, along
+    with the message's historyId. A row is rewritten only when Gmail reports a
+    newer historyId, so refetching an unchanged page costs no writes. The
+    reclassify command reads it back without contacting Gmail.
+    """
+
+    def __init__(self, db_path='cache/messages.db'):
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.db_path = db_path
+        # Written from fetch threads and read from the event loop, one statement at a time
+        self.conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self._lock = threading.Lock()
+        self._create_tables()
+
+    def _create_tables(self):
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS messages (
+                message_id TEXT PRIMARY KEY,
+                history_id INTEGER,
+                record BLOB NOT NULL,
+                stored_at TEXT NOT NULL
+            ) WITHOUT ROWID
+        """)
+        self.conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_messages_history
+            ON messages (history_id)
+        """)
+        self.conn.commit()
+
+    def put_many(self, records):
+        """Store parsed records, skipping ones without a historyId (parse failures)"""
+        now = datetime.now().isoformat(timespec='seconds')
+        values = [
+            (record['message_id'], int(record.get('history_id')), pack_record(record), now)
+            for record in records if record.get('history_id')
+        ]
+        if not values:
+            return 0
+        with self._lock, self.conn:
+            self.conn.executemany("""
+                INSERT INTO messages (message_id, history_id, record, stored_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (message_id) DO UPDATE SET
+                    history_id = excluded.history_id, record = excluded.record, stored_at = excluded.stored_at
+                WHERE excluded.history_id > messages.history_id
+            """, values)
+        logger.debug(f"Stored {len(values)} parsed messages")
+        return len(values)
+
+    def update_labels(self, states):
+        """Refresh stored labels from message_id -> {'labels', 'history_id'} states"""
+        records = []
+        for message_id, state in states.items():
+            record = self.get(message_id)
+            if record is None or not state:
+                continue
+            record.labels = tuple(state['labels'])
+            record.history_id = state.get('history_id') or record.history_id
+            records.append(record)
+        return self.put_many(records)
+
+    def delete_many(self, message_ids):
+        """Drop messages that are gone from Gmail or no longer in the inbox"""
+        with self._lock, self.conn:
+            self.conn.executemany("DELETE FROM messages WHERE message_id = ?",
+                                  [(message_id,) for message_id in message_ids])
+
+    def get(self, message_id):
+        """Return the stored EmailRecord for a message, or None"""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT history_id, record FROM messages WHERE message_id = ?", (message_id,)
+            ).fetchone()
+        return unpack_record(message_id, row[0], row[1]) if row else None
+
+    def page(self, after_id=None, limit=500):
+        """Return up to limit records ordered by message ID, starting after after_id"""
+        with self._lock:
+            rows = self.conn.execute("""
+                SELECT message_id, history_id, record FROM messages
+                WHERE message_id > ?
+                ORDER BY message_id
+                LIMIT ?
+            """, (after_id or '', limit)).fetchall()
+        return [unpack_record(*row) for row in rows]
+
+    def count(self):
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+
+    def latest_history_id(self):
+        """Highest historyId stored, i.e. how current the store is"""
+        with self._lock:
+            return self.conn.execute("SELECT MAX(history_id) FROM messages").fetchone()[0]
+
+    def close(self):
+        self.conn.close()
+
+__all__ = ['MessageStore', 'RECORD_FIELDS']
@@ -2,17 +2,15 @@ import os
 import json
 import time
 import asyncio
-from openai import AsyncOpenAI
+import random
 from dotenv import load_dotenv
-from .utils.logger import setup_logger
+from .utils.logger import setup_logger, HOT
+from .labels import CATEGORIES, labels_for_categories, guess_category
+from .decision_stream import DecisionStreamParser
+from .workers import LIST_QUEUE, FETCH_QUEUE, CLASSIFY_QUEUE, worker_id, hold_lease, requeue_remainder
 import sys
-import subprocess
 from datetime import datetime
 
-# Enable ANSI colors in Windows
-if sys.platform == "win32":
-    subprocess.run("", shell=True)
-
 # ANSI color codes
 class Colors:
     CYAN = '\033[96m'
@@ -25,13 +23,118 @@ class Colors:
 load_dotenv()
 logger = setup_logger()
 
+# Bump whenever the static instructions below change, so cached-token stats
+# and recorded decisions can be tied to the prompt that produced them
+PROMPT_VERSION = "batch-v6"
+
+# Most streamed decisions acted on together, i.e. in one plan_store transaction
+DECISION_GROUP_SIZE = 25
+
+# Static instructions sent first on every request. Keeping this byte-for-byte
+# identical lets the provider reuse its cached prefix; per-request email content
+# always goes after it. OpenAI caches only prefixes of 1024 tokens or more, so the
+# neutral reference sections (input format, categories, field reference, JSON
+# rules) are spelled out in full to keep this above that on its own. The
+# retention principles are the original ones, word for word.
+BATCH_INSTRUCTIONS = f"""You are an email retention assistant. You must respond with valid JSON only.
+Prompt version: {PROMPT_VERSION}
+
+Act as an intelligent email assistant to organize and retain emails carefully. Your goal is to ensure no potentially important emails are lost, especially those that may hold value or be needed in the future. Always err on the side of caution, keeping emails unless their irrelevance is absolutely certain.
+
+Input format:
+- You will receive a list of emails, separated by lines containing only "---"
+- Each entry starts with "Email ID:", followed by "Subject:", "From:", "Has Attachments:" (True or False) and "Body:"
+- The body has been converted to plain text and cleaned; it may be shortened, and it may be empty when the email could not be parsed
+- Entries marked Thread are whole conversations: the body shown is the latest message, the thread line lists how many messages it holds and up to five participants, and your decision applies to every message in the thread
+- "Email ID" is an opaque identifier made of letters and digits; it carries no meaning about the email itself
+- "From" is the sender as written in the email header, usually a display name followed by an address in angle brackets, for example: Jane Doe <jane@example.com>
+- "Subject" is the subject line as sent; it may be empty, and it may start with prefixes such as "Re:" or "Fwd:"
+- "Has Attachments" is True when any part of the email is a file attachment, and False otherwise
+- Links, images and formatting have been removed from the body, so wording such as "click here" may refer to a link you cannot see
+- The first line of the request states how many emails follow; every one of them needs an entry in your answer
+
+Analysis principles:
+1. RETAIN if there are attachments, calendar invites, or future events/deadlines
+2. Consider sender importance and contact frequency
+3. Evaluate ongoing discussion/project context
+4. Delete promotional/social emails unless they contain:
+   - Purchase/signup evidence
+   - Personal relevance
+   - Future reference value
+5. Be cautious - keep if uncertain
+
+Category:
+- Also give each email exactly one category from: {", ".join(CATEGORIES)}
+- Use "other" when nothing fits; the category is used for sorting and does not change the KEEP/DELETE decision
+- When more than one category fits, pick the one that describes the main purpose of the email
+
+Category definitions:
+- receipts: order confirmations, invoices, payment confirmations, shipping and delivery notices for a purchase, refunds
+- finance: banking, card and account statements, bills, loans, investments, insurance, tax documents and pay slips
+- travel: flight, train, hotel and car bookings, tickets, boarding passes, itineraries, check-in reminders
+- work: messages from colleagues, clients or partners, meeting invitations, project discussions, job applications
+- personal: messages from friends and family, personal conversations, private invitations
+- newsletters: regular editorial mailings, digests and blog or publication updates the recipient subscribed to
+- promotions: marketing, sales, discounts, coupons, product announcements and other advertising
+- social: notifications from social networks and community sites, such as messages, mentions, friend requests
+- notifications: automated account and service messages, such as sign-in alerts, password resets, reminders, status updates
+- other: anything that fits none of the categories above
+
+Confidence:
+- Give a confidence between 0 and 1 that your decision is the one a careful human would make
+- Use 0.9 or more only when the email plainly matches the principles above; use less whenever you hesitated
+
+Reason guidelines:
+- Write one or two plain sentences that name the deciding principle(s) by number
+- Mention the concrete evidence you relied on (for example "order number", "meeting date", "discount campaign")
+- Do not repeat the full body, and do not invent details that are not in the email
+
+Field reference:
+- "email_id": the Email ID of the entry, copied exactly, character for character
+- "subject": the Subject of the entry, copied as given
+- "decision": "KEEP" or "DELETE"
+- "category": one category name from the definitions above
+- "confidence": a number from 0 to 1 with at most two decimal places
+- "reason": a short explanation following the reason guidelines above
+
+Output rules:
+- Use the exact Email ID you were given for each entry; never merge, skip or reorder entries
+- Copy the subject as given; use an empty string if the email has no subject
+- "decision" is exactly "KEEP" or "DELETE" in capitals; "category" is one of the names listed above in lower case
+- "confidence" is a number, not a string; "reason" is a single line of text
+- Write each entry in full before starting the next one; entries are read as soon as they are complete
+- Do not add fields, comments or text outside the JSON object
+
+JSON rules:
+- Use double quotes for every key and every string value
+- Escape double quotes and backslashes inside strings with a backslash, and write line breaks as \\n
+- Do not put a comma after the last entry of the list or the last field of an entry
+- Do not wrap the JSON in code fences or markdown
+- Write numbers with a dot as the decimal separator, for example 0.85
+
+Return ONLY a JSON object in this format, with exactly one entry per email, in the order the emails were given:
+{{
+    "decisions": [
+        {{
+            "email_id": "message_id",
+            "subject": "email subject",
+            "decision": "KEEP|DELETE",
+            "category": "one of the categories above",
+            "confidence": 0.95,
+            "reason": "explanation"
+        }}
+    ]
+}}"""
+
 class OpenAIProcessor:
-    def __init__(self, gmail_fetcher, max_concurrent=3):
-        api_key = os.getenv('OPENAI_API_KEY')
-        if not api_key:
+    def __init__(self, gmail_fetcher, max_concurrent=3, plan_store=None, run_id=None,
+                 local_classifier=None, local_audit_rate=0.05, sort_labels=False, hedge_policy=None,
+                 budget=None, cascade=None):
+        self.api_key = os.getenv('OPENAI_API_KEY')
+        if not self.api_key:
             raise ValueError("OPENAI_API_KEY not found in environment variables")
             
-        self.client = AsyncOpenAI(api_key=api_key)
+        self._client = None  # built on first request, see client
         self.model = "gpt-4o-mini"
         self.processed_batches = set()
         self.gmail_fetcher = gmail_fetcher
@@ -40,13 +143,63 @@ class OpenAIProcessor:
         self.total_deleted = 0
         self.start_time = time.time()
         self.delete_queue = []
+        self.thread_delete_queue = []  # (thread_id, message_ids, reason, labels by message ID)
+        self.delete_reasons = {}
+        self.delete_labels = {}  # labels at fetch time, journaled so undo can restore them
         self.max_concurrent = max_concurrent
         self.semaphore = asyncio.Semaphore(max_concurrent * 5)
         self.status_line = "=== Email Processing Active ==="
-        
-        # Setup console display
-        print("\033[?25l")  # Hide cursor
-        self.clear_console()
+
+        # Plan mode: record decisions instead of trashing
+        self.plan_store = plan_store
+        self.run_id = run_id
+
+        # Sorting: KEEP emails are grouped by target label set and labeled in bulk
+        self.sort_labels = sort_labels
+        self.label_groups = {}
+        self.total_labeled = 0
+
+        # Local model decides confident emails; the rest go to the LLM
+        self.local_classifier = local_classifier
+        self.local_audit_rate = local_audit_rate if local_classifier else 0
+        self.local_decisions = 0
+        self.llm_decisions = 0
+        self.audit_total = 0
+        self.audit_agreed = 0
+        self._audit_predictions = {}
+        self._local_saved_at = local_classifier.examples_seen if local_classifier else 0
+
+        # Token usage from response.usage, including provider-cached prompt tokens
+        self.requests_made = 0
+        self.total_prompt_tokens = 0
+        self.total_cached_tokens = 0
+        self.total_completion_tokens = 0
+
+        # Streamed responses: emails left without a decision are asked about again
+        self.stream_retries = 2
+        self.requeued_emails = 0
+        self.first_decision_latency = 0.0
+        self.first_decision_samples = 0
+
+        # Optional hedging: a duplicate request when one runs past the latency percentile.
+        # Latencies differ by model, so each model gets its own policy with the same settings.
+        self.hedge_policy = hedge_policy
+        self.hedge_policies = {}
+
+        # Optional spend cap; once exhausted no new requests are made
+        self.budget = budget
+
+        # Optional model cascade: the first tier decides, unsure or high-stakes emails go to the second
+        self.cascade = cascade
+        self._escalations = {}  # message_id -> (first-tier result, reason)
+        if cascade:
+            self.model = cascade.tier1_model
+
+        # Sub-batch, trash batch and flush sizes, shared with the fetcher
+        self.tuner = gmail_fetcher.tuner
+
+        # Console display is set up on the first update, not at start-up
+        self._console_ready = False
         self.output_buffer = []
         
         logger.info(f"OpenAI processor initialized with model: {self.model} (max concurrent: {max_concurrent})")
@@ -55,12 +208,29 @@ class OpenAIProcessor:
         self.batch_processed = 0
         self.previous_batch_rate = 0
 
+    @property
+    def budget_exhausted(self):
+        return bool(self.budget and self.budget.exhausted)
+
+    @property
+    def client(self):
+        """OpenAI client, imported and constructed on first use"""
+        if self._client is None:
+            from openai import AsyncOpenAI
+            self._client = AsyncOpenAI(api_key=self.api_key)
+        return self._client
+
     def clear_console(self):
         """Clear the console screen"""
         print("\033[2J\033[H", end="")
         
     def update_display(self):
         """Update the console display with better formatting"""
+        if not self._console_ready:
+            if sys.platform == "win32":
+                os.system("")  # Enable ANSI colors in Windows
+            print("\033[?25l")  # Hide cursor
+            self._console_ready = True
         self.clear_console()
         
         # Print fixed header
@@ -69,6 +239,23 @@ class OpenAIProcessor:
               f"Kept: {self.total_kept} | "
               f"Deleted: {self.total_deleted}{Colors.RESET}")
         print(f"{Colors.MAGENTA}Processing Rate: {self._calculate_rate():.1f} emails/sec{Colors.RESET}")
+        if self.requests_made:
+            usage = self.usage_stats()
+            print(f"{Colors.MAGENTA}Prompt tokens: {usage['prompt_tokens']} | "
+                  f"Cached: {usage['cache_hit_rate']:.0%}{Colors.RESET}")
+        if self.budget:
+            spend = self.budget.stats()
+            projected = f"${spend['projected_total']:.2f}" if spend['projected_total'] is not None else "n/a"
+            print(f"{Colors.MAGENTA}Spend: ${spend['run_spent']:.3f} (today ${spend['day_spent']:.3f}) | "
+                  f"Projected to finish: {projected}{Colors.RESET}")
+        if self.cascade:
+            stats = self.cascade.stats()
+            print(f"{Colors.MAGENTA}Tier 1: {stats['tiers'][1]['decisions']} | Tier 2: {stats['tiers'][2]['decisions']} | "
+                  f"Escalated: {stats['escalation_rate']:.0%}{Colors.RESET}")
+        if self.local_classifier:
+            stats = self.local_stats()
+            print(f"{Colors.MAGENTA}Local: {stats['local_decisions']} | LLM: {stats['llm_decisions']} | "
+                  f"LLM calls saved: {stats['llm_call_reduction']:.0%}{Colors.RESET}")
         print(f"{Colors.CYAN}{'='*40}{Colors.RESET}\n")
         
         # Show only last 5 decisions to prevent cluttering
@@ -105,144 +292,528 @@ class OpenAIProcessor:
         
     async def process_delete_queue(self):
         if self.delete_queue:
-            for email_id in self.delete_queue:
-                success = await self.gmail_fetcher.delete_email(email_id)
+            # Take the queue first; decisions keep arriving while the trash calls run
+            email_ids = list(self.delete_queue)
+            self.delete_queue.clear()
+            trash_batch = self.tuner.value('trash_batch')
+            for i in range(0, len(email_ids), trash_batch):
+                batch = email_ids[i:i + trash_batch]
+                reasons = {email_id: self.delete_reasons.pop(email_id, None) for email_id in batch}
+                labels = {email_id: self.delete_labels.pop(email_id) for email_id in batch
+                          if email_id in self.delete_labels}
+                self.tuner.record_requests()
+                if await self.gmail_fetcher.batch_trash_emails(batch, reasons, labels):
+                    self.add_to_buffer(f"Moved {len(batch)} emails to trash", Colors.GREEN)
+                else:
+                    self.tuner.record_error()
+                    self.add_to_buffer(f"Failed to trash {len(batch)} emails", Colors.RED)
+
+        if self.thread_delete_queue:
+            threads = list(self.thread_delete_queue)
+            self.thread_delete_queue.clear()
+            for thread_id, message_ids, reason, labels in threads:
+                success = await self.gmail_fetcher.trash_thread(thread_id, message_ids, reason, labels)
                 if success:
-                    self.add_to_buffer(f"Successfully deleted email: {email_id}", Colors.GREEN)
+                    self.add_to_buffer(f"Successfully deleted thread: {thread_id}", Colors.GREEN)
                 else:
-                    self.add_to_buffer(f"Failed to delete email: {email_id}", Colors.RED)
-            self.delete_queue.clear()
+                    self.add_to_buffer(f"Failed to delete thread: {thread_id}", Colors.RED)
 
     async def process_batch(self, batch_file):
         try:
             with open(batch_file, 'r') as f:
                 messages = json.load(f)
-            
-            sub_batch_size = 50
-            sub_batches = [
-                messages[i:i + sub_batch_size] 
-                for i in range(0, len(messages), sub_batch_size)
-            ]
-            
-            for i, sub_batch in enumerate(sub_batches):
-                try:
-                    await self._process_sub_batch(sub_batch, i + 1, len(sub_batches))
-                    if self.delete_queue:
-                        await self.process_delete_queue()
-                    if i < len(sub_batches) - 1:
-                        await asyncio.sleep(2)
-                except Exception as e:
-                    logger.error(f"Error in sub-batch {i + 1}: {str(e)}")
-                    continue
-            
+
+            await self.process_messages(messages)
+
             # Mark batch as processed
             self.processed_batches.add(batch_file)
-            
+
         except Exception as e:
             logger.error(f"Error processing batch {batch_file}: {str(e)}")
             raise
 
+    async def process_messages(self, messages, pause=2):
+        """Classify parsed messages in sub-batches and act on the decisions
+
+        Returns the message IDs left without a decision (failed requests, or
+        the budget running out), so queue workers can hand them back.
+        """
+        undecided = []
+        sub_batch_size = self.tuner.value('sub_batch')
+        sub_batches = [
+            messages[i:i + sub_batch_size]
+            for i in range(0, len(messages), sub_batch_size)
+        ]
+
+        for i, sub_batch in enumerate(sub_batches):
+            if self.budget_exhausted:
+                # Checkpoint: everything decided so far has been acted on; the rest waits for the next run
+                logger.info(f"Budget exhausted, leaving {sum(len(batch) for batch in sub_batches[i:])} emails unclassified")
+                undecided.extend(email['message_id'] for batch in sub_batches[i:] for email in batch)
+                break
+            try:
+                undecided.extend(await self._process_sub_batch(sub_batch, i + 1, len(sub_batches)))
+                if self.delete_queue or self.thread_delete_queue:
+                    await self.process_delete_queue()
+                if pause and i < len(sub_batches) - 1:
+                    await asyncio.sleep(pause)
+            except Exception as e:
+                logger.error(f"Error in sub-batch {i + 1}: {str(e)}")
+                continue
+
+        if self.local_classifier:
+            # Saving rewrites the whole weight table, so only do it every few hundred decisions
+            if self.local_classifier.examples_seen - self._local_saved_at >= 500:
+                self.local_classifier.save()
+                self._local_saved_at = self.local_classifier.examples_seen
+        return undecided
+
     async def _process_sub_batch(self, emails, batch_num, total_batches):
+        """Classify one sub-batch and return the message IDs that got no decision"""
+        all_ids = [email['message_id'] for email in emails]
         try:
             self.add_to_buffer(f"Processing sub-batch {batch_num} of {total_batches}", Colors.YELLOW)
             
             # Add 5 second delay between batches
             if batch_num > 1:
                 await asyncio.sleep(1)
-            
-            response = await self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "You are an email retention assistant. You must respond with valid JSON only."},
-                    {"role": "user", "content": self._construct_batch_prompt(emails)}
-                ],
-                response_format={ "type": "json_object" }
-            )
-            
-            return await self._handle_openai_response(response, emails)
+
+            if self.local_classifier:
+                emails = await self._classify_locally(emails)
+                if not emails:
+                    return []
+
+            undecided = [email['message_id'] for email in await self._decide(emails, self.model)]
+
+            if self.cascade:
+                escalated = [email for email in emails if email['message_id'] in self._escalations]
+                if escalated:
+                    logger.debug(f"Escalating {len(escalated)} of {len(emails)} emails to {self.cascade.tier2_model}",
+                                 extra=HOT)
+                    unanswered = await self._decide(escalated, self.cascade.tier2_model)
+                    # Emails the second tier never answered stay undecided rather than trusting the first tier
+                    undecided.extend(email['message_id'] for email in unanswered)
+                    for email in escalated:
+                        self._escalations.pop(email['message_id'], None)
+            return undecided
             
         except Exception as e:
             self.add_to_buffer(f"Error in sub-batch {batch_num}: {str(e)}", Colors.RED)
-            return []
+            # Deciding an email twice is harmless; losing it from the queue is not
+            return all_ids
 
-    async def _handle_openai_response(self, response, emails):
+    async def _decide(self, emails, model):
+        """Request decisions from one model, re-requesting only the emails a response left out
+
+        Returns the emails still without a decision.
+        """
+        # Decisions are acted on as they stream in; only emails left without one are sent again
+        pending = emails
+        for attempt in range(self.stream_retries + 1):
+            if self.budget and not await self.budget.acquire():
+                break
+            decided = await self._request_decisions(pending, model)
+            pending = [email for email in pending if email['message_id'] not in decided]
+            if not pending:
+                break
+            self.requeued_emails += len(pending)
+            logger.warning(f"Response decided {len(decided)} emails, re-requesting the other {len(pending)} "
+                           f"(attempt {attempt + 1})")
+
+        if pending and not self.budget_exhausted:
+            logger.error(f"No decision for {len(pending)} emails after {self.stream_retries + 1} attempts, leaving them")
+        return pending
+
+    async def _request_decisions(self, emails, model=None):
+        """Get decisions for emails and act on them as they stream in
+
+        Streams only parse; a consumer task applies the decisions, so Gmail
+        calls never count towards request latency and are never interrupted
+        when a hedged stream is cancelled.
+        """
+        decisions = asyncio.Queue()
+        consumer = asyncio.create_task(self._consume_decisions(decisions))
         try:
-            logger.debug("Received response from OpenAI")
-            
+            if not self.hedge_policy:
+                return await self._stream_decisions(emails, decisions, model=model)
+            return await self._hedge_decisions(emails, decisions, model)
+        finally:
+            decisions.put_nowait(None)
+            await consumer
+
+    async def _consume_decisions(self, decisions):
+        """Act on (result, email) pairs from the queue until a None arrives
+
+        Whatever has queued up while the previous group was being applied is
+        taken as the next group, so a fast stream gets fewer, larger plan_store
+        transactions and trash flushes without holding back a slow one.
+        """
+        done = False
+        while not done:
+            group = [await decisions.get()]
+            while len(group) < DECISION_GROUP_SIZE and not decisions.empty():
+                group.append(decisions.get_nowait())
+            if group[-1] is None:
+                done = True
+                group.pop()
+            if not group:
+                continue
+
+            results = [result for result, _ in group]
+            emails = [email for _, email in group]
             try:
-                decisions = json.loads(response.choices[0].message.content)
-                
-                if isinstance(decisions, dict) and 'decisions' in decisions:
-                    results = decisions['decisions']
-                else:
-                    results = decisions if isinstance(decisions, list) else []
-                
-                for result in results:
-                    if isinstance(result, dict):
-                        # Format decision output
-                        decision_str = (
-                            f"[{Colors.GREEN}KEEP{Colors.RESET}]" 
-                            if result.get('decision') == 'KEEP' 
-                            else f"[{Colors.RED}DELETE{Colors.RESET}]"
-                        )
-                        
-                        print(f"{decision_str} Subject: {result.get('subject')[:50]}...")
-                        print(f"       Reason: {result.get('reason')[:100]}...")
-                        print("-" * 80)
-                        
-                        if result.get('decision') == 'KEEP':
-                            self.total_kept += 1
-                        elif result.get('decision') == 'DELETE':
-                            self.total_deleted += 1
-                            self.delete_queue.append(result['email_id'])
-                            if len(self.delete_queue) >= 25:
-                                await self.process_delete_queue()
-                        
-                        self.total_processed += 1
-                        self.batch_processed += 1
-                        self._update_status_line()
-                    
-            except json.JSONDecodeError as je:
-                logger.error(f"Failed to parse OpenAI response: {je}")
-                return []
-                
+                if self.local_classifier:
+                    self._learn_from_results(results, emails)
+                await self._apply_results(results, emails)
+            except Exception as e:
+                logger.error(f"Failed to act on {len(group)} decisions: {str(e)}")
+
+    async def _hedge_decisions(self, emails, decisions, model=None):
+        """Stream decisions, hedging with a second request if the first runs slow
+
+        Both requests share one decided set, so each email is acted on once,
+        by whichever stream delivers its decision first.
+        """
+        model = model or self.model
+        policy = self.hedge_policies.get(model)
+        if policy is None:
+            policy = self.hedge_policies[model] = (
+                self.hedge_policy if not self.hedge_policies else self.hedge_policy.fresh()
+            )
+        policy.requests += 1
+        decided = set()
+        request_start = time.time()
+        primary = asyncio.create_task(self._stream_decisions(emails, decisions, decided, model))
+        pending = {primary}
+        hedge = None
+        first_done = None
+
+        try:
+            delay = policy.hedge_delay()
+            if delay is not None:
+                done, pending = await asyncio.wait(pending, timeout=delay)
+                if pending and not self.budget_exhausted and policy.try_hedge():
+                    # A hedge is billed like any request, so it needs the budget's go-ahead too
+                    if self.budget and not await self.budget.acquire():
+                        policy.hedges -= 1
+                    elif not primary.done():
+                        logger.debug(f"Hedging request for {len(emails)} emails after {delay:.2f}s", extra=HOT)
+                        hedge = asyncio.create_task(self._stream_decisions(emails, decisions, decided, model))
+                        pending.add(hedge)
+
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                first_done = first_done or next(iter(done))
+                if len(decided) >= len(emails):
+                    break
+        finally:
+            for task in pending:
+                task.cancel()
+
+        if hedge:
+            if first_done is hedge:
+                policy.wins += 1
+            else:
+                policy.losses += 1
+
+        # A cancelled primary still tells us the request took at least this long
+        policy.record(time.time() - request_start)
+        return decided
+
+    async def _stream_decisions(self, emails, decisions, decided=None, model=None):
+        """Stream one completion and queue each decision as soon as it is complete
+
+        Returns the message IDs that got a decision, including when the stream
+        breaks off part way through. Pass a shared decided set to run several
+        streams for the same emails without queueing any email twice. With a
+        cascade, first-tier decisions that need escalating count as decided
+        but are held back instead of queued.
+        """
+        model = model or self.model
+        emails_by_id = {email['message_id']: email for email in emails}
+        decided = decided if decided is not None else set()
+        parser = DecisionStreamParser()
+        request_start = time.time()
+        stream = None
+        usage_seen = False
+        completion_chars = 0
+        prompt = self._construct_batch_prompt(emails)
+        self.tuner.record_requests(stage='openai')
+
+        try:
+            stream = await self.client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "system", "content": BATCH_INSTRUCTIONS},
+                    {"role": "user", "content": prompt}
+                ],
+                response_format={ "type": "json_object" },
+                stream=True,
+                stream_options={"include_usage": True}
+            )
+
+            async for chunk in stream:
+                if getattr(chunk, 'usage', None):
+                    # Only the final chunk carries usage
+                    usage_seen = True
+                    self._record_usage(chunk, time.time() - request_start, model=model)
+                if not chunk.choices or not chunk.choices[0].delta.content:
+                    continue
+                completion_chars += len(chunk.choices[0].delta.content)
+
+                for result in parser.feed(chunk.choices[0].delta.content):
+                    email = emails_by_id.get(result.get('email_id'))
+                    if not email or email['message_id'] in decided:
+                        continue
+                    if not decided:
+                        # First decision for these emails across any hedged streams
+                        self.first_decision_latency += time.time() - request_start
+                        self.first_decision_samples += 1
+                    decided.add(email['message_id'])
+
+                    if self.cascade and not self._cascade_accepts(result, email, model):
+                        continue
+
+                    self.llm_decisions += 1
+                    decisions.put_nowait((result, email))
+
         except Exception as e:
-            logger.error(f"OpenAI API error: {str(e)}")
-            return []
+            self.tuner.record_error(e, stage='openai')
+            logger.error(f"OpenAI stream failed after {len(decided)} of {len(emails)} decisions: {str(e)}")
+        finally:
+            self.tuner.record_latency(time.time() - request_start, stage='openai')
+            if stream is not None and not usage_seen and self.budget:
+                # Cancelled hedges and broken streams are billed but never report usage
+                cost = self.budget.record_estimate(model, len(BATCH_INSTRUCTIONS) + len(prompt), completion_chars)
+                logger.debug(f"Charged an estimated ${cost:.5f} for an unfinished {model} stream", extra=HOT)
+            # Also runs when a hedged stream is cancelled, so its connection is released
+            if stream is not None and hasattr(stream, 'close'):
+                await stream.close()
+
+        return decided
+
+    def _cascade_accepts(self, result, email, model):
+        """Record a cascade decision; False when a first-tier decision is held back for the second tier"""
+        message_id = email['message_id']
+        if self.cascade.tier_of(model) == 1:
+            reason = self.cascade.escalation_reason(result, email)
+            if reason:
+                self.cascade.record_escalation(reason)
+                self._escalations[message_id] = (result, reason)
+                return False
+            self.cascade.record_decision(model)
+            return True
+
+        first_tier_result, reason = self._escalations.pop(message_id, (None, None))
+        self.cascade.record_decision(model, first_tier_result, result, reason)
+        return True
+
+    async def _apply_results(self, results, emails):
+        """Count, display and act on a list of KEEP/DELETE decisions"""
+        emails_by_id = {email['message_id']: email for email in emails}
+        planned = []
+        processed_before = self.total_processed
+
+        for result in results:
+            if isinstance(result, dict):
+                # Format decision output
+                decision_str = (
+                    f"[{Colors.GREEN}KEEP{Colors.RESET}]"
+                    if result.get('decision') == 'KEEP'
+                    else f"[{Colors.RED}DELETE{Colors.RESET}]"
+                )
+
+                print(f"{decision_str} Subject: {(result.get('subject') or '')[:50]}...")
+                print(f"       Reason: {(result.get('reason') or '')[:100]}...")
+                print("-" * 80)
+
+                if self.plan_store:
+                    planned.append((result, emails_by_id.get(result.get('email_id'))))
+
+                if result.get('decision') == 'KEEP':
+                    self.total_kept += 1
+                    if self.sort_labels and not self.plan_store:
+                        await self._queue_labels(result, emails_by_id.get(result.get('email_id'), {}))
+                elif result.get('decision') == 'DELETE':
+                    self.total_deleted += 1
+                    if not self.plan_store:
+                        email = emails_by_id.get(result.get('email_id'), {})
+                        if email.get('thread_id'):
+                            # One decision covers the whole conversation
+                            self.thread_delete_queue.append(
+                                (email['thread_id'], email.get('message_ids', []), result.get('reason'),
+                                 email.get('message_labels'))
+                            )
+                        else:
+                            self.delete_queue.append(result['email_id'])
+                            self.delete_reasons[result['email_id']] = result.get('reason')
+                            if email.get('labels') is not None:
+                                self.delete_labels[result['email_id']] = list(email['labels'])
+                        if len(self.delete_queue) + len(self.thread_delete_queue) >= self.tuner.value('flush_threshold'):
+                            await self.process_delete_queue()
+
+                self.total_processed += 1
+                self.batch_processed += 1
+                self._update_status_line()
+
+        self.tuner.tick(self.total_processed)
+        if self.budget:
+            # Final decisions only, so retries and escalations do not count an email twice
+            self.budget.count_emails(self.total_processed - processed_before)
+
+        if planned:
+            self.plan_store.record_decisions(self.run_id, planned)
+
+    async def _queue_labels(self, result, email):
+        """Group a KEEP email by its label set, flushing groups that reach batchModify's limit"""
+        label_names = labels_for_categories(result.get('category'))
+        if not label_names:
+            return
+
+        group = self.label_groups.setdefault(label_names, [])
+        group.extend(email.get('message_ids') or [result['email_id']])
+        if len(group) >= 1000:
+            await self._flush_label_group(label_names)
+
+    async def _flush_label_group(self, label_names):
+        email_ids = self.label_groups.pop(label_names, [])
+        while email_ids:
+            chunk, email_ids = email_ids[:1000], email_ids[1000:]
+            if await self.gmail_fetcher.batch_apply_labels(chunk, label_names):
+                self.total_labeled += len(chunk)
+            else:
+                self.add_to_buffer(f"Failed to label {len(chunk)} emails", Colors.RED)
+
+    async def flush_labels(self):
+        """Apply every pending label group; call once at the end of a run"""
+        for label_names in list(self.label_groups):
+            await self._flush_label_group(label_names)
+
+    async def _classify_locally(self, emails):
+        """Decide confident emails with the local model and return the rest for the LLM"""
+        local_results = []
+        local_emails = []
+        remaining = []
+
+        for email in emails:
+            prediction = self.local_classifier.classify(email)
+            if not prediction:
+                remaining.append(email)
+                continue
+
+            decision, confidence = prediction
+            if random.random() < self.local_audit_rate:
+                # Send a sample of confident emails to the LLM anyway to track live agreement
+                self._audit_predictions[email['message_id']] = decision
+                remaining.append(email)
+                continue
+
+            local_emails.append(email)
+            local_results.append({
+                'email_id': email['message_id'],
+                'subject': email.get('subject'),
+                'decision': decision,
+                # The local model only predicts KEEP/DELETE; --sort still needs a category
+                'category': guess_category(email),
+                'reason': f"Local model ({confidence:.0%} confident)"
+            })
+
+        if local_results:
+            self.local_decisions += len(local_results)
+            logger.debug(f"Local model decided {len(local_results)} of {len(emails)} emails", extra=HOT)
+            await self._apply_results(local_results, local_emails)
+
+        return remaining
+
+    def _learn_from_results(self, results, emails):
+        """Train the local model on the LLM's decisions"""
+        emails_by_id = {email['message_id']: email for email in emails}
+        for result in results:
+            if not isinstance(result, dict):
+                continue
+            email = emails_by_id.get(result.get('email_id'))
+            if not email:
+                continue
+
+            audited = self._audit_predictions.pop(email['message_id'], None)
+            if audited:
+                self.audit_total += 1
+                if audited == result.get('decision'):
+                    self.audit_agreed += 1
+
+            self.local_classifier.learn(email, result.get('decision'))
+
+    def local_stats(self):
+        """Return local model usage and live agreement figures"""
+        decided = self.local_decisions + self.llm_decisions
+        return {
+            'local_decisions': self.local_decisions,
+            'llm_decisions': self.llm_decisions,
+            'llm_call_reduction': self.local_decisions / decided if decided else 0.0,
+            'audited': self.audit_total,
+            'audit_agreement': self.audit_agreed / self.audit_total if self.audit_total else 0.0
+        }
+
+    async def watch_and_process(self, work_queue, running_flag=None, lease_seconds=300, idle_exit=30):
+        """Claim classify jobs from the shared work queue and process them concurrently
+
+        Any number of classifier processes can run this against the same queue;
+        leases make sure each job is handled by one of them at a time, and jobs
+        held by a crashed worker are picked up again once the lease expires.
+        """
+        logger.info("Starting OpenAI processor queue worker...")
 
-    async def watch_and_process(self, batch_directory='cache/email_batches', running_flag=None):
-        """Watch for new batch files and process them concurrently"""
-        logger.info("Starting OpenAI processor watch service...")
-        
         if running_flag is None:
             running_flag = lambda: True
-        
-        while running_flag():
-            try:
-                batch_files = [
-                    os.path.join(batch_directory, f) 
-                    for f in os.listdir(batch_directory) 
-                    if f.startswith('batch_') and f.endswith('.json')
-                ]
-                
-                unprocessed_batches = [
-                    batch for batch in batch_files 
-                    if batch not in self.processed_batches
-                ]
-                
-                if unprocessed_batches:
-                    tasks = [
-                        self.process_batch(batch) 
-                        for batch in unprocessed_batches[:self.max_concurrent]
-                    ]
-                    await asyncio.gather(*tasks)
-                
-                await asyncio.sleep(1)
-                
-            except Exception as e:
-                logger.error(f"Error in watch_and_process: {str(e)}")
-                if running_flag():
-                    await asyncio.sleep(5)
+
+        owner = worker_id('classify')
+        loop = asyncio.get_running_loop()
+        state = {'idle_since': None}
+
+        async def worker_loop():
+            while running_flag():
+                try:
+                    job = await asyncio.to_thread(work_queue.claim, CLASSIFY_QUEUE, owner, lease_seconds)
+                    if not job:
+                        if not await asyncio.to_thread(work_queue.has_pending,
+                                                       [LIST_QUEUE, FETCH_QUEUE, CLASSIFY_QUEUE]):
+                            state['idle_since'] = state['idle_since'] or loop.time()
+                            if loop.time() - state['idle_since'] >= idle_exit:
+                                return
+                        await asyncio.sleep(1)
+                        continue
+
+                    state['idle_since'] = None
+                    job_id, payload = job
+                    lease_task = asyncio.create_task(hold_lease(work_queue, job_id, owner, lease_seconds))
+                    try:
+                        messages = payload.get('messages', [])
+                        undecided = set(await self.process_messages(messages, pause=0))
+                        if self.delete_queue or self.thread_delete_queue:
+                            await self.process_delete_queue()
+                        if undecided:
+                            # Only the undecided part goes back, so decided emails are not paid for twice
+                            remainder = [message for message in messages if message['message_id'] in undecided]
+                            logger.warning(f"Classify job {job_id}: requeueing {len(remainder)} undecided emails")
+                            await asyncio.to_thread(requeue_remainder, work_queue, CLASSIFY_QUEUE, job_id,
+                                                    payload, 'messages', remainder,
+                                                    count_attempt=not self.budget_exhausted)
+                        await asyncio.to_thread(work_queue.ack, job_id, owner)
+                        if self.budget_exhausted:
+                            return
+                    except Exception as e:
+                        logger.error(f"Classify job {job_id} failed: {str(e)}")
+                        await asyncio.to_thread(work_queue.nack, job_id, owner)
+                    finally:
+                        lease_task.cancel()
+
+                except Exception as e:
+                    logger.error(f"Error in watch_and_process: {str(e)}")
+                    if running_flag():
+                        await asyncio.sleep(5)
+
+        await asyncio.gather(*(worker_loop() for _ in range(self.max_concurrent)))
+        logger.info("No classify work left, queue worker exiting")
 
     def _calculate_rate(self):
         elapsed_time = time.time() - self.start_time
@@ -284,40 +855,71 @@ Remember: Always err on the side of caution - keep emails unless their irrelevan
         """Construct prompt for batch email retention analysis"""
         email_list = []
         for email in emails:
+            thread_info = ""
+            if email.get('message_count'):
+                thread_info = (
+                    f"Thread: {email['message_count']} messages, "
+                    f"participants: {', '.join(email.get('participants', [])[:5])}\n"
+                    f"Latest message:\n"
+                )
             email_list.append(f"""
 Email ID: {email['message_id']}
 Subject: {email['subject']}
 From: {email['sender']}
 Has Attachments: {email['has_attachments']}
-Body:
+{thread_info}Body:
 {email['body']}
 ---""")
         
-        return f"""Analyze these emails and return a JSON object with a 'decisions' array containing analysis for each email.
+        # Only the variable part; the instructions live in BATCH_INSTRUCTIONS
+        return f"""Analyze these {len(emails)} emails:
+{chr(10).join(email_list)}"""
 
-{chr(10).join(email_list)}
+    def _record_usage(self, response, latency, model=None):
+        """Record prompt, cached and completion tokens for one request and the run"""
+        usage = getattr(response, 'usage', None)
+        if not usage:
+            return
+        model = model or self.model
 
-Analysis principles:
-1. RETAIN if there are attachments, calendar invites, or future events/deadlines
-2. Consider sender importance and contact frequency
-3. Evaluate ongoing discussion/project context
-4. Delete promotional/social emails unless they contain:
-   - Purchase/signup evidence
-   - Personal relevance
-   - Future reference value
-5. Be cautious - keep if uncertain
+        prompt_tokens = getattr(usage, 'prompt_tokens', 0) or 0
+        completion_tokens = getattr(usage, 'completion_tokens', 0) or 0
+        details = getattr(usage, 'prompt_tokens_details', None)
+        cached_tokens = (getattr(details, 'cached_tokens', 0) or 0) if details else 0
 
-Return ONLY a JSON object in this format:
-{{
-    "decisions": [
-        {{
-            "email_id": "message_id",
-            "subject": "email subject",
-            "decision": "KEEP|DELETE",
-            "reason": "explanation"
-        }}
-    ]
-}}"""
+        self.requests_made += 1
+        self.total_prompt_tokens += prompt_tokens
+        self.total_cached_tokens += cached_tokens
+        self.total_completion_tokens += completion_tokens
+        if self.budget:
+            self.budget.record(model, prompt_tokens, cached_tokens, completion_tokens)
+        if self.cascade:
+            self.cascade.record_request(model, latency)
+
+        logger.debug(
+            f"OpenAI usage [{PROMPT_VERSION}, {model}]: prompt={prompt_tokens} cached={cached_tokens} "
+            f"completion={completion_tokens} latency={latency:.2f}s",
+            # One per request and needed for cost accounting, so never rate-limited
+            extra={'event': 'openai_usage', 'model': model, 'prompt_tokens': prompt_tokens,
+                   'cached_tokens': cached_tokens, 'completion_tokens': completion_tokens, 'latency': latency}
+        )
+
+    def usage_stats(self):
+        """Return aggregate token usage and the share of prompt tokens served from cache"""
+        return {
+            'prompt_version': PROMPT_VERSION,
+            'requests': self.requests_made,
+            'prompt_tokens': self.total_prompt_tokens,
+            'cached_tokens': self.total_cached_tokens,
+            'completion_tokens': self.total_completion_tokens,
+            'requeued_emails': self.requeued_emails,
+            'avg_first_decision': (
+                self.first_decision_latency / self.first_decision_samples if self.first_decision_samples else 0.0
+            ),
+            'cache_hit_rate': (
+                self.total_cached_tokens / self.total_prompt_tokens if self.total_prompt_tokens else 0.0
+            )
+        }
     def _update_status_line(self):
         """Update status with basic formatting"""
         total_rate = self._calculate_rate()
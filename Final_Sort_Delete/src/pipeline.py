@@ -0,0 +1,154 @@
+import asyncio
+import time
+from .utils.logger import setup_logger
+
+logger = setup_logger()
+
+class StreamingPipeline:
+    """List -> fetch -> classify/trash pipeline with a hard cap on in-flight messages
+
+    A message takes a slot when its ID is listed and gives it back only once it
+    has been classified and any resulting trash call has finished. When all
+    slots are taken, listing blocks, so memory stays flat no matter how large
+    the mailbox is.
+    """
+
+    def __init__(self, fetcher, processor, max_in_flight=500, sub_batch_size=None,
+                 fetch_chunk_size=None, running_flag=None):
+        self.fetcher = fetcher
+        self.processor = processor
+        self.max_in_flight = max(1, max_in_flight)
+        # Sizes left as None follow the fetcher's tuner, so they can change mid-run
+        self._sub_batch_size = sub_batch_size
+        self._fetch_chunk_size = fetch_chunk_size
+        self.running_flag = running_flag or (lambda: True)
+
+        self.slots = asyncio.Semaphore(self.max_in_flight)
+        self.id_queue = asyncio.Queue(maxsize=self.max_in_flight)
+        self.record_queue = asyncio.Queue(maxsize=self.max_in_flight)
+
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.listed = 0
+        self.completed = 0
+        self.start_time = None
+
+    def _size(self, fixed, name):
+        return max(1, min(fixed or self.fetcher.tuner.value(name), self.max_in_flight))
+
+    @property
+    def sub_batch_size(self):
+        return self._size(self._sub_batch_size, 'sub_batch')
+
+    @property
+    def fetch_chunk_size(self):
+        return self._size(self._fetch_chunk_size, 'fetch_chunk')
+
+    @property
+    def page_size(self):
+        return self._size(None, 'page_size')
+
+    async def _acquire(self):
+        await self.slots.acquire()
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def _release(self, count):
+        for _ in range(count):
+            self.slots.release()
+        self.in_flight -= count
+        self.completed += count
+
+    async def _list_stage(self):
+        page_token = None
+        try:
+            while self.running_flag():
+                message_ids, page_token = await self.fetcher.list_message_ids(page_token, self.page_size)
+                for message_id in message_ids:
+                    await self._acquire()
+                    await self.id_queue.put(message_id)
+                    self.listed += 1
+                if not page_token:
+                    break
+        except Exception as e:
+            logger.error(f"Error listing messages: {str(e)}")
+        finally:
+            await self.id_queue.put(None)
+
+    async def _fetch_stage(self):
+        finished = False
+        try:
+            while not finished:
+                message_ids = []
+                message_id = await self.id_queue.get()
+                if message_id is None:
+                    break
+                message_ids.append(message_id)
+
+                # Take whatever else is already waiting, up to one batch request
+                while len(message_ids) < self.fetch_chunk_size and not self.id_queue.empty():
+                    message_id = self.id_queue.get_nowait()
+                    if message_id is None:
+                        finished = True
+                        break
+                    message_ids.append(message_id)
+
+                try:
+                    records = await self.fetcher.fetch_message_records(message_ids, self.fetch_chunk_size)
+                except Exception as e:
+                    logger.error(f"Error fetching {len(message_ids)} messages: {str(e)}")
+                    records = []
+
+                # Messages that could not be fetched give their slot back now
+                if len(records) < len(message_ids):
+                    self._release(len(message_ids) - len(records))
+                for record in records:
+                    await self.record_queue.put(record)
+        finally:
+            await self.record_queue.put(None)
+
+    async def _classify_stage(self):
+        finished = False
+        while not finished:
+            records = []
+            record = await self.record_queue.get()
+            if record is None:
+                break
+            records.append(record)
+
+            while len(records) < self.sub_batch_size:
+                try:
+                    record = await asyncio.wait_for(self.record_queue.get(), timeout=1)
+                except asyncio.TimeoutError:
+                    break
+                if record is None:
+                    finished = True
+                    break
+                records.append(record)
+
+            try:
+                await self.processor.process_messages(records, pause=0)
+            except Exception as e:
+                logger.error(f"Error classifying {len(records)} messages: {str(e)}")
+            finally:
+                count = len(records)
+                records.clear()
+                self._release(count)
+
+    async def run(self):
+        """Run every stage to completion and return the number of messages handled"""
+        self.start_time = time.time()
+        logger.info(f"Streaming mode: at most {self.max_in_flight} messages in flight")
+
+        await asyncio.gather(
+            self._list_stage(),
+            self._fetch_stage(),
+            self._classify_stage()
+        )
+
+        elapsed = time.time() - self.start_time
+        logger.info(f"Streaming complete: {self.completed} messages in {elapsed:.1f}s "
+                    f"(peak in flight: {self.peak_in_flight}/{self.max_in_flight})")
+        return self.completed
+
+__all__ = ['StreamingPipeline']
@@ -0,0 +1,216 @@
+import os
+import sqlite3
+from datetime import datetime
+from .utils.logger import setup_logger
+
+logger = setup_logger()
+
+class PlanStore:
+    """Local SQLite store of KEEP/DELETE decisions recorded in plan mode"""
+
+    def __init__(self, db_path='cache/plans.db'):
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path, timeout=30)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self._create_tables()
+
+    def _create_tables(self):
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS decisions (
+                run_id TEXT NOT NULL,
+                message_id TEXT NOT NULL,
+                decision TEXT NOT NULL,
+                reason TEXT,
+                subject TEXT,
+                sender TEXT,
+                has_attachments INTEGER DEFAULT 0,
+                category TEXT,
+                created_at TEXT NOT NULL,
+                applied_at TEXT,
+                PRIMARY KEY (run_id, message_id)
+            )
+        """)
+        # Plans recorded before sorting existed have no category column
+        columns = [row['name'] for row in self.conn.execute("PRAGMA table_info(decisions)")]
+        if 'category' not in columns:
+            self.conn.execute("ALTER TABLE decisions ADD COLUMN category TEXT")
+        self.conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_decisions_pending
+            ON decisions (run_id, decision, applied_at)
+        """)
+        self.conn.commit()
+
+    def record_decisions(self, run_id, rows):
+        """Record a list of (result, email) pairs for a plan run"""
+        now = datetime.now().isoformat(timespec='seconds')
+        values = []
+        for result, email in rows:
+            email = email or {}
+            # Thread decisions are recorded once per message so apply can trash them
+            for message_id in email.get('message_ids') or [result.get('email_id')]:
+                values.append((
+                    run_id,
+                    message_id,
+                    result.get('decision'),
+                    result.get('reason'),
+                    result.get('subject') or email.get('subject'),
+                    email.get('sender'),
+                    1 if email.get('has_attachments') else 0,
+                    result.get('category'),
+                    now
+                ))
+        if not values:
+            return 0
+        with self.conn:
+            self.conn.executemany("""
+                INSERT OR REPLACE INTO decisions
+                (run_id, message_id, decision, reason, subject, sender, has_attachments, category, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, values)
+        logger.debug(f"Recorded {len(values)} decisions for plan {run_id}")
+        return len(values)
+
+    def latest_run_id(self):
+        """Return the most recently recorded plan run, or None"""
+        row = self.conn.execute(
+            "SELECT run_id FROM decisions ORDER BY created_at DESC, run_id DESC LIMIT 1"
+        ).fetchone()
+        return row['run_id'] if row else None
+
+    def summary(self, run_id):
+        """Return decision counts for a plan run"""
+        rows = self.conn.execute("""
+            SELECT decision,
+                   COUNT(*) AS total,
+                   SUM(CASE WHEN applied_at IS NOT NULL THEN 1 ELSE 0 END) AS applied
+            FROM decisions
+            WHERE run_id = ?
+            GROUP BY decision
+        """, (run_id,)).fetchall()
+        return {row['decision']: {'total': row['total'], 'applied': row['applied']} for row in rows}
+
+    def top_senders(self, run_id, decision='DELETE', limit=10):
+        """Return the senders with the most decisions of the given kind"""
+        rows = self.conn.execute("""
+            SELECT sender, COUNT(*) AS total
+            FROM decisions
+            WHERE run_id = ? AND decision = ?
+            GROUP BY sender
+            ORDER BY total DESC
+            LIMIT ?
+        """, (run_id, decision, limit)).fetchall()
+        return [(row['sender'], row['total']) for row in rows]
+
+    def iter_decisions(self, run_id, decision=None):
+        """Iterate over the recorded decisions of a plan run"""
+        query = "SELECT * FROM decisions WHERE run_id = ?"
+        params = [run_id]
+        if decision:
+            query += " AND decision = ?"
+            params.append(decision)
+        for row in self.conn.execute(query, params):
+            yield dict(row)
+
+    def pending_deletes(self, run_id, limit=1000):
+        """Return message IDs planned for deletion that have not been applied yet"""
+        rows = self.conn.execute("""
+            SELECT message_id FROM decisions
+            WHERE run_id = ? AND decision = 'DELETE' AND applied_at IS NULL
+            LIMIT ?
+        """, (run_id, limit)).fetchall()
+        return [row['message_id'] for row in rows]
+
+    def reasons_for(self, run_id, message_ids):
+        """Return message_id -> reason for the given decisions of a plan run"""
+        reasons = {}
+        for i in range(0, len(message_ids), 500):
+            chunk = message_ids[i:i + 500]
+            placeholders = ','.join('?' * len(chunk))
+            rows = self.conn.execute(
+                f"SELECT message_id, reason FROM decisions WHERE run_id = ? AND message_id IN ({placeholders})",
+                [run_id] + list(chunk)
+            ).fetchall()
+            reasons.update((row['message_id'], row['reason']) for row in rows)
+        return reasons
+
+    def pending_labels(self, run_id, limit=10000):
+        """Return (message_id, category) pairs for KEEP decisions not labeled yet"""
+        rows = self.conn.execute("""
+            SELECT message_id, category FROM decisions
+            WHERE run_id = ? AND decision = 'KEEP' AND category IS NOT NULL AND applied_at IS NULL
+            LIMIT ?
+        """, (run_id, limit)).fetchall()
+        return [(row['message_id'], row['category']) for row in rows]
+
+    def mark_applied(self, run_id, message_ids):
+        """Mark planned decisions as applied so an interrupted apply can resume"""
+        now = datetime.now().isoformat(timespec='seconds')
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE decisions SET applied_at = ? WHERE run_id = ? AND message_id = ?",
+                [(now, run_id, message_id) for message_id in message_ids]
+            )
+
+    def carry_over_applied(self, run_id, baseline_run_id):
+        """Mark decisions that match an applied baseline decision as applied too
+
+        Returns how many decisions changed from the baseline (or are new), i.e.
+        what is left for apply to send to Gmail.
+        """
+        with self.conn:
+            self.conn.execute("""
+                UPDATE decisions SET applied_at = (
+                    SELECT base.applied_at FROM decisions AS base
+                    WHERE base.run_id = ? AND base.message_id = decisions.message_id
+                )
+                WHERE run_id = ? AND applied_at IS NULL AND EXISTS (
+                    SELECT 1 FROM decisions AS base
+                    WHERE base.run_id = ? AND base.message_id = decisions.message_id
+                      AND base.decision = decisions.decision
+                      -- The category only matters for labeling KEEPs; a DELETE is the same trash call either way
+                      AND (decisions.decision = 'DELETE' OR base.category IS decisions.category)
+                      AND base.applied_at IS NOT NULL
+                )
+            """, (baseline_run_id, run_id, baseline_run_id))
+        return self.decision_changes(run_id, baseline_run_id)
+
+    def decision_changes(self, run_id, baseline_run_id):
+        """Return counts of (baseline decision, new decision) pairs that differ; None means no baseline row"""
+        rows = self.conn.execute("""
+            SELECT base.decision AS previous, decisions.decision AS current, COUNT(*) AS total
+            FROM decisions
+            LEFT JOIN decisions AS base
+                ON base.run_id = ? AND base.message_id = decisions.message_id
+            WHERE decisions.run_id = ? AND base.decision IS NOT decisions.decision
+            GROUP BY previous, current
+        """, (baseline_run_id, run_id)).fetchall()
+        return {(row['previous'], row['current']): row['total'] for row in rows}
+
+    def mark_unapplied(self, run_id, message_ids):
+        """Clear applied_at, e.g. once a later run has restored what this plan trashed"""
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE decisions SET applied_at = NULL WHERE run_id = ? AND message_id = ?",
+                [(run_id, message_id) for message_id in message_ids]
+            )
+
+    def reversed_deletes(self, run_id, baseline_run_id, limit=1000):
+        """Return message IDs the baseline trashed that this run now keeps"""
+        rows = self.conn.execute("""
+            SELECT decisions.message_id FROM decisions
+            JOIN decisions AS base
+                ON base.run_id = ? AND base.message_id = decisions.message_id
+            WHERE decisions.run_id = ? AND decisions.decision = 'KEEP'
+              AND base.decision = 'DELETE' AND base.applied_at IS NOT NULL
+            LIMIT ?
+        """, (baseline_run_id, run_id, limit)).fetchall()
+        return [row['message_id'] for row in rows]
+
+    def close(self):
+        self.conn.close()
+
+__all__ = ['PlanStore']
@@ -0,0 +1,202 @@
+import os
+import sys
+import time
+import asyncio
+import threading
+from collections import Counter
+from .utils.logger import setup_logger
+
+logger = setup_logger()
+
+# Innermost matching function decides which pipeline stage a sample belongs to
+STAGE_FUNCTIONS = {
+    '_parse_message': 'parse',
+    '_walk_parts': 'parse',
+    '_decode_part': 'parse',
+    'extract_text_from_html': 'parse',
+    'clean_text': 'parse',
+    'feed': 'decisions',
+    '_apply_results': 'decisions',
+    '_construct_batch_prompt': 'prompt',
+    'update_display': 'display',
+    'add_to_buffer': 'display',
+    'clear_console': 'display',
+    '_update_status_line': 'display',
+    'execute': 'gmail api',
+    'classify': 'local model',
+    'learn': 'local model',
+    'record_decisions': 'sqlite',
+    'record_intent': 'sqlite',
+    'mark': 'sqlite',
+    'claim': 'sqlite',
+    'put_many': 'sqlite',
+}
+
+# A thread whose innermost frame is one of these is waiting, not working
+IDLE_FUNCTIONS = {'select', 'poll', 'epoll', 'wait', 'acquire', '_wait_for_tstate_lock', 'sleep', 'get'}
+
+def frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)})"
+
+def collapse(frame):
+    """Return the stack of a frame as root-first labels"""
+    labels = []
+    while frame is not None:
+        labels.append(frame_label(frame))
+        frame = frame.f_back
+    labels.reverse()
+    return labels
+
+def stage_of(frame):
+    if frame.f_code.co_name in IDLE_FUNCTIONS:
+        return 'idle'
+    while frame is not None:
+        stage = STAGE_FUNCTIONS.get(frame.f_code.co_name)
+        if stage:
+            return stage
+        frame = frame.f_back
+    return 'other'
+
+class SamplingProfiler:
+    """Samples the stacks of every thread from a background thread
+
+    Stacks are counted in collapsed form (one line per distinct stack, frames
+    separated by ';'), which flamegraph.pl, speedscope and inferno read
+    directly. Each sample is also attributed to a pipeline stage.
+    """
+
+    def __init__(self, interval=0.015):
+        self.interval = interval
+        self.stacks = Counter()
+        self.stages = Counter()
+        self.loop_stages = Counter()
+        self.samples = 0
+        self.loop_thread_id = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self.loop_thread_id = threading.get_ident()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            names.update((thread.ident, thread.name) for thread in threading.enumerate())
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id or names.get(thread_id) == 'loop-block-detector':
+                    continue
+                thread_name = 'event-loop' if thread_id == self.loop_thread_id else names.get(thread_id, 'thread')
+                self.stacks[';'.join([thread_name] + collapse(frame))] += 1
+                stage = stage_of(frame)
+                self.stages[stage] += 1
+                if thread_id == self.loop_thread_id:
+                    self.loop_stages[stage] += 1
+            self.samples += 1
+
+    def write(self, directory):
+        """Write collapsed stacks and a per-stage summary; returns the stacks path"""
+        os.makedirs(directory, exist_ok=True)
+        stacks_path = os.path.join(directory, 'stacks.collapsed')
+        with open(stacks_path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+        with open(os.path.join(directory, 'stages.txt'), 'w', encoding='utf-8') as f:
+            f.write(self.stage_summary())
+        return stacks_path
+
+    def stage_summary(self):
+        lines = [f"{self.samples} samples every {self.interval * 1000:.0f} ms"]
+        for title, counts in (('Event loop thread', self.loop_stages), ('All threads', self.stages)):
+            total = sum(counts.values()) or 1
+            lines.append(f"\n{title}:")
+            for stage, count in counts.most_common():
+                lines.append(f"  {stage:<12} {count / total:6.1%}  ({count} samples)")
+        return '\n'.join(lines) + '\n'
+
+class LoopBlockDetector:
+    """Flags callbacks that hold the event loop longer than threshold seconds
+
+    A heartbeat task on the loop stamps the time every few milliseconds. A
+    watchdog thread notices when the stamp goes stale and captures the loop
+    thread's stack at that moment, which is the blocking call.
+    """
+
+    def __init__(self, threshold=0.1, beat_interval=0.01):
+        self.threshold = threshold
+        self.beat_interval = beat_interval
+        self.blocks = []
+        self._last_beat = time.perf_counter()
+        self._current = None
+        self._loop_thread_id = None
+        self._beat_task = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    async def _heartbeat(self):
+        while True:
+            self._last_beat = time.perf_counter()
+            await asyncio.sleep(self.beat_interval)
+
+    def start(self):
+        self._loop_thread_id = threading.get_ident()
+        self._beat_task = asyncio.get_running_loop().create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watch, name='loop-block-detector', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        if self._beat_task:
+            self._beat_task.cancel()
+
+    def _watch(self):
+        while not self._stop.wait(self.threshold / 4):
+            last_beat = self._last_beat
+            stalled = time.perf_counter() - last_beat - self.beat_interval
+
+            if self._current and self._current['beat'] != last_beat:
+                self._finish_block()
+
+            if stalled < self.threshold:
+                continue
+            if self._current:
+                self._current['duration'] = stalled
+                continue
+
+            frame = sys._current_frames().get(self._loop_thread_id)
+            self._current = {
+                'beat': last_beat,
+                'duration': stalled,
+                'stack': collapse(frame) if frame else []
+            }
+
+    def _finish_block(self):
+        block = self._current
+        self._current = None
+        self.blocks.append(block)
+        culprit = block['stack'][-1] if block['stack'] else 'unknown'
+        logger.warning(f"Event loop blocked for at least {block['duration'] * 1000:.0f} ms in {culprit}")
+
+    def write(self, directory):
+        if self._current:
+            self._finish_block()
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, 'loop_blocks.txt'), 'w', encoding='utf-8') as f:
+            f.write(f"{len(self.blocks)} blocks over {self.threshold * 1000:.0f} ms\n")
+            for block in sorted(self.blocks, key=lambda block: block['duration'], reverse=True):
+                f.write(f"\n{block['duration'] * 1000:.0f} ms\n")
+                for label in reversed(block['stack']):
+                    f.write(f"    {label}\n")
+
+__all__ = ['SamplingProfiler', 'LoopBlockDetector', 'STAGE_FUNCTIONS']
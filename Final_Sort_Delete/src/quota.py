@@ -0,0 +1,82 @@
+import time
+import asyncio
+from contextlib import asynccontextmanager
+
+# Gmail API quota units per method (https://developers.google.com/gmail/api/reference/quota)
+QUOTA_UNITS = {
+    'messages.list': 5,
+    'messages.get': 5,
+    'messages.batchModify': 50,
+    'messages.trash': 5,
+    'threads.list': 10,
+    'threads.get': 10,
+    'threads.trash': 10,
+    'labels.list': 1,
+    'labels.get': 1,
+    'labels.create': 5,
+    'getProfile': 1,
+}
+
+class QuotaScheduler:
+    """Token bucket over Gmail quota units plus a cap on requests in flight
+
+    Gmail allows 250 quota units per user per second. Every request waits
+    until the bucket holds its cost in units and a concurrency slot is free,
+    so concurrent fetchers stay under the per-user rate instead of tripping
+    429s and backing off.
+    """
+
+    def __init__(self, units_per_second=250, max_concurrent=4, burst_seconds=1.0):
+        self.units_per_second = units_per_second
+        self.capacity = units_per_second * burst_seconds
+        self.max_concurrent = max_concurrent
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._slots = None
+        self._lock = None
+        self.waited = 0.0
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.units_per_second)
+        self._updated = now
+
+    async def _take(self, units):
+        # A batch may cost more than the bucket holds; it waits for a full bucket and is still
+        # charged in full, leaving a debt that later requests wait off
+        needed = min(units, self.capacity)
+        async with self._lock:
+            self._refill()
+            while self._tokens < needed:
+                wait = (needed - self._tokens) / self.units_per_second
+                self.waited += wait
+                await asyncio.sleep(wait)
+                self._refill()
+            self._tokens -= units
+
+    async def acquire(self, units):
+        """Take one in-flight request slot and pay its quota units; pair with release()"""
+        if self._slots is None:
+            # Created lazily so they bind to the running event loop
+            self._slots = asyncio.Semaphore(self.max_concurrent)
+            self._lock = asyncio.Lock()
+        await self._slots.acquire()
+        try:
+            await self._take(units)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self):
+        self._slots.release()
+
+    @asynccontextmanager
+    async def slot(self, units):
+        """Hold one in-flight request slot after paying its quota units"""
+        await self.acquire(units)
+        try:
+            yield
+        finally:
+            self.release()
+
+__all__ = ['QuotaScheduler', 'QUOTA_UNITS']
@@ -0,0 +1,45 @@
+class EmailRecord:
+    """Compact parsed email used by the streaming pipeline
+
+    Holds the same fields `GmailFetcher._parse_message` produces, but in
+    `__slots__` instead of a per-record dict. Supports `record['field']` and
+    `record.get('field')` so code written against parsed dicts keeps working.
+    """
+
+    __slots__ = ('message_id', 'subject', 'sender', 'body', 'has_attachments', 'labels', 'size',
+                 'history_id')
+
+    def __init__(self, message_id, subject='', sender='', body='', has_attachments=False,
+                 labels=(), size=0, history_id=None):
+        self.message_id = message_id
+        self.subject = subject
+        self.sender = sender
+        self.body = body
+        self.has_attachments = has_attachments
+        self.labels = tuple(labels)
+        self.size = size
+        self.history_id = history_id
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{field: data[field] for field in cls.__slots__ if field in data})
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.__slots__}
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except (AttributeError, TypeError):
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in self.__slots__
+
+    def get(self, key, default=None):
+        return getattr(self, key, default) if key in self.__slots__ else default
+
+    def __repr__(self):
+        return f"EmailRecord({self.message_id!r}, subject={self.subject[:40]!r})"
+
+__all__ = ['EmailRecord']
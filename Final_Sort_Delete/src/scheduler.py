@@ -0,0 +1,71 @@
+import heapq
+import itertools
+import math
+from collections import Counter
+
+# Gmail labels that make a deletion more (positive) or less (negative) likely
+LABEL_WEIGHTS = {
+    'CATEGORY_PROMOTIONS': 3.0,
+    'CATEGORY_SOCIAL': 2.5,
+    'CATEGORY_FORUMS': 1.0,
+    'CATEGORY_UPDATES': 1.0,
+    'CATEGORY_PERSONAL': -1.0,
+    'IMPORTANT': -1.5,
+    'STARRED': -3.0,
+}
+
+def sender_address(sender):
+    """Lowercased address part of a From header"""
+    return (sender or '').lower().split('<')[-1].strip(' >')
+
+class PriorityScheduler:
+    """Orders parsed emails so the likeliest, cheapest deletions are classified first
+
+    The score of an email is its expected value to a run that may stop early:
+    promotions and social mail first, senders with many messages in the
+    look-ahead window next, and short bodies (fewer prompt tokens) before long
+    ones. Attachments push an email back since they are almost always kept.
+    Sender counts cover only the emails still queued, so they stay bounded by
+    the window however long the run.
+    """
+
+    def __init__(self, label_weights=None, volume_weight=1.0, size_weight=1.0):
+        self.label_weights = label_weights or LABEL_WEIGHTS
+        self.volume_weight = volume_weight
+        self.size_weight = size_weight
+        self.sender_counts = Counter()
+        self._heap = []
+        self._sequence = itertools.count()
+
+    def __len__(self):
+        return len(self._heap)
+
+    def score(self, email):
+        score = sum(self.label_weights.get(label, 0.0) for label in email.get('labels') or [])
+        score += self.volume_weight * math.log1p(self.sender_counts[sender_address(email.get('sender'))])
+
+        # Prompt cost grows with the body; sizeEstimate covers the whole raw message
+        size = len(email.get('body') or '') + (email.get('size') or 0) / 10
+        score -= self.size_weight * math.log1p(size / 1000)
+
+        if email.get('has_attachments'):
+            score -= 2.0
+        return score
+
+    def push_many(self, emails):
+        """Add emails, counting senders first so the whole batch sees the new volumes"""
+        self.sender_counts.update(sender_address(email.get('sender')) for email in emails)
+        for email in emails:
+            # heapq is a min-heap; the sequence number keeps ties in arrival order
+            heapq.heappush(self._heap, (-self.score(email), next(self._sequence), email))
+
+    def pop(self, count):
+        """Remove and return up to count emails, best first"""
+        batch = []
+        while self._heap and len(batch) < count:
+            batch.append(heapq.heappop(self._heap)[2])
+        # Popped emails leave the window; Counter subtraction also drops senders that reach zero
+        self.sender_counts -= Counter(sender_address(email.get('sender')) for email in batch)
+        return batch
+
+__all__ = ['PriorityScheduler', 'LABEL_WEIGHTS']
@@ -0,0 +1,64 @@
+import os
+import sys
+import subprocess
+from .utils.logger import setup_logger
+
+logger = setup_logger()
+
+# Import time allowed for the CLI entry point; short incremental runs pay it every time
+STARTUP_BUDGET_MS = 300
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def profile_imports(module='src.main'):
+    """Import module in a fresh interpreter with -X importtime
+
+    Returns (total_us, rows, raw) where rows are (cumulative_us, self_us, name)
+    sorted slowest first and raw is the interpreter's own report.
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=PROJECT_ROOT,
+        capture_output=True,
+        text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed: {result.stderr.strip().splitlines()[-1:]}")
+
+    rows = []
+    total_us = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        self_us, cumulative_us = int(self_us), int(cumulative_us)
+        rows.append((cumulative_us, self_us, name[1:].rstrip()))
+        # Top-level imports are the ones without indentation; their cumulative times add up to the total
+        if not name.startswith('  ', 1):
+            total_us += cumulative_us
+    rows.sort(reverse=True)
+    return total_us, rows, result.stderr
+
+def report_startup(budget_ms=STARTUP_BUDGET_MS, top=15, output_path='logs/startup_profile.txt'):
+    """Print the slowest imports, save the full profile and check it against the budget"""
+    total_us, rows, raw = profile_imports()
+
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write(raw)
+
+    total_ms = total_us / 1000
+    print(f"\nImport time of src.main: {total_ms:.1f} ms (budget {budget_ms} ms)")
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for cumulative_us, self_us, name in rows[:top]:
+        print(f"{cumulative_us / 1000:>14.1f} {self_us / 1000:>9.1f}  {name}")
+    print(f"\nFull -X importtime output saved to {output_path}")
+
+    within_budget = total_ms <= budget_ms
+    if within_budget:
+        logger.info(f"Startup import time {total_ms:.1f} ms is within the {budget_ms} ms budget")
+    else:
+        logger.warning(f"Startup import time {total_ms:.1f} ms exceeds the {budget_ms} ms budget")
+    return within_budget
+
+__all__ = ['STARTUP_BUDGET_MS', 'profile_imports', 'report_startup']
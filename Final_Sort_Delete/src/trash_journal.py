@@ -0,0 +1,155 @@
+import os
+import json
+import sqlite3
+from datetime import datetime
+from .utils.logger import setup_logger
+
+logger = setup_logger()
+
+class TrashJournal:
+    """Write-ahead journal of every message sent to trash
+
+    Entries are written and fsynced as 'pending' before the trash call is
+    issued, then marked 'trashed' (or 'failed') once it returns. The undo
+    command restores journaled messages and marks them 'restored', so an
+    interrupted undo can simply be rerun.
+    """
+
+    def __init__(self, db_path='cache/trash_journal.db'):
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path, timeout=30)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # Durability matters more than speed here: an entry must survive a crash mid-trash
+        self.conn.execute("PRAGMA synchronous=FULL")
+        self._create_tables()
+
+    def _create_tables(self):
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS trash_journal (
+                run_id TEXT NOT NULL,
+                message_id TEXT NOT NULL,
+                decision TEXT,
+                reason TEXT,
+                status TEXT NOT NULL,
+                journaled_at TEXT NOT NULL,
+                trashed_at TEXT,
+                restored_at TEXT,
+                labels TEXT,
+                PRIMARY KEY (run_id, message_id)
+            )
+        """)
+        # Journals written before labels were recorded have no labels column
+        columns = [row['name'] for row in self.conn.execute("PRAGMA table_info(trash_journal)")]
+        if 'labels' not in columns:
+            self.conn.execute("ALTER TABLE trash_journal ADD COLUMN labels TEXT")
+        self.conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_trash_journal_status
+            ON trash_journal (run_id, status)
+        """)
+        self.conn.commit()
+
+    def _now(self):
+        return datetime.now().isoformat(timespec='seconds')
+
+    def record_intent(self, run_id, message_ids, reasons=None, decision='DELETE', labels=None):
+        """Durably record messages about to be trashed
+
+        labels maps message IDs to their labelIds before the trash call, so undo
+        puts back only what trashing took away. Messages without labels were
+        trashed out of the inbox and go back there.
+        """
+        reasons = reasons or {}
+        labels = labels or {}
+        now = self._now()
+        with self.conn:
+            self.conn.executemany("""
+                INSERT INTO trash_journal (run_id, message_id, decision, reason, status, journaled_at, labels)
+                VALUES (?, ?, ?, ?, 'pending', ?, ?)
+                ON CONFLICT (run_id, message_id) DO UPDATE SET
+                    status = 'pending', reason = COALESCE(excluded.reason, reason), journaled_at = excluded.journaled_at,
+                    labels = COALESCE(labels, excluded.labels)
+            """, [
+                (run_id, message_id, decision, reasons.get(message_id), now,
+                 json.dumps(labels[message_id]) if message_id in labels else None)
+                for message_id in message_ids
+            ])
+
+    def mark(self, run_id, message_ids, status):
+        """Move journaled messages to 'trashed', 'failed', 'skipped' or 'restored'"""
+        now = self._now()
+        column = {'trashed': 'trashed_at', 'restored': 'restored_at'}.get(status)
+        if column:
+            query = f"UPDATE trash_journal SET status = ?, {column} = ? WHERE run_id = ? AND message_id = ?"
+            rows = [(status, now, run_id, message_id) for message_id in message_ids]
+        else:
+            query = "UPDATE trash_journal SET status = ? WHERE run_id = ? AND message_id = ?"
+            rows = [(status, run_id, message_id) for message_id in message_ids]
+        with self.conn:
+            self.conn.executemany(query, rows)
+
+    def latest_run_id(self):
+        """Return the most recent run that trashed anything, or None"""
+        row = self.conn.execute(
+            "SELECT run_id FROM trash_journal ORDER BY journaled_at DESC, run_id DESC LIMIT 1"
+        ).fetchone()
+        return row['run_id'] if row else None
+
+    def runs(self, limit=10):
+        """Return per-run status counts, newest first"""
+        rows = self.conn.execute("""
+            SELECT run_id,
+                   MAX(journaled_at) AS last_at,
+                   SUM(CASE WHEN status = 'trashed' THEN 1 ELSE 0 END) AS trashed,
+                   SUM(CASE WHEN status = 'restored' THEN 1 ELSE 0 END) AS restored,
+                   SUM(CASE WHEN status IN ('pending', 'failed') THEN 1 ELSE 0 END) AS unconfirmed
+            FROM trash_journal
+            GROUP BY run_id
+            ORDER BY last_at DESC
+            LIMIT ?
+        """, (limit,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def restorable(self, run_id, limit=1000, reason_contains=None, since=None):
+        """Return (message_id, labels before trashing or None) for a run's unrestored messages
+
+        'pending' entries are included because a crash may have hit after the
+        trash call went through but before it was confirmed; restoring a
+        message that never reached trash is harmless.
+        """
+        query = """
+            SELECT message_id, labels FROM trash_journal
+            WHERE run_id = ? AND status IN ('trashed', 'pending')
+        """
+        params = [run_id]
+        if reason_contains:
+            query += " AND reason LIKE ?"
+            params.append(f"%{reason_contains}%")
+        if since:
+            query += " AND journaled_at >= ?"
+            params.append(since)
+        query += " LIMIT ?"
+        params.append(limit)
+        return [
+            (row['message_id'], json.loads(row['labels']) if row['labels'] else None)
+            for row in self.conn.execute(query, params).fetchall()
+        ]
+
+    def count_restorable(self, run_id, reason_contains=None, since=None):
+        query = "SELECT COUNT(*) FROM trash_journal WHERE run_id = ? AND status IN ('trashed', 'pending')"
+        params = [run_id]
+        if reason_contains:
+            query += " AND reason LIKE ?"
+            params.append(f"%{reason_contains}%")
+        if since:
+            query += " AND journaled_at >= ?"
+            params.append(since)
+        return self.conn.execute(query, params).fetchone()[0]
+
+    def close(self):
+        self.conn.close()
+
+__all__ = ['TrashJournal']
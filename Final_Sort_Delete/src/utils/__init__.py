@@ -1,3 +1,3 @@
-from .logger import setup_logger
+from .logger import setup_logger, enable_file_logging, set_log_format, HOT
 
-__all__ = ['setup_logger']
\ No newline at end of file
+__all__ = ['setup_logger', 'enable_file_logging', 'set_log_format', 'HOT']
\ No newline at end of file
@@ -1,36 +1,192 @@
 import logging
+import logging.handlers
 import os
+import json
+import time
+import queue
+import atexit
+import threading
+
+# Pass as extra= on per-message log calls; they are rate-limited per call site
+HOT = {'hot': True}
+
+class SizedTimedRotatingFileHandler(logging.handlers.TimedRotatingFileHandler):
+    """Rotates at the time interval or when the file would grow past max_bytes"""
+
+    def __init__(self, filename, max_bytes=10 * 1024 * 1024, when='midnight', backup_count=7, encoding='utf-8'):
+        super().__init__(filename, when=when, backupCount=backup_count, encoding=encoding, delay=True)
+        self.max_bytes = max_bytes
+
+    def shouldRollover(self, record):
+        if super().shouldRollover(record):
+            return True
+        if not self.max_bytes:
+            return False
+        if self.stream is None:
+            self.stream = self._open()
+        self.stream.seek(0, 2)
+        return self.stream.tell() + len(self.format(record)) + 1 >= self.max_bytes
+
+    def rotation_filename(self, default_name):
+        # Several size rollovers can fall in one time interval; later ones get the
+        # time of the rollover appended, so names never repeat and sort oldest first
+        name = super().rotation_filename(default_name)
+        candidate = name
+        while os.path.exists(candidate):
+            now = time.time()
+            candidate = f"{name}.{time.strftime('%H%M%S', time.localtime(now))}{int(now * 1000) % 1000:03d}"
+            if os.path.exists(candidate):
+                time.sleep(0.001)
+        return candidate
+
+    def getFilesToDelete(self):
+        """Backups beyond backup_count, oldest first by modification time"""
+        directory, base_name = os.path.split(self.baseFilename)
+        prefix = base_name + '.'
+        backups = [
+            os.path.join(directory, file_name) for file_name in os.listdir(directory)
+            if file_name.startswith(prefix) and self.extMatch.match(file_name[len(prefix):])
+        ]
+        if len(backups) <= self.backupCount:
+            return []
+        backups.sort(key=lambda path: (os.path.getmtime(path), path))
+        return backups[:len(backups) - self.backupCount]
+
+class LocalQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler for an in-process listener
+
+    The stock prepare() flattens the exception into the message and drops
+    exc_info so records can be pickled; records here never leave the process,
+    so exc_info is kept for the file formatter (JSON's 'exception' field).
+    """
+
+    def prepare(self, record):
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, including any extra= fields"""
+
+    RESERVED = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'hot'}
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in self.RESERVED:
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class HotPathFilter(logging.Filter):
+    """Lets at most rate records per second through from each HOT call site
+
+    Suppressed records are counted, and the next record let through from the
+    same site notes how many were dropped, so logging cost stays flat however
+    many messages go through a run.
+    """
+
+    def __init__(self, rate=5.0):
+        super().__init__()
+        self.rate = rate
+        self._sites = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if not getattr(record, 'hot', False):
+            return True
+        site = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated, suppressed = self._sites.get(site, (self.rate, now, 0))
+            tokens = min(self.rate, tokens + (now - updated) * self.rate)
+            if tokens < 1:
+                self._sites[site] = (tokens, now, suppressed + 1)
+                return False
+            self._sites[site] = (tokens - 1, now, 0)
+        if suppressed:
+            record.msg = f"{record.msg} (+{suppressed} similar suppressed)"
+            record.suppressed = suppressed
+        return True
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+def _formatter(log_format):
+    return JsonFormatter() if log_format == 'json' else logging.Formatter(TEXT_FORMAT)
 
 def setup_logger():
+    """The shared logger, writing to the console; see enable_file_logging for the log file
+
+    Every module calls this at import time, so it must not touch the file
+    system: importing src from a test or another tool leaves no log files.
+    """
     # Get logger instance
     logger = logging.getLogger('EmailProcessor')
     
     # Only set up handlers if they haven't been set up already
     if not logger.handlers:
-        # Create logs directory if it doesn't exist
-        if not os.path.exists('logs'):
-            os.makedirs('logs')
-
         # Configure logging
         logger.setLevel(logging.DEBUG)
-
-        # Create file handler with UTF-8 encoding
-        file_handler = logging.FileHandler('logs/app.log', encoding='utf-8')
-        file_handler.setLevel(logging.DEBUG)
+        logger.propagate = False
 
         # Create console handler
         console_handler = logging.StreamHandler()
         console_handler.setLevel(logging.INFO)
+        console_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
 
-        # Create formatter
-        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-        file_handler.setFormatter(formatter)
-        console_handler.setFormatter(formatter)
+        # Callers only enqueue records; a background thread formats and writes them
+        log_queue = queue.SimpleQueue()
+        queue_handler = LocalQueueHandler(log_queue)
+        queue_handler.addFilter(HotPathFilter(float(os.getenv('LOG_HOT_RATE', 5))))
+        listener = logging.handlers.QueueListener(
+            log_queue, console_handler, respect_handler_level=True
+        )
+        listener.start()
+        atexit.register(listener.stop)
 
-        # Add handlers to logger
-        logger.addHandler(file_handler)
-        logger.addHandler(console_handler)
+        logger.addHandler(queue_handler)
+        logger.file_handler = None
+        logger.log_format = os.getenv('LOG_FORMAT', 'text')
+        logger.listener = listener
 
     return logger
 
-__all__ = ['setup_logger'] 
\ No newline at end of file
+def enable_file_logging(log_dir=None):
+    """Also write DEBUG and up to <log_dir>/app.log (LOG_DIR, default 'logs'); call from entry points"""
+    logger = setup_logger()
+    if logger.file_handler:
+        return logger.file_handler
+
+    log_dir = log_dir or os.getenv('LOG_DIR', 'logs')
+    os.makedirs(log_dir, exist_ok=True)
+
+    # File handler rotating daily or at LOG_MAX_BYTES, whichever comes first
+    file_handler = SizedTimedRotatingFileHandler(
+        os.path.join(log_dir, 'app.log'),
+        max_bytes=int(os.getenv('LOG_MAX_BYTES', 10 * 1024 * 1024)),
+        when=os.getenv('LOG_ROTATE_WHEN', 'midnight'),
+        backup_count=int(os.getenv('LOG_BACKUPS', 7))
+    )
+    file_handler.setLevel(logging.DEBUG)
+    file_handler.setFormatter(_formatter(logger.log_format))
+
+    # The listener thread reads its handler tuple per record, so this takes effect at once
+    logger.listener.handlers = logger.listener.handlers + (file_handler,)
+    logger.file_handler = file_handler
+    return file_handler
+
+def set_log_format(log_format):
+    """Switch the log file between 'text' and 'json' lines"""
+    logger = setup_logger()
+    logger.log_format = log_format
+    if logger.file_handler:
+        logger.file_handler.setFormatter(_formatter(log_format))
+
+__all__ = ['setup_logger', 'enable_file_logging', 'set_log_format', 'HOT', 'JsonFormatter', 'HotPathFilter']
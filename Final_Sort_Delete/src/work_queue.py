@@ -0,0 +1,195 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from .utils.logger import setup_logger
+
+logger = setup_logger()
+
+class WorkQueue:
+    """Durable SQLite job queue with leases, safe to share between processes
+
+    A worker claims a job by taking a lease on it. It acks the job when done or
+    nacks it to retry. If the worker dies, the lease expires and another worker
+    reclaims the job. Claims run inside BEGIN IMMEDIATE transactions, so two
+    processes can never lease the same job. Async callers run the methods
+    through asyncio.to_thread; a lock keeps one statement or transaction on
+    the connection at a time.
+    """
+
+    def __init__(self, db_path='cache/work_queue.db', max_attempts=5):
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.db_path = db_path
+        self.max_attempts = max_attempts
+        # Autocommit mode; transactions are opened explicitly where atomicity matters
+        self.conn = sqlite3.connect(db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._lock = threading.Lock()
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self._create_tables()
+
+    def _create_tables(self):
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                queue TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'ready',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                available_at REAL NOT NULL,
+                lease_owner TEXT,
+                lease_until REAL,
+                dedupe_key TEXT UNIQUE,
+                created_at REAL NOT NULL
+            )
+        """)
+        self.conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_jobs_claim
+            ON jobs (queue, status, available_at)
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            )
+        """)
+
+    def put(self, queue, payload, dedupe_key=None, delay=0):
+        """Add a job; a job with the same dedupe_key is only ever added once"""
+        with self._lock:
+            now = time.time()
+            cursor = self.conn.execute("""
+                INSERT OR IGNORE INTO jobs (queue, payload, available_at, dedupe_key, created_at)
+                VALUES (?, ?, ?, ?, ?)
+            """, (queue, json.dumps(payload), now + delay, dedupe_key, now))
+            return cursor.rowcount == 1
+
+    def bury(self, queue, payload, dedupe_key=None):
+        """Record work that will not be retried as a dead job, so queue-status shows it"""
+        with self._lock:
+            now = time.time()
+            self.conn.execute("""
+                INSERT OR IGNORE INTO jobs (queue, payload, status, available_at, dedupe_key, created_at)
+                VALUES (?, ?, 'dead', ?, ?, ?)
+            """, (queue, json.dumps(payload), now, dedupe_key, now))
+
+    def claim(self, queue, owner, lease_seconds=300):
+        """Lease the oldest available job, returning (job_id, payload) or None
+
+        Jobs whose lease has expired count as available. A job that has been
+        claimed max_attempts times is marked dead instead of being handed out
+        again.
+        """
+        with self._lock:
+            now = time.time()
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.conn.execute("""
+                    SELECT id, payload, attempts FROM jobs
+                    WHERE queue = ?
+                      AND ((status = 'ready' AND available_at <= ?)
+                           OR (status = 'leased' AND lease_until < ?))
+                    ORDER BY id
+                    LIMIT 1
+                """, (queue, now, now)).fetchone()
+
+                while row and row['attempts'] >= self.max_attempts:
+                    logger.error(f"Job {row['id']} on {queue} failed {row['attempts']} times, marking dead")
+                    self.conn.execute("UPDATE jobs SET status = 'dead', lease_owner = NULL WHERE id = ?", (row['id'],))
+                    row = self.conn.execute("""
+                        SELECT id, payload, attempts FROM jobs
+                        WHERE queue = ?
+                          AND ((status = 'ready' AND available_at <= ?)
+                               OR (status = 'leased' AND lease_until < ?))
+                        ORDER BY id
+                        LIMIT 1
+                    """, (queue, now, now)).fetchone()
+
+                if not row:
+                    self.conn.execute("COMMIT")
+                    return None
+
+                self.conn.execute("""
+                    UPDATE jobs
+                    SET status = 'leased', lease_owner = ?, lease_until = ?, attempts = attempts + 1
+                    WHERE id = ?
+                """, (owner, now + lease_seconds, row['id']))
+                self.conn.execute("COMMIT")
+                return row['id'], json.loads(row['payload'])
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def extend(self, job_id, owner, lease_seconds=300):
+        """Renew a lease; returns False if the job is no longer held by this owner"""
+        with self._lock:
+            cursor = self.conn.execute("""
+                UPDATE jobs SET lease_until = ?
+                WHERE id = ? AND lease_owner = ? AND status = 'leased'
+            """, (time.time() + lease_seconds, job_id, owner))
+            return cursor.rowcount == 1
+
+    def ack(self, job_id, owner):
+        """Mark a leased job done"""
+        with self._lock:
+            cursor = self.conn.execute("""
+                UPDATE jobs SET status = 'done', lease_owner = NULL, lease_until = NULL, payload = '{}'
+                WHERE id = ? AND lease_owner = ?
+            """, (job_id, owner))
+            if cursor.rowcount != 1:
+                logger.warning(f"Ack for job {job_id} ignored: lease no longer held by {owner}")
+            return cursor.rowcount == 1
+
+    def nack(self, job_id, owner, delay=5):
+        """Give a job back to the queue, available again after delay seconds"""
+        with self._lock:
+            cursor = self.conn.execute("""
+                UPDATE jobs SET status = 'ready', lease_owner = NULL, lease_until = NULL, available_at = ?
+                WHERE id = ? AND lease_owner = ?
+            """, (time.time() + delay, job_id, owner))
+            return cursor.rowcount == 1
+
+    def counts(self, queue=None):
+        """Return {status: count}, for one queue or all of them"""
+        with self._lock:
+            query = "SELECT status, COUNT(*) AS total FROM jobs"
+            params = []
+            if queue:
+                query += " WHERE queue = ?"
+                params.append(queue)
+            query += " GROUP BY status"
+            return {row['status']: row['total'] for row in self.conn.execute(query, params)}
+
+    def has_pending(self, queues):
+        """True while any of the queues still has ready or leased jobs"""
+        with self._lock:
+            placeholders = ','.join('?' * len(queues))
+            row = self.conn.execute(f"""
+                SELECT 1 FROM jobs
+                WHERE queue IN ({placeholders}) AND status IN ('ready', 'leased')
+                LIMIT 1
+            """, list(queues)).fetchone()
+            return row is not None
+
+    def reset(self):
+        """Drop every job so a new run can be seeded"""
+        with self._lock:
+            self.conn.execute("DELETE FROM jobs")
+            self.conn.execute("DELETE FROM meta")
+
+    def get_meta(self, key, default=None):
+        with self._lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+            return row['value'] if row else default
+
+    def set_meta(self, key, value):
+        with self._lock:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def close(self):
+        self.conn.close()
+
+__all__ = ['WorkQueue']
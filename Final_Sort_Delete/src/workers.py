@@ -0,0 +1,120 @@
+import os
+import socket
+import asyncio
+from .utils.logger import setup_logger
+
+logger = setup_logger()
+
+LIST_QUEUE = 'list'
+FETCH_QUEUE = 'fetch'
+CLASSIFY_QUEUE = 'classify'
+
+def worker_id(role):
+    """Identify a worker process in lease records"""
+    return f"{socket.gethostname()}:{os.getpid()}:{role}"
+
+def seed_queue(work_queue, run_id):
+    """Start a fresh run: clear old jobs and queue the first inbox page"""
+    work_queue.reset()
+    work_queue.set_meta('run_id', run_id)
+    work_queue.put(LIST_QUEUE, {'page_token': None}, dedupe_key='list:start')
+    logger.info(f"Seeded work queue for run {run_id}")
+
+async def hold_lease(work_queue, job_id, owner, lease_seconds):
+    """Keep renewing a lease while a long job runs"""
+    while True:
+        await asyncio.sleep(lease_seconds / 3)
+        if not await asyncio.to_thread(work_queue.extend, job_id, owner, lease_seconds):
+            logger.warning(f"Lost lease on job {job_id}")
+            return
+
+def requeue_remainder(work_queue, queue, job_id, payload, key, items, count_attempt=True):
+    """Queue the part of a job that was not handled as a new job; False once it was retried too often
+
+    The new job carries a requeue count, so items that keep failing are given
+    up on after max_attempts rounds instead of cycling forever. Pass
+    count_attempt=False when the items were never tried (e.g. out of budget).
+    """
+    requeues = payload.get('requeues', 0) + (1 if count_attempt else 0)
+    if requeues > work_queue.max_attempts:
+        logger.error(f"Giving up on {len(items)} items of job {job_id} after {requeues - 1} requeues")
+        work_queue.bury(queue, {key: items, 'requeues': requeues - 1}, dedupe_key=f"{queue}:{job_id}:remainder")
+        return False
+    work_queue.put(queue, {key: items, 'requeues': requeues},
+                   dedupe_key=f"{queue}:{job_id}:remainder", delay=5)
+    return True
+
+async def run_fetch_worker(fetcher, work_queue, running_flag=None, lease_seconds=120,
+                           page_size=None, idle_exit=30):
+    """List inbox pages and fetch message details into classify jobs
+
+    Listing follows the page-token chain, so only one list job exists at a
+    time. Fetch jobs are independent, so any number of fetch workers can share
+    them.
+    """
+    owner = worker_id('fetch')
+    running_flag = running_flag or (lambda: True)
+    idle_since = None
+    fetched = 0
+    logger.info(f"Fetch worker {owner} started")
+
+    while running_flag():
+        job = await asyncio.to_thread(work_queue.claim, LIST_QUEUE, owner, lease_seconds)
+        if job:
+            idle_since = None
+            job_id, payload = job
+            try:
+                page_token = payload.get('page_token')
+                message_ids, next_token = await fetcher.list_message_ids(page_token, page_size)
+                if message_ids:
+                    await asyncio.to_thread(work_queue.put, FETCH_QUEUE, {'message_ids': message_ids},
+                                            dedupe_key=f"fetch:{page_token or 'start'}")
+                if next_token:
+                    await asyncio.to_thread(work_queue.put, LIST_QUEUE, {'page_token': next_token},
+                                            dedupe_key=f"list:{next_token}")
+                await asyncio.to_thread(work_queue.ack, job_id, owner)
+                logger.info(f"Listed {len(message_ids)} messages (more pages: {bool(next_token)})")
+            except Exception as e:
+                logger.error(f"List job {job_id} failed: {str(e)}")
+                await asyncio.to_thread(work_queue.nack, job_id, owner)
+            continue
+
+        job = await asyncio.to_thread(work_queue.claim, FETCH_QUEUE, owner, lease_seconds)
+        if job:
+            idle_since = None
+            job_id, payload = job
+            lease_task = asyncio.create_task(hold_lease(work_queue, job_id, owner, lease_seconds))
+            try:
+                message_ids = payload['message_ids']
+                records = await fetcher.fetch_message_records(message_ids)
+                if records:
+                    await asyncio.to_thread(work_queue.put, CLASSIFY_QUEUE,
+                                            {'messages': [record.to_dict() for record in records]},
+                                            dedupe_key=f"classify:{job_id}")
+                # IDs whose fetch failed go back as a smaller fetch job instead of being dropped with the ack
+                fetched_ids = {record.message_id for record in records}
+                missing = [message_id for message_id in message_ids if message_id not in fetched_ids]
+                if missing:
+                    await asyncio.to_thread(requeue_remainder, work_queue, FETCH_QUEUE, job_id, payload,
+                                            'message_ids', missing)
+                await asyncio.to_thread(work_queue.ack, job_id, owner)
+                fetched += len(records)
+                fetcher.tuner.tick(fetched)
+                logger.info(f"Fetched {len(records)} messages for classification"
+                            + (f", requeued {len(missing)}" if missing else ""))
+            except Exception as e:
+                logger.error(f"Fetch job {job_id} failed: {str(e)}")
+                await asyncio.to_thread(work_queue.nack, job_id, owner)
+            finally:
+                lease_task.cancel()
+            continue
+
+        if not await asyncio.to_thread(work_queue.has_pending, [LIST_QUEUE, FETCH_QUEUE]):
+            idle_since = idle_since or asyncio.get_running_loop().time()
+            if asyncio.get_running_loop().time() - idle_since >= idle_exit:
+                logger.info("No list or fetch work left, fetch worker exiting")
+                break
+        await asyncio.sleep(1)
+
+__all__ = ['LIST_QUEUE', 'FETCH_QUEUE', 'CLASSIFY_QUEUE', 'worker_id', 'seed_queue',
+           'hold_lease', 'requeue_remainder', 'run_fetch_worker']
@@ -0,0 +1,18 @@
+import os
+import sys
+import pytest
+
+# Import src the same way run.py does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture(autouse=True)
+def log_dir(tmp_path, monkeypatch):
+    """Send any log file a test opens to a temporary directory, never the tree's logs/"""
+    monkeypatch.setenv('LOG_DIR', str(tmp_path / 'logs'))
+    yield tmp_path / 'logs'
+    from src.utils.logger import setup_logger
+    logger = setup_logger()
+    if logger.file_handler:
+        logger.listener.handlers = tuple(h for h in logger.listener.handlers if h is not logger.file_handler)
+        logger.file_handler.close()
+        logger.file_handler = None
@@ -0,0 +1,64 @@
+import types
+import pytest
+from src import autotune
+from src.autotune import Autotuner, PARAMETERS
+
+class RateLimitError(Exception):
+    pass
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = types.SimpleNamespace(now=0.0)
+    monkeypatch.setattr(autotune, 'time', types.SimpleNamespace(time=lambda: clock.now))
+    return clock
+
+def window(tuner, clock, completed):
+    """Close one 30-second window at the given running count of emails"""
+    clock.now += 30
+    tuner.tick(completed)
+
+def test_openai_rate_limit_leaves_gmail_sizes_alone(clock):
+    tuner = Autotuner(path=None)
+    tuner.tick(0)
+    tuner.record_requests(stage='openai')
+    tuner.record_error(RateLimitError('429'), stage='openai')
+    window(tuner, clock, 300)
+    assert tuner.value('fetch_chunk') == PARAMETERS['fetch_chunk'][0]
+    assert tuner.value('sub_batch') < PARAMETERS['sub_batch'][0]
+
+def test_gmail_rate_limit_shrinks_a_gmail_size(clock):
+    tuner = Autotuner(path=None)
+    tuner.tick(0)
+    tuner.record_requests(10)
+    tuner.record_error(RateLimitError('rateLimitExceeded'))
+    window(tuner, clock, 300)
+    assert tuner.value('fetch_chunk') < PARAMETERS['fetch_chunk'][0]
+    assert tuner.value('sub_batch') == PARAMETERS['sub_batch'][0]
+
+def test_quota_wait_counts_against_a_gmail_trial(clock):
+    quota = types.SimpleNamespace(waited=0.0)
+    tuner = Autotuner(path=None, quota=quota)
+    tuner.tick(0)
+    tuner.record_latency(30)
+    window(tuner, clock, 300)  # baseline; starts a fetch_chunk trial
+    trial = tuner.value('fetch_chunk')
+    assert trial > PARAMETERS['fetch_chunk'][0]
+
+    # Same throughput and request time, but the larger batches run the quota into debt
+    tuner.record_latency(30)
+    quota.waited += 15
+    window(tuner, clock, 600)
+    assert tuner.value('fetch_chunk') != trial
+    assert tuner.stats()['quota_wait'] == 15
+
+def test_faster_stage_at_same_throughput_is_kept(clock):
+    tuner = Autotuner(path=None)
+    tuner.tick(0)
+    tuner.record_latency(30)
+    window(tuner, clock, 300)
+    trial = tuner.value('fetch_chunk')
+
+    tuner.record_latency(20)
+    window(tuner, clock, 600)
+    assert tuner.values['fetch_chunk'] >= trial
+    assert tuner.best_costs['gmail'] == pytest.approx(20 / 300)
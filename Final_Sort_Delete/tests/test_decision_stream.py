@@ -0,0 +1,74 @@
+import json
+import pytest
+from src.decision_stream import DecisionStreamParser
+
+DECISIONS = [
+    {'email_id': 'a1', 'decision': 'DELETE', 'reason': 'Promo "50% off" {limited}', 'confidence': 0.9},
+    {'email_id': 'b2', 'decision': 'KEEP', 'reason': 'Escaped \\ backslash and } brace', 'category': 'work'},
+    {'email_id': 'c3', 'decision': 'KEEP', 'reason': 'Nested', 'extra': {'tags': ['x', {'y': 1}]}},
+]
+
+def feed_chunks(text, size):
+    parser = DecisionStreamParser()
+    results = []
+    for start in range(0, len(text), size):
+        results.extend(parser.feed(text[start:start + size]))
+    return parser, results
+
+@pytest.mark.parametrize('text', [
+    json.dumps({'decisions': DECISIONS}),
+    json.dumps({'decisions': DECISIONS}, indent=2),
+    json.dumps(DECISIONS),
+    '\n'.join(json.dumps(decision) for decision in DECISIONS),
+])
+def test_every_chunk_boundary(text):
+    for size in range(1, 12):
+        _, results = feed_chunks(text, size)
+        assert results == DECISIONS
+
+def test_split_at_each_position():
+    text = json.dumps({'decisions': DECISIONS})
+    for split in range(len(text) + 1):
+        parser = DecisionStreamParser()
+        results = parser.feed(text[:split]) + parser.feed(text[split:])
+        assert results == DECISIONS
+
+def test_decision_returned_when_its_brace_arrives():
+    parser = DecisionStreamParser()
+    first = json.dumps(DECISIONS[0])
+    assert parser.feed('{"decisions": [' + first[:-1]) == []
+    assert parser.feed(first[-1]) == [DECISIONS[0]]
+
+def test_truncated_tail_keeps_closed_decisions():
+    text = json.dumps({'decisions': DECISIONS})
+    cut = text.index('"c3"')
+    parser, results = feed_chunks(text[:cut], 7)
+    assert results == DECISIONS[:2]
+    assert parser.decisions_seen == 2
+
+def test_malformed_decision_is_skipped():
+    parser = DecisionStreamParser()
+    results = parser.feed('{"decisions": [{"email_id": "a1", "decision": KEEP}, ' + json.dumps(DECISIONS[1]) + ']}')
+    assert results == [DECISIONS[1]]
+    assert parser.malformed == 1
+
+def test_wrapper_without_decision_key_is_not_a_decision():
+    _, results = feed_chunks(json.dumps({'decisions': []}), 3)
+    assert results == []
+
+NESTED = {'email_id': 'd4', 'decision': 'KEEP', 'reason': 'Thread', 'related': [{'email_id': 'x', 'decision': 'DELETE'}]}
+
+@pytest.mark.parametrize('text', [
+    json.dumps({'decisions': [NESTED, DECISIONS[0]]}),
+    json.dumps([NESTED, DECISIONS[0]]),
+    json.dumps(NESTED) + '\n' + json.dumps(DECISIONS[0]),
+])
+def test_nested_objects_with_decision_key_are_not_decisions(text):
+    for size in range(1, 12):
+        _, results = feed_chunks(text, size)
+        assert results == [NESTED, DECISIONS[0]]
+
+def test_only_the_decisions_array_of_the_wrapper_is_read():
+    text = json.dumps({'examples': [{'email_id': 'x', 'decision': 'DELETE'}], 'decisions': DECISIONS})
+    _, results = feed_chunks(text, 5)
+    assert results == DECISIONS
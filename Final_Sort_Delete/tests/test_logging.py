@@ -0,0 +1,11 @@
+import os
+from src.utils.logger import setup_logger, enable_file_logging
+
+def test_importing_writes_no_log_file(log_dir):
+    setup_logger().info("imported")
+    assert setup_logger().file_handler is None
+    assert not log_dir.exists()
+
+def test_file_logging_goes_to_log_dir(log_dir):
+    handler = enable_file_logging()
+    assert os.path.dirname(handler.baseFilename) == str(log_dir)
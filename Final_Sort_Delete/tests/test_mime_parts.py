@@ -0,0 +1,51 @@
+import base64
+from src.gmail_fetcher import GmailFetcher
+
+def text(mime_type, content, **extra):
+    data = base64.urlsafe_b64encode(content.encode()).decode()
+    return dict({'mimeType': mime_type, 'headers': [], 'body': {'data': data}}, **extra)
+
+def multipart(mime_type, *parts):
+    return {'mimeType': mime_type, 'headers': [], 'body': {}, 'parts': list(parts)}
+
+def select(payload):
+    plain, html, has_attachments = GmailFetcher()._select_parts(payload)
+    return plain and plain['mimeType'], html and html['mimeType'], has_attachments
+
+def test_plain_alternative_is_preferred():
+    payload = multipart('multipart/alternative', text('text/html', '<p>hi</p>'), text('text/plain', 'hi'))
+    assert select(payload) == ('text/plain', 'text/html', False)
+
+def test_html_alternative_inside_related_belongs_to_the_group():
+    payload = multipart(
+        'multipart/alternative',
+        text('text/plain', 'hi'),
+        multipart('multipart/related', text('text/html', '<p>hi</p>'))
+    )
+    assert select(payload) == ('text/plain', 'text/html', False)
+
+def test_later_plain_part_does_not_replace_an_html_body():
+    payload = multipart(
+        'multipart/mixed',
+        text('text/html', '<p>the message</p>'),
+        text('text/plain', 'a forwarded note')
+    )
+    assert select(payload) == (None, 'text/html', False)
+
+def test_parts_after_the_body_group_are_ignored():
+    payload = multipart(
+        'multipart/mixed',
+        multipart('multipart/alternative', text('text/html', '<p>the message</p>')),
+        text('text/plain', 'footer')
+    )
+    assert select(payload) == (None, 'text/html', False)
+
+def test_attachment_decided_by_disposition_or_filename():
+    large_body = {'mimeType': 'text/html', 'headers': [], 'body': {'attachmentId': 'a1', 'size': 900000}}
+    assert select(multipart('multipart/mixed', text('text/plain', 'hi'), large_body))[2] is False
+
+    disposition = text('text/plain', 'notes', headers=[{'name': 'Content-Disposition', 'value': 'attachment'}])
+    assert select(multipart('multipart/mixed', text('text/plain', 'hi'), disposition)) == ('text/plain', None, True)
+
+    named = text('text/plain', 'notes', filename='notes.txt')
+    assert select(multipart('multipart/mixed', named, text('text/html', '<p>hi</p>'))) == (None, 'text/html', True)
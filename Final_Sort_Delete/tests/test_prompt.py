@@ -0,0 +1,15 @@
+import re
+import pytest
+
+pytest.importorskip('dotenv')
+
+from src.openai_processor import BATCH_INSTRUCTIONS
+
+def test_instructions_alone_reach_the_cache_threshold():
+    # Words and punctuation marks are each at least one token, so this undercounts
+    pieces = re.findall(r"\w+|[^\w\s]", BATCH_INSTRUCTIONS)
+    assert len(pieces) >= 1024
+
+def test_retention_principles_are_unchanged():
+    assert "4. Delete promotional/social emails unless they contain:" in BATCH_INSTRUCTIONS
+    assert "5. Be cautious - keep if uncertain" in BATCH_INSTRUCTIONS
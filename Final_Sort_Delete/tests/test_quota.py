@@ -0,0 +1,107 @@
+import asyncio
+import types
+import pytest
+from src import quota
+from src.quota import QuotaScheduler
+
+class FakeClock:
+    """Stands in for time.monotonic and asyncio.sleep inside src.quota
+
+    Sleeping advances the clock at once, or with blocking=True never returns,
+    to hold a request in its quota wait.
+    """
+
+    def __init__(self, blocking=False):
+        self.now = 0.0
+        self.slept = []
+        self.blocking = blocking
+
+    def monotonic(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.slept.append(seconds)
+        if self.blocking:
+            await asyncio.Event().wait()
+        self.now += seconds
+
+def install(monkeypatch, clock):
+    monkeypatch.setattr(quota, 'time', clock)
+    monkeypatch.setattr(quota, 'asyncio', types.SimpleNamespace(
+        sleep=clock.sleep, Lock=asyncio.Lock, Semaphore=asyncio.Semaphore
+    ))
+    return clock
+
+@pytest.fixture
+def clock(monkeypatch):
+    return install(monkeypatch, FakeClock())
+
+def take(scheduler, *costs):
+    async def run():
+        for units in costs:
+            async with scheduler.slot(units):
+                pass
+    asyncio.run(run())
+
+def test_requests_within_capacity_do_not_wait(clock):
+    scheduler = QuotaScheduler(units_per_second=250)
+    take(scheduler, 100, 100, 50)
+    assert clock.slept == []
+    assert scheduler._tokens == 0
+
+def test_waits_for_missing_units(clock):
+    scheduler = QuotaScheduler(units_per_second=250)
+    take(scheduler, 200, 100)
+    assert clock.slept == [pytest.approx(0.2)]
+    assert scheduler.waited == pytest.approx(0.2)
+
+def test_refills_with_time(clock):
+    scheduler = QuotaScheduler(units_per_second=250)
+    take(scheduler, 250)
+    clock.now += 0.5
+    take(scheduler, 125)
+    assert clock.slept == []
+
+def test_cost_above_capacity_is_charged_in_full(clock):
+    scheduler = QuotaScheduler(units_per_second=250)
+    take(scheduler, 500)
+    # Runs on a full bucket, then owes the other 250 units
+    assert clock.slept == []
+    assert scheduler._tokens == pytest.approx(-250)
+
+    take(scheduler, 5)
+    assert clock.slept == [pytest.approx(1.02)]
+
+def test_concurrency_is_capped(clock):
+    scheduler = QuotaScheduler(units_per_second=1000, max_concurrent=2)
+    running = []
+    peak = []
+
+    async def request():
+        async with scheduler.slot(5):
+            running.append(1)
+            peak.append(len(running))
+            await asyncio.sleep(0)
+            running.pop()
+
+    async def run():
+        await asyncio.gather(*(request() for _ in range(6)))
+
+    asyncio.run(run())
+    assert max(peak) == 2
+
+def test_cancelled_wait_gives_back_the_slot(monkeypatch):
+    install(monkeypatch, FakeClock(blocking=True))
+    scheduler = QuotaScheduler(units_per_second=250, max_concurrent=1)
+    scheduler._tokens = -1000
+
+    async def run():
+        waiting = asyncio.ensure_future(scheduler.acquire(5))
+        await asyncio.sleep(0)
+        assert scheduler._slots.locked()
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        return scheduler._slots.locked()
+
+    assert asyncio.run(run()) is False